@@ -14,7 +14,9 @@ setup(name='souspi',
       license='Apache',
       packages=['souspi'],
       scripts=['souspi/bin/SousVideCLI', 'souspi/bin/SousVideControllerApp', 'souspi/bin/SousVideLCDUI', 
-               'souspi/bin/SousVideWebUI', 'souspi/bin/temptrackd'],
+               'souspi/bin/SousVideWebUI', 'souspi/bin/temptrackd', 'souspi/bin/SousVideDatalog',
+               'souspi/bin/SousVideTune', 'souspi/bin/SousVideSupervisor', 
+               'souspi/bin/SousVideBenchmark'],
       include_package_data=True,    ## causes non-python files in the MANIFEST to be included at install time
       install_requires=[
                 'json',
@@ -23,4 +25,5 @@ setup(name='souspi',
                 'RPi.GPIO',
                 'w1thermsensor'
             ],
+      extras_require={'tune': ['numpy']},    ## for OfflineTune / SousVideTune
       zip_safe=False)
\ No newline at end of file
@@ -0,0 +1,122 @@
+#
+# Copyright 2014-2015 Joshua Heling <jrh@netfluvia.org>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+""" Several independent baths, controlled from one process.
+
+    Each bath is a full SousPi controller with its own config file - and so its own
+    PID, GPIO ports, temperature source, command directory, status and datalog.  They
+    all share one ControlEngine thread, with their ticks (and control windows) spread
+    evenly across the period so heater switching and file I/O for different baths
+    don't coincide.
+"""
+
+import os
+import time
+import logging
+import collections
+
+from souspi import SousPi
+from souspi import ControlEngine
+from souspi import SousPiHardware
+
+class BathSupervisor(object):
+    """ Hosts one SousPi controller per config file in cfgfiles.
+
+        Baths are named after their config files (bath1.cfg -> "bath1").  gpio and clock
+        are shared by all of them; temp_sources, if given, maps bath names to temperature
+        sources (see SousPi).  Each bath's files in log_dir and state_dir go in a
+        subdirectory named after it.  Raises ValueError if two baths would use the same
+        GPIO pin, command directory or file.
+    """
+
+    def __init__(self, cfgfiles, gpio=None, clock=time.time, temp_sources=None):
+        if gpio is None:
+            gpio = SousPiHardware.raspi_gpio()
+        self._gpio = gpio
+        self.engine = ControlEngine.ControlEngine(clock=clock, name="SousPiSupervisor")
+        self.baths = collections.OrderedDict()
+
+        names = [os.path.splitext(os.path.basename(f))[0] for f in cfgfiles]
+        if len(set(names)) != len(names):
+            raise ValueError("Bath config files must have distinct names: %s" % ", ".join(cfgfiles))
+        try:
+            for (i, (name, cfgfile)) in enumerate(zip(names, cfgfiles)):
+                src = temp_sources.get(name) if temp_sources else None
+                sp = SousPi.SousPi(cfgfile, gpio=gpio, clock=clock, temp_source=src,
+                                   engine=self.engine, name=name, phase=float(i) / len(cfgfiles))
+                self.baths[name] = sp
+                self._check_conflicts(sp)
+        except:
+            self.cleanup()
+            raise
+
+    def _check_conflicts(self, new):
+        ports = (new._output_control_port, new._water_sensor_port, new._pump_control_port)
+        for sp in self.baths.values():
+            if sp is new:
+                continue
+            shared = set(ports) & set((sp._output_control_port, sp._water_sensor_port,
+                                       sp._pump_control_port))
+            if shared:
+                raise ValueError("Baths %s and %s both use GPIO %s" %
+                                 (sp.name, new.name, ", ".join(str(p) for p in sorted(shared))))
+            if os.path.realpath(sp.status_file) == os.path.realpath(new.status_file):
+                raise ValueError("Baths %s and %s share a command directory" % (sp.name, new.name))
+            shared = self._files(sp) & self._files(new)
+            if shared:
+                raise ValueError("Baths %s and %s both use %s" %
+                                 (sp.name, new.name, ", ".join(sorted(shared))))
+
+    @staticmethod
+    def _files(sp):
+        """ The (real) paths of the files a bath writes, besides those in command_dir. """
+        files = [sp._history_file, sp._timing_file]
+        if sp.setpoint_file is not None:
+            files.append(sp.setpoint_file)
+        if sp._datalog is not None:
+            files.append(sp._datalog.path)
+        if sp._state is not None:
+            files.extend(sp._state.durable_path(p) for p in sp._state._tracked)
+        return set(os.path.realpath(f) for f in files)
+
+    def __getitem__(self, name):
+        return self.baths[name]
+
+    def start(self):
+        """ Start the shared control loop (baths still need start()ing to heat). """
+        logging.info("Supervising %d baths: %s" % (len(self.baths), ", ".join(self.baths)))
+        self.engine.start()
+
+    def status(self):
+        """ Status of every bath, as {name: status dict}. """
+        return dict((name, sp.status.as_dict()) for (name, sp) in self.baths.items())
+
+    def engine_stats(self):
+        """ Tick timing stats for every bath, as {name: stats dict}. """
+        return dict((name, sp.engine_stats) for (name, sp) in self.baths.items())
+
+    def reload_config(self, signum=None, frame=None):
+        """ Have every bath re-read its config file (see SousPi.reload_config()). """
+        for sp in self.baths.values():
+            sp.reload_config()
+
+    def cleanup(self):
+        for sp in self.baths.values():
+            try:
+                sp.cleanup()
+            except Exception, e:
+                logging.error("Error cleaning up bath %s: %s" % (sp.name, e))
+        self.engine.stop()
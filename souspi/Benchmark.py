@@ -0,0 +1,311 @@
+#
+# Copyright 2014-2015 Joshua Heling <jrh@netfluvia.org>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+""" Control quality and cost benchmarks, for catching regressions before a deploy.
+
+    Each scenario runs the real controller (window/duty-cycle logic and PID) in a
+    Simulation - virtual clock, simulated GPIO - against either the bath model or a
+    recorded temperature trace, so results are repeatable run to run.  Quality is
+    measured from when the scenario's disturbance happens:
+
+        overshoot       how far (degC) the bath went past the setpoint, once it got there
+        settling_time   seconds until it was within band of the setpoint for good
+                        (None if it never settled)
+        iae             integral of |setpoint - temperature| (degC * s)
+        heater_toggles  heater switches over the whole run
+
+    and cost as CPU time per tick (process time over the run, bath model included)
+    along with the controller's own tick timings (see Instrumentation).
+
+    Results can be saved as JSON and compared against later; see compare().  Passing
+    heatup_config() as the config compares model-based heat-up (see HeatUp) with the
+    PID alone.
+"""
+
+import os
+import csv
+import json
+import math
+import time
+import bisect
+import collections
+
+from souspi import Simulation
+from souspi import SousPiHardware
+from souspi import DataLog
+from souspi import *
+
+BenchmarkResult = collections.namedtuple("BenchmarkResult",
+                        "scenario overshoot settling_time iae heater_toggles ticks "
+                        "cpu_per_tick tick_mean tick_max")
+
+# lower is better for all of these; a result is only a regression if it's worse by
+#  more than the relative tolerance *and* by more than this much
+QUALITY_SLACK = {"overshoot": 0.1, "settling_time": 60.0, "iae": 60.0, "heater_toggles": 10}
+COST_METRICS = ("cpu_per_tick", "tick_mean")
+
+
+class Scenario(object):
+    """ A benchmark run: starting conditions, a duration, and disturbances.
+
+        events is a list of (seconds into the run, function(sim)) applied as the run
+        reaches them.  Quality is scored from measure_from seconds in.  bath_args go to
+        the SimulatedBath; bath replaces it (as for Simulation).
+    """
+
+    def __init__(self, name, setpoint, duration, events=(), measure_from=0.0, band=0.5,
+                 description="", bath=None, **bath_args):
+        self.name = name
+        self.setpoint = setpoint
+        self.duration = duration
+        self.events = sorted(events)
+        self.measure_from = measure_from
+        self.band = band
+        self.description = description
+        self.bath = bath
+        self.bath_args = bath_args
+
+
+def _set_setpoint(value):
+    def event(sim):
+        sim.sp.setpoint = value
+    return event
+
+def _add_heat(delta):
+    def event(sim):
+        sim.bath.add_heat(delta)
+    return event
+
+def _lid(factor):
+    """ Scale the bath's heat loss by factor (the model's heating rate is gain / tau, so
+        both change together).  _lid(4) takes the lid off; _lid(0.25) puts it back.
+    """
+    def event(sim):
+        sim.bath.advance()
+        sim.bath.time_constant /= factor
+        sim.bath.gain /= factor
+    return event
+
+SCENARIOS = collections.OrderedDict((s.name, s) for s in (
+    Scenario("cold_start", 56.5, 4 * 3600, initial=20.0,
+             description="heat a fresh bath from room temperature"),
+    Scenario("setpoint_step", 55.0, 4 * 3600, initial=55.0, measure_from=2 * 3600,
+             events=[(2 * 3600, _set_setpoint(60.0))],
+             description="settled at 55, then the setpoint goes to 60"),
+    Scenario("lid_open", 56.5, 4 * 3600, initial=56.5, measure_from=2 * 3600,
+             events=[(2 * 3600, _lid(4.0)), (2 * 3600 + 600, _lid(0.25))],
+             description="settled, then the lid is off for 10 minutes"),
+    Scenario("food_in", 56.5, 4 * 3600, initial=56.5, measure_from=2 * 3600,
+             events=[(2 * 3600, _add_heat(-4.0))],
+             description="settled, then cold food drops the bath 4 degrees"),
+))
+
+
+class TraceReplay(object):
+    """ Plays back recorded temperatures in place of a bath model.
+
+        The trace's first record lines up with the clock's time at construction.  The
+        heater has no effect on what's read, so this exercises the controller's cost and
+        switching on real sensor data, not its closed-loop behaviour.
+    """
+
+    def __init__(self, times, temps, heater, clock):
+        self._clock = clock
+        self._start = clock()
+        self._times = [t - times[0] for t in times]
+        self._temps = list(temps)
+        self.temperature = self._temps[0]
+
+    def advance(self, now=None):
+        if now is None:
+            now = self._clock()
+        i = bisect.bisect_right(self._times, now - self._start) - 1
+        self.temperature = self._temps[max(i, 0)]
+
+    def get_temperature(self, unit=None):
+        self.advance()
+        return self.temperature
+
+
+def load_trace(path):
+    """ Returns (times, setpoints, temps) from a datalog or a CSV with time, setpoint and
+        pv columns.  Records without a time or temperature are skipped; a missing
+        setpoint is None.
+    """
+    rows = []
+    try:
+        for rec in DataLog.DataLogReader(path).records():
+            rows.append((rec[0], rec[1], rec[2]))
+    except DataLogError:
+        with open(path) as f:
+            for row in csv.DictReader(f):
+                try:
+                    rows.append((float(row["time"]), float(row.get("setpoint") or "nan"),
+                                 float(row["pv"])))
+                except (KeyError, TypeError, ValueError):
+                    continue
+    rows = sorted(r for r in rows if not (math.isnan(r[0]) or math.isnan(r[2])))
+    if len(rows) < 2:
+        raise DataLogError("%s has no usable temperature records" % path)
+    return ([r[0] for r in rows], [None if math.isnan(r[1]) else r[1] for r in rows],
+            [r[2] for r in rows])
+
+def trace_scenario(path, band=0.5):
+    """ A Scenario replaying the trace at path, following its setpoint changes. """
+    (times, setpoints, temps) = load_trace(path)
+    known = [sp for sp in setpoints if sp is not None]
+    if not known:
+        raise DataLogError("%s has no setpoint to control to" % path)
+    events = []
+    last = known[0]
+    for (t, sp) in zip(times, setpoints):
+        if sp is not None and sp != last:
+            events.append((t - times[0], _set_setpoint(sp)))
+            last = sp
+    return Scenario(os.path.basename(path), known[0], times[-1] - times[0], events=events,
+                    band=band, description="replay of %s" % path,
+                    bath=lambda heater, clock: TraceReplay(times, temps, heater, clock))
+
+
+def score(samples, start, band):
+    """ Quality metrics (overshoot, settling_time, iae, heater_toggles) for Simulation
+        samples, measured from time start.
+    """
+    toggles = sum(1 for (a, b) in zip(samples, samples[1:]) if a[2] != b[2])
+    measured = [s for s in samples if s[0] >= start and s[3] is not None]
+    if not measured:
+        return (0.0, None, 0.0, toggles)
+
+    iae = 0.0
+    prev_t = start
+    for (t, temp, heater, sp) in measured:
+        iae += abs(sp - temp) * (t - prev_t)
+        prev_t = t
+
+    # overshoot is measured past the setpoint, in the direction we were heading
+    direction = 1 if measured[0][1] <= measured[0][3] else -1
+    overshoot = 0.0
+    arrived = False
+    for (t, temp, heater, sp) in measured:
+        if not arrived and (temp - sp) * direction >= -band:
+            arrived = True
+        if arrived:
+            overshoot = max(overshoot, (temp - sp) * direction)
+
+    settling_time = 0.0
+    for (t, temp, heater, sp) in measured:
+        if abs(temp - sp) > band:
+            settling_time = None
+        elif settling_time is None:
+            settling_time = t - start
+    return (overshoot, settling_time, iae, toggles)
+
+def heatup_config(mode, scenario, model_error=1.0):
+    """ Config (for run()) turning on heat-up mode with the scenario's own bath model,
+        with heat_rate off by a factor of model_error.  Trace replays have no model, and
+        get None.
+    """
+    if scenario.bath is not None:
+        return None
+    bath = SousPiHardware.SimulatedBath(lambda: 0, lambda: 0.0, **scenario.bath_args)
+    return {("HeatUp", "heatup_mode"): mode,
+            ("HeatUp", "heat_rate"): bath.gain / bath.time_constant * model_error,
+            ("HeatUp", "heat_loss"): 1.0 / bath.time_constant,
+            ("HeatUp", "ambient_temp"): bath.ambient,
+            ("HeatUp", "dead_time"): bath.dead_time}
+
+def run(scenario, alarm_interval=1.0, window_size=10, config=None):
+    """ Run one Scenario, returning a BenchmarkResult.  config is as for Simulation, or
+        a function of the scenario returning that.
+    """
+    if callable(config):
+        config = config(scenario)
+    sim = Simulation.Simulation(alarm_interval=alarm_interval, window_size=window_size,
+                                config=config, bath=scenario.bath, **scenario.bath_args)
+    try:
+        sim.sp.setpoint = scenario.setpoint
+        sim.sp.start()
+        start = sim.now
+        cpu = time.clock()
+        for (offset, event) in scenario.events:
+            sim.run(start + offset - sim.now)
+            event(sim)
+        sim.run(start + scenario.duration - sim.now)
+        cpu = time.clock() - cpu
+
+        (overshoot, settling_time, iae, toggles) = score(sim.samples,
+                                                         start + scenario.measure_from,
+                                                         scenario.band)
+        ticks = len(sim.samples)
+        tick = sim.sp.instruments.stages.get("tick")
+        return BenchmarkResult(scenario.name, overshoot, settling_time, iae, toggles, ticks,
+                               cpu / ticks if ticks else 0.0,
+                               tick.mean if tick else 0.0, tick.max if tick else 0.0)
+    finally:
+        sim.cleanup()
+
+def run_all(scenarios=None, **args):
+    """ Run every scenario (default: SCENARIOS) and return their results, in order. """
+    if scenarios is None:
+        scenarios = SCENARIOS.values()
+    return [run(s, **args) for s in scenarios]
+
+def save_results(path, results):
+    with open(path, "w") as f:
+        json.dump([r._asdict() for r in results], f, indent=1)
+
+def load_results(path):
+    with open(path) as f:
+        return [BenchmarkResult(**r) for r in json.load(f)]
+
+def compare(results, baseline, tolerance=0.05, cost_tolerance=0.5):
+    """ Returns a list of messages describing regressions in results relative to baseline
+        (both lists of BenchmarkResults; scenarios missing from either are skipped).
+
+        A quality metric regresses if it's more than tolerance (relative) and more than
+        QUALITY_SLACK worse, or if the bath no longer settles.  Cost metrics are noisier,
+        and regress if more than cost_tolerance worse.
+    """
+    old = dict((r.scenario, r) for r in baseline)
+    problems = []
+    for r in results:
+        if r.scenario not in old:
+            continue
+        b = old[r.scenario]
+        for (metric, slack) in sorted(QUALITY_SLACK.items()):
+            (new, was) = (getattr(r, metric), getattr(b, metric))
+            if was is None:
+                continue
+            if new is None:
+                problems.append("%s: %s: no longer settles (was %s)" % (r.scenario, metric, was))
+            elif new > was * (1 + tolerance) and new - was > slack:
+                problems.append("%s: %s: %.4g, was %.4g" % (r.scenario, metric, new, was))
+        for metric in COST_METRICS:
+            (new, was) = (getattr(r, metric), getattr(b, metric))
+            if was and new > was * (1 + cost_tolerance):
+                problems.append("%s: %s: %.3fms, was %.3fms" %
+                                (r.scenario, metric, new * 1000, was * 1000))
+    return problems
+
+def format_results(results):
+    lines = ["%-16s %9s %9s %10s %7s %8s %9s %9s" % ("scenario", "overshoot", "settle_s", "iae",
+                                                     "toggles", "ticks", "cpu_ms", "tick_ms")]
+    for r in results:
+        lines.append("%-16s %9.3f %9s %10.1f %7d %8d %9.4f %9.4f" %
+                     (r.scenario, r.overshoot,
+                      "never" if r.settling_time is None else "%.0f" % r.settling_time,
+                      r.iae, r.heater_toggles, r.ticks, r.cpu_per_tick * 1000, r.tick_mean * 1000))
+    return "\n".join(lines)
@@ -0,0 +1,195 @@
+#
+# Copyright 2014-2015 Joshua Heling <jrh@netfluvia.org>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+""" Watch command/setpoint files and wake the controller as soon as they change.
+
+    UIs talk to the controller by atomically renaming files into place (see
+    atomic_file_write()).  On Linux we can use inotify to find out about that the
+    moment it happens, rather than stat()ing every file on a timer.  Where inotify
+    isn't available, create_watcher() returns None and the controller keeps
+    polling on command_check_interval as it always has.
+"""
+
+import os
+import sys
+import errno
+import select
+import struct
+import logging
+import threading
+import ctypes
+import ctypes.util
+
+# from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o0004000
+
+_event_header = struct.Struct("iIII")    # wd, mask, cookie, len
+
+def _load_libc():
+    """ Returns a libc handle with the inotify calls, or None if they aren't there. """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+_libc = _load_libc()
+
+def inotify_available():
+    return _libc is not None
+
+
+class InotifyWatcher(object):
+    """ Calls callback(changed_paths) whenever one of the watched files is written or
+        renamed into place.
+
+        The callback runs on the watcher's own (daemon) thread.  changed_paths is a
+        set of the full paths (as given to the constructor) that changed.  If the kernel
+        event queue overflows, every watched path is reported.
+    """
+
+    def __init__(self, paths, callback):
+        self._callback = callback
+        self._thread = None
+        self._running = False
+
+        # dir -> { basename: path as given }
+        self._targets = {}
+        for p in paths:
+            d = os.path.dirname(os.path.realpath(p))
+            self._targets.setdefault(d, {})[os.path.basename(p)] = p
+
+        self._fd = _libc.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+        if self._fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, "inotify_init1: %s" % os.strerror(e))
+
+        self._wd_to_dir = {}
+        for d in self._targets:
+            wd = _libc.inotify_add_watch(self._fd, d, IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+            if wd < 0:
+                e = ctypes.get_errno()
+                os.close(self._fd)
+                raise OSError(e, "inotify_add_watch(%s): %s" % (d, os.strerror(e)))
+            self._wd_to_dir[wd] = d
+
+        # used to wake the thread up from select() when we're stopping
+        (self._wake_r, self._wake_w) = os.pipe()
+
+    @property
+    def paths(self):
+        return [p for names in self._targets.values() for p in names.values()]
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="CommandWatcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        os.write(self._wake_w, b"x")
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(1.0)
+        for fd in (self._fd, self._wake_r, self._wake_w):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def _read_events(self):
+        """ Drain the inotify fd, returning the set of watched paths that changed. """
+        changed = set()
+        while True:
+            try:
+                buf = os.read(self._fd, 4096)
+            except OSError, e:
+                if e.errno in (errno.EAGAIN, errno.EINTR):
+                    break
+                raise
+            if not buf:
+                break
+            offset = 0
+            while offset + _event_header.size <= len(buf):
+                (wd, mask, cookie, namelen) = _event_header.unpack_from(buf, offset)
+                offset += _event_header.size
+                name = buf[offset:offset + namelen].rstrip(b"\0")
+                offset += namelen
+                if mask & IN_Q_OVERFLOW:
+                    logging.warning("inotify queue overflowed; treating all command files as changed")
+                    changed.update(self.paths)
+                    continue
+                if mask & IN_IGNORED:
+                    continue
+                d = self._wd_to_dir.get(wd)
+                if d is not None and name in self._targets[d]:
+                    changed.add(self._targets[d][name])
+        return changed
+
+    def _run(self):
+        while self._running:
+            try:
+                (ready, _, _) = select.select([self._fd, self._wake_r], [], [])
+            except select.error, e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            if not self._running:
+                break
+            changed = self._read_events()
+            if changed:
+                try:
+                    self._callback(changed)
+                except Exception:
+                    # keep watching even if one command couldn't be processed
+                    logging.exception("Error handling change to %s" % ", ".join(sorted(changed)))
+
+
+def create_watcher(paths, callback, method="auto"):
+    """ Returns a started watcher for paths, or None if we should fall back to polling.
+
+        method is one of "auto", "inotify", or "poll".  "inotify" raises OSError if the
+        watch can't be set up; "auto" quietly falls back.
+    """
+    if method not in ("auto", "inotify", "poll"):
+        raise ValueError("Unknown command_watch method: %s" % method)
+    if method == "poll":
+        return None
+    if not inotify_available():
+        if method == "inotify":
+            raise OSError(errno.ENOSYS, "inotify is not available on this system")
+        return None
+    try:
+        w = InotifyWatcher(paths, callback)
+    except OSError, e:
+        if method == "inotify":
+            raise
+        logging.warning("Couldn't set up inotify (%s); polling for commands instead." % e)
+        return None
+    w.start()
+    return w
@@ -0,0 +1,192 @@
+#
+# Copyright 2014-2015 Joshua Heling <jrh@netfluvia.org>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+""" Deadline-based scheduler for running the control loop on its own thread.
+
+    Each task runs every <interval> seconds, on a fixed grid of deadlines (start time
+    + offset + n * interval) rather than "interval seconds after the last run finished",
+    so timing errors don't accumulate.  For every run we record how late it started
+    (jitter) and how long it took.  If a run finishes after its next deadline has
+    already passed, that's an overrun: the missed deadlines are skipped rather than
+    run back-to-back to catch up.
+"""
+
+import time
+import logging
+import threading
+
+class TaskStats(object):
+    """ Timing statistics for one scheduled task.  All times are in seconds. """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.runs = 0
+        self.overruns = 0
+        self.missed = 0
+        self.last_jitter = 0.0
+        self.max_jitter = 0.0
+        self.total_jitter = 0.0
+        self.last_runtime = 0.0
+        self.max_runtime = 0.0
+
+    @property
+    def mean_jitter(self):
+        if self.runs == 0:
+            return 0.0
+        return self.total_jitter / self.runs
+
+    def as_dict(self):
+        return {"runs": self.runs, "overruns": self.overruns, "missed": self.missed,
+                "last_jitter": self.last_jitter, "max_jitter": self.max_jitter,
+                "mean_jitter": self.mean_jitter, "last_runtime": self.last_runtime,
+                "max_runtime": self.max_runtime}
+
+
+class ScheduledTask(object):
+
+    def __init__(self, name, fn, interval, offset):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.offset = offset
+        self.next_deadline = None
+        self.stats = TaskStats()
+
+
+class ControlEngine(object):
+    """ Runs registered tasks on a dedicated thread, each on its own deadline grid.
+
+        Tasks are run one at a time, in deadline order.  Exceptions raised by a task are
+        logged and otherwise ignored, so one bad tick doesn't stop control.
+    """
+
+    def __init__(self, clock=time.time, name="ControlEngine"):
+        self._clock = clock
+        self.name = name
+        self._tasks = {}
+        self._cond = threading.Condition(threading.Lock())
+        self._thread = None
+        self._running = False
+
+    @property
+    def running(self):
+        return self._running
+
+    def add_task(self, name, fn, interval, offset=0.0):
+        """ Schedule fn() to run every interval seconds, offset seconds into each period. """
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        with self._cond:
+            t = ScheduledTask(name, fn, interval, offset)
+            if self._running:
+                t.next_deadline = self._clock() + offset
+            self._tasks[name] = t
+            self._cond.notify()
+        return t
+
+    def remove_task(self, name):
+        with self._cond:
+            self._tasks.pop(name, None)
+            self._cond.notify()
+
+    def set_interval(self, name, interval):
+        """ Change a task's interval.  The new grid starts from the next run. """
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        with self._cond:
+            t = self._tasks[name]
+            t.interval = interval
+            if t.next_deadline is not None:
+                t.next_deadline = min(t.next_deadline, self._clock() + interval)
+            self._cond.notify()
+
+    def task_stats(self, name):
+        return self._tasks[name].stats
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            now = self._clock()
+            for t in self._tasks.values():
+                t.next_deadline = now + t.offset
+        self._thread = threading.Thread(target=self._run, name=self.name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            if not self._running:
+                return
+            self._running = False
+            self._cond.notify()
+        if self._thread is not threading.current_thread():
+            self._thread.join(5.0)
+        self._thread = None
+
+    def _next_task(self):
+        """ Wait for the next due task and return it, or None if we've been stopped.
+
+            Must be called with self._cond held.
+        """
+        while self._running:
+            if not self._tasks:
+                self._cond.wait()
+                continue
+            t = min(self._tasks.values(), key=lambda x: x.next_deadline)
+            delay = t.next_deadline - self._clock()
+            if delay <= 0:
+                return t
+            # woken early by add/remove/set_interval/stop, in which case we re-evaluate
+            self._cond.wait(delay)
+        return None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                t = self._next_task()
+                if t is None:
+                    return
+                deadline = t.next_deadline
+
+            started = self._clock()
+            try:
+                t.fn()
+            except Exception:
+                logging.exception("Scheduled task %s failed" % t.name)
+            finished = self._clock()
+
+            with self._cond:
+                s = t.stats
+                s.runs += 1
+                s.last_jitter = started - deadline
+                s.total_jitter += s.last_jitter
+                s.max_jitter = max(s.max_jitter, s.last_jitter)
+                s.last_runtime = finished - started
+                s.max_runtime = max(s.max_runtime, s.last_runtime)
+
+                t.next_deadline = deadline + t.interval
+                if finished > t.next_deadline:
+                    # overran into the next period: skip the deadlines we've already missed
+                    missed = int((finished - t.next_deadline) / t.interval) + 1
+                    s.overruns += 1
+                    s.missed += missed
+                    t.next_deadline += missed * t.interval
+                    logging.debug("%s overran (took %.4fs, jitter %.4fs), skipped %d tick(s)" % (
+                                   t.name, s.last_runtime, s.last_jitter, missed))
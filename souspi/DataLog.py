@@ -0,0 +1,189 @@
+#
+# Copyright 2014-2015 Joshua Heling <jrh@netfluvia.org>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+""" Fixed-size binary datalog for the controller.
+
+    The log is a single preallocated file: a header followed by <capacity> fixed-width
+    records, used as a ring.  Once it's full, the oldest records are overwritten, so a
+    long cook can't fill the disk.  The file is memory-mapped, so appending a record is
+    one struct pack into the map.
+
+    Each record holds, for one control window:
+
+        time, setpoint, pv (temperature), error, on_time, Cp, Ci, Cd, heater
+
+    In manual mode (e.g. while auto-tuning), setpoint, error, Cp, Ci and Cd are NaN.
+"""
+
+import os
+import csv
+import mmap
+import struct
+
+from souspi import *
+
+MAGIC = b"SPDL"
+FORMAT_VERSION = 1
+
+FIELDS = ("time", "setpoint", "pv", "error", "on_time", "Cp", "Ci", "Cd", "heater")
+
+_header = struct.Struct("<4sIIIQQ")    # magic, version, record size, capacity, next slot, count
+HEADER_SIZE = 64
+_record = struct.Struct("<d7fB3x")
+RECORD_SIZE = _record.size
+
+# numpy equivalent of _record, for readers
+NUMPY_DTYPE = [("time", "<f8"), ("setpoint", "<f4"), ("pv", "<f4"), ("error", "<f4"),
+               ("on_time", "<f4"), ("Cp", "<f4"), ("Ci", "<f4"), ("Cd", "<f4"),
+               ("heater", "u1"), ("_pad", "V3")]
+
+NAN = float("nan")
+
+def _file_size(capacity):
+    return HEADER_SIZE + capacity * RECORD_SIZE
+
+
+class RingDataLog(object):
+    """ Appends records to a ring datalog file, creating (or re-creating) it as needed.
+
+        If path already holds a datalog with the same capacity, we keep appending to it;
+        otherwise it is reinitialized.
+    """
+
+    def __init__(self, path, capacity=100000):
+        if capacity <= 0:
+            raise ValueError("datalog capacity must be positive")
+        self.path = path
+        self.capacity = capacity
+        try:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0644)
+        except OSError, e:
+            raise DataLogError("Couldn't open datalog %s: %s" % (path, e.strerror))
+        try:
+            size = _file_size(capacity)
+            fresh = os.fstat(fd).st_size != size
+            if fresh:
+                os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)
+
+        (magic, version, recsize, cap, self._next, self._count) = _header.unpack_from(self._map, 0)
+        if fresh or magic != MAGIC or version != FORMAT_VERSION or recsize != RECORD_SIZE \
+                 or cap != capacity:
+            self._next = 0
+            self._count = 0
+            self._write_header()
+
+    def _write_header(self):
+        _header.pack_into(self._map, 0, MAGIC, FORMAT_VERSION, RECORD_SIZE, self.capacity,
+                          self._next, self._count)
+
+    def __len__(self):
+        return self._count
+
+    def append(self, time, setpoint, pv, error, on_time, Cp, Ci, Cd, heater):
+        _record.pack_into(self._map, HEADER_SIZE + self._next * RECORD_SIZE,
+                          time, setpoint, pv, error, on_time, Cp, Ci, Cd, 1 if heater else 0)
+        self._next = (self._next + 1) % self.capacity
+        if self._count < self.capacity:
+            self._count += 1
+        self._write_header()
+
+    def flush(self):
+        self._map.flush()
+
+    def close(self):
+        self._map.flush()
+        self._map.close()
+
+
+class DataLogReader(object):
+    """ Reads a ring datalog written by RingDataLog, oldest record first.
+
+        The reader takes a snapshot of the file when opened (or when refresh() is called),
+        so it's safe to read a log the controller is still writing.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.refresh()
+
+    def refresh(self):
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except IOError, e:
+            raise DataLogError("Couldn't read datalog %s: %s" % (self.path, e.strerror))
+        if len(data) < HEADER_SIZE:
+            raise DataLogError("%s is too short to be a datalog" % self.path)
+        (magic, version, recsize, cap, nxt, count) = _header.unpack_from(data, 0)
+        if magic != MAGIC or version != FORMAT_VERSION or recsize != RECORD_SIZE:
+            raise DataLogError("%s is not a datalog (or is an unknown version)" % self.path)
+        if len(data) < _file_size(cap):
+            raise DataLogError("datalog %s is truncated" % self.path)
+        self.capacity = cap
+        self._data = data
+        self._count = count
+        # the oldest record is at slot 0 until we've wrapped, and at 'next' after that
+        self._first = nxt if count == cap else 0
+
+    def __len__(self):
+        return self._count
+
+    def _slots(self):
+        """ Returns [(start, end)] slot ranges covering the records in order. """
+        if self._first == 0:
+            return [(0, self._count)]
+        return [(self._first, self.capacity), (0, self._first)]
+
+    def records(self):
+        """ Yields each record as a tuple in FIELDS order. """
+        for (start, end) in self._slots():
+            for i in xrange(start, end):
+                yield _record.unpack_from(self._data, HEADER_SIZE + i * RECORD_SIZE)
+
+    def arrays(self, chunk_size=None):
+        """ Yields the records as NumPy structured arrays (fields as in FIELDS).
+
+            With chunk_size, yields arrays of at most that many records; otherwise one
+            array per contiguous stretch of the ring (at most two).  Needs numpy.
+        """
+        import numpy
+        dtype = numpy.dtype(NUMPY_DTYPE)
+        for (start, end) in self._slots():
+            if end <= start:
+                continue
+            step = chunk_size or (end - start)
+            for s in xrange(start, end, step):
+                e = min(s + step, end)
+                yield numpy.frombuffer(self._data, dtype=dtype, count=e - s,
+                                       offset=HEADER_SIZE + s * RECORD_SIZE)[list(FIELDS)]
+
+    def to_array(self):
+        """ All records, oldest first, as a single NumPy structured array. """
+        import numpy
+        parts = list(self.arrays())
+        if not parts:
+            return numpy.zeros(0, dtype=numpy.dtype(NUMPY_DTYPE))[list(FIELDS)]
+        return numpy.concatenate(parts)
+
+    def export_csv(self, out):
+        """ Write the records, with a header line, as CSV to the file object out. """
+        w = csv.writer(out)
+        w.writerow(FIELDS)
+        for r in self.records():
+            w.writerow(["%.3f" % r[0]] + ["%g" % v for v in r[1:8]] + [r[8]])
@@ -0,0 +1,197 @@
+#
+# Copyright 2014-2015 Joshua Heling <jrh@netfluvia.org>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+""" Bath temperature estimation between (and despite) sensor readings.
+
+    The probe's readings are noisy, quantized (1/16 degree for a DS18B20), can be
+    seconds old by the time the controller sees them, and lag the bath itself since
+    the probe takes a while to warm up.  A TempEstimator is a small Kalman filter that
+    keeps an estimate of the bath temperature and how fast it's changing, predicting
+    forward every control tick from the heater duty and correcting whenever a new
+    reading arrives.
+
+    The state is (bath temperature T, unexplained drift d, probe temperature Ts):
+
+        dT/dt  = heat_rate * u(t - dead_time) - loss * (T - ambient) + d
+        dTs/dt = (T - Ts) / sensor_lag
+
+    with the heater duty u and the bath model (see HeatUp.BathModel) known and d a
+    random walk.  Without a model, it's just a constant-rate model (the "drift" is the
+    rate); with sensor_lag 0, the probe reads the bath directly.
+"""
+
+import math
+import collections
+
+from souspi import *
+
+
+def _matmul(a, b):
+    return [[sum(a[i][k] * b[k][j] for k in range(len(b))) for j in range(len(b[0]))]
+            for i in range(len(a))]
+
+def _transpose(a):
+    return [list(row) for row in zip(*a)]
+
+
+class TempEstimator(object):
+    """ Filtered bath temperature, rate of change and variance; see the module docstring.
+
+        Call step() every tick with the current time and heater duty (0..1) and, if
+        there's been a new reading since the last call, the reading.  Noise figures are
+        standard deviations: sensor_noise in degC, process_noise in degC per root second
+        (how far the bath wanders from the model) and drift_noise in degC/s per root
+        second (how quickly the unexplained drift can change).
+    """
+
+    initial_drift_sd = 0.01     # degC/s, before we've seen anything
+
+    def __init__(self, model=None, sensor_lag=0.0, sensor_noise=0.1, process_noise=0.01,
+                 drift_noise=0.0001):
+        self.model = model
+        self.sensor_lag = sensor_lag
+        self.sensor_noise = sensor_noise
+        self.process_noise = process_noise
+        self.drift_noise = drift_noise
+        self.reset()
+
+    def reset(self):
+        """ Forget everything; the next reading starts the estimate over. """
+        self.x = None               # [T, d, Ts]
+        self.P = None
+        self.time = None
+        self.updates = 0
+        self._duty = collections.deque()        # (time, duty), oldest first
+        self._u = 0.0
+
+    @property
+    def ready(self):
+        return self.x is not None
+
+    @property
+    def temperature(self):
+        return self.x[0] if self.x is not None else None
+
+    @property
+    def variance(self):
+        """ Variance (degC^2) of the temperature estimate. """
+        return self.P[0][0] if self.P is not None else None
+
+    @property
+    def rate(self):
+        """ Estimated rate of change of the bath temperature, in degC/s. """
+        if self.x is None:
+            return None
+        (T, d) = (self.x[0], self.x[1])
+        m = self.model
+        if m is None:
+            return d
+        return m.heat_rate * self._u - m.loss * (T - m.ambient) + d
+
+    def _duty_segments(self, start, now):
+        """ [(length, u)] for the heater input the bath feels (what was set dead_time
+            earlier) from start to now.
+        """
+        delay = self.model.dead_time if self.model is not None else 0.0
+        # forget what's been felt already, keeping the one in effect
+        while len(self._duty) > 1 and self._duty[1][0] + delay <= start:
+            self._duty.popleft()
+        segs = []
+        (t, u) = (start, 0.0)
+        for (when, duty) in self._duty:
+            when += delay
+            if when >= now:
+                break
+            if when > t:
+                segs.append((when - t, u))
+                t = when
+            u = duty
+        segs.append((now - t, u))
+        return segs
+
+    def predict(self, now, duty=0.0):
+        """ Advance the estimate to now, with the heater at duty since the last call. """
+        if self.x is None:
+            self.time = now
+            return
+        if not self._duty or self._duty[-1][1] != duty:
+            self._duty.append((self.time, duty))
+        if now <= self.time:
+            return
+        for (dt, u) in self._duty_segments(self.time, now):
+            self._advance(dt, u)
+        self.time = now
+        self._u = u
+
+    def _advance(self, dt, u):
+        m = self.model
+        if m is not None and m.loss > 0:
+            e = math.exp(-m.loss * dt)
+            g = (1 - e) / m.loss
+            c = g * (m.heat_rate * u + m.loss * m.ambient)
+        else:
+            (e, g, c) = (1.0, dt, 0.0)
+        a = math.exp(-dt / self.sensor_lag) if self.sensor_lag > 0 else 0.0
+        b = 1 - a
+
+        F = [[e, g, 0.0],
+             [0.0, 1.0, 0.0],
+             [b * e, b * g, a]]
+        (T, d, Ts) = self.x
+        T_new = e * T + g * d + c
+        self.x = [T_new, d, a * Ts + b * T_new]
+
+        qT = self.process_noise ** 2 * dt
+        qd = self.drift_noise ** 2 * dt
+        Q = [[qT, 0.0, b * qT],
+             [0.0, qd, 0.0],
+             [b * qT, 0.0, b * b * qT]]
+        FP = _matmul(F, self.P)
+        self.P = [[v + q for (v, q) in zip(row, qrow)]
+                  for (row, qrow) in zip(_matmul(FP, _transpose(F)), Q)]
+
+    def update(self, reading):
+        """ Correct the estimate with a probe reading. """
+        if self.x is None:
+            r = self.sensor_noise ** 2
+            self.x = [reading, 0.0, reading]
+            self.P = [[r, 0.0, r], [0.0, self.initial_drift_sd ** 2, 0.0], [r, 0.0, r]]
+            self.updates = 1
+            return
+        P = self.P
+        S = P[2][2] + self.sensor_noise ** 2
+        if S <= 0:
+            return
+        K = [P[i][2] / S for i in range(3)]
+        innovation = reading - self.x[2]
+        self.x = [self.x[i] + K[i] * innovation for i in range(3)]
+        self.P = [[P[i][j] - K[i] * P[2][j] for j in range(3)] for i in range(3)]
+        # keep it symmetric against rounding
+        for i in range(3):
+            for j in range(i):
+                self.P[i][j] = self.P[j][i] = (self.P[i][j] + self.P[j][i]) / 2.0
+        self.updates += 1
+
+    def step(self, now, duty=0.0, reading=None):
+        """ predict() to now, then update() with reading if there is one.  Returns the
+            temperature estimate (None until the first reading).
+        """
+        self.predict(now, duty)
+        if reading is not None:
+            if self.time is None:
+                self.time = now
+            self.update(reading)
+        return self.temperature
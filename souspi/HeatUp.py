@@ -0,0 +1,165 @@
+#
+# Copyright 2014-2015 Joshua Heling <jrh@netfluvia.org>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+""" Model-based heat-up, to get a bath to its setpoint sooner than the PID alone.
+
+    A PID tuned to hold temperature is slow to bring a cold bath up, and tends to
+    overshoot when it gets there (its integral has wound up on the way).  With a model
+    of the bath, we can run the heater flat out and stop at the point where the heat
+    still on its way to the probe carries the bath to the setpoint, then hand over to
+    the PID with its integral primed for holding there.
+
+    "boost" switches off at the coast point worked out from the model alone;
+    "predictive" looks at the heat actually delivered over the last dead time, and each
+    window picks the most heat that keeps the predicted peak at or below the setpoint.
+"""
+
+import math
+import logging
+import collections
+
+from souspi import *
+
+MODES = ("off", "boost", "predictive")
+
+
+class BathModel(collections.namedtuple("BathModel", "heat_rate loss ambient dead_time")):
+    """ dT/dt = heat_rate * u - loss * (T - ambient), with u (0..1) felt dead_time later.
+
+        heat_rate is in degC/s with the heater on full, loss in 1/s.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_fopdt(cls, model, window_size):
+        """ Convert an OfflineTune.FOPDTModel (gain per ms of on_time) for window_size. """
+        return cls(model.K * window_size * 1000.0 / model.tau, 1.0 / model.tau,
+                   model.ambient, model.theta)
+
+    @property
+    def max_temp(self):
+        """ Where the bath would settle with the heater on all the time. """
+        return self.ambient + self.heat_rate / self.loss
+
+    def step(self, temp, u, dt):
+        """ Temperature after dt seconds of constant input u, starting from temp. """
+        target = self.ambient + self.heat_rate * u / self.loss
+        return target + (temp - target) * math.exp(-self.loss * dt)
+
+    def steady_duty(self, temp):
+        """ Fraction of full power that holds the bath at temp. """
+        return min(max(self.loss * (temp - self.ambient) / self.heat_rate, 0.0), 1.0)
+
+    def coast_temp(self, target):
+        """ Temperature at which to switch off a heater that's been on full for at least
+            dead_time, so the bath peaks at target.
+        """
+        lag = math.exp(self.loss * self.dead_time)
+        return self.max_temp - (self.max_temp - target) * lag
+
+
+class HeatUp(object):
+    """ Chooses on_time while a bath is well below its setpoint; see the module docstring.
+
+        Call record() every window with the on_time actually used (whoever chose it), and
+        plan() at the start of every window.  plan() engages once the bath is more than
+        engage_band below the setpoint, and returns None - meaning the PID is in charge -
+        once it's within handoff_band.  The peak is aimed max_overshoot above the setpoint.
+    """
+
+    def __init__(self, model, window_size, mode="predictive", max_overshoot=0.0,
+                 engage_band=2.0, handoff_band=0.5, steps=20):
+        if mode not in MODES:
+            raise ValueError("heat-up mode must be one of %s, not %s" % (", ".join(MODES), mode))
+        self.model = model
+        self.window_size = window_size
+        self.mode = mode
+        self.max_overshoot = max_overshoot
+        self.engage_band = engage_band
+        self.handoff_band = handoff_band
+        self.steps = steps
+        self.active = False
+        self._outputs = collections.deque()     # (window start, on_time), oldest first
+
+    def record(self, now, on_time):
+        self._outputs.append((now, on_time))
+        # only what's still in flight to the probe matters
+        while len(self._outputs) > 1 and \
+                self._outputs[1][0] + self.window_size <= now - self.model.dead_time:
+            self._outputs.popleft()
+
+    def _input_segments(self, start, now, on_time):
+        """ [(from, to, u)] heater input from start on, with on_time in the window at now
+            and nothing after it.
+        """
+        outputs = [o for o in self._outputs if o[0] < now] + [(now, on_time)]
+        segs = []
+        for (i, (t, on)) in enumerate(outputs):
+            end = outputs[i + 1][0] if i + 1 < len(outputs) else t + self.window_size
+            on_end = min(t + on, end)
+            for (a, b, u) in ((t, on_end, 1.0), (on_end, end, 0.0)):
+                (a, b) = (max(a, start), b)
+                if b > a:
+                    segs.append((a, b, u))
+        return segs
+
+    def peak(self, pv, now, on_time):
+        """ Highest measured temperature predicted if this window (starting at now) has
+            on_time seconds of heat, and the heater then stays off.
+        """
+        m = self.model
+        temp = best = pv
+        # what the probe reads from now on is the input from dead_time ago onwards
+        for (a, b, u) in self._input_segments(now - m.dead_time, now, on_time):
+            temp = m.step(temp, u, b - a)
+            best = max(best, temp)
+        return best
+
+    def plan(self, pv, setpoint, now):
+        """ on_time (in s) for the window starting now, or None to leave it to the PID. """
+        if setpoint is None or pv is None or self.mode == "off":
+            self.active = False
+            return None
+        target = setpoint + self.max_overshoot
+        if not self.active:
+            if setpoint - pv <= self.engage_band:
+                return None
+            logging.info("Heat-up (%s): %.2f -> %.2f" % (self.mode, pv, setpoint))
+            self.active = True
+        if pv >= setpoint - self.handoff_band:
+            logging.info("Heat-up done at %.2f; handing over to the PID" % pv)
+            self.active = False
+            return None
+
+        if self.mode == "boost":
+            coast = self.model.coast_temp(target)
+            if pv >= coast:
+                logging.info("Heat-up reached coast point %.2f; handing over to the PID" % coast)
+                self.active = False
+                return None
+            # time at full power until we get to the coast point
+            m = self.model
+            t = math.log((m.max_temp - pv) / (m.max_temp - coast)) / m.loss \
+                    if coast < m.max_temp else self.window_size
+            return min(t, self.window_size)
+
+        # predictive: the most heat that doesn't take the peak past the target
+        for i in range(self.steps, -1, -1):
+            on_time = self.window_size * i / self.steps
+            if self.peak(pv, now, on_time) <= target:
+                return on_time
+        return 0.0
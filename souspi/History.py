@@ -0,0 +1,226 @@
+#
+# Copyright 2014-2015 Joshua Heling <jrh@netfluvia.org>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+""" Queryable history of the bath, at several resolutions.
+
+    Every sample (one per control window) goes into a raw tier, and is also folded into
+    10 second, 1 minute and 1 hour tiers, which keep the min, mean and max of each field
+    over their buckets.  Each tier keeps its points for its own retention period, so
+    there's always a coarse view of the whole cook without keeping every sample.
+
+    Points in a tier are in time order, so a range query is a bisect to find the start,
+    plus a slice - time proportional to the number of points returned.
+"""
+
+import json
+import bisect
+import logging
+import collections
+
+from souspi import *
+
+FIELDS = ("temp", "setpoint", "duty", "heater")
+
+# (name, bucket size in s, retention in s) - bucket size 0 is raw samples
+DEFAULT_TIERS = (("raw", 0, 3600),
+                 ("10s", 10, 6 * 3600),
+                 ("1m", 60, 48 * 3600),
+                 ("1h", 3600, 30 * 24 * 3600))
+
+""" One point in a tier: start time, number of samples, and (min, mean, max) for each
+    field.  For a field with no values in the bucket (e.g. no setpoint), all three are None.
+"""
+HistoryPoint = collections.namedtuple("HistoryPoint", "time count min mean max")
+
+
+class _Bucket(object):
+    """ Running min/max/sum for each field over one tier bucket. """
+
+    __slots__ = ("start", "count", "n", "lo", "hi", "sum")
+
+    def __init__(self, start):
+        self.start = start
+        self.count = 0
+        nf = len(FIELDS)
+        self.n = [0] * nf
+        self.lo = [None] * nf
+        self.hi = [None] * nf
+        self.sum = [0.0] * nf
+
+    def add(self, values):
+        self.count += 1
+        for (i, v) in enumerate(values):
+            if v is None:
+                continue
+            if self.n[i] == 0:
+                self.lo[i] = self.hi[i] = v
+            elif v < self.lo[i]:
+                self.lo[i] = v
+            elif v > self.hi[i]:
+                self.hi[i] = v
+            self.n[i] += 1
+            self.sum[i] += v
+
+    def point(self):
+        mean = tuple(self.sum[i] / self.n[i] if self.n[i] else None for i in range(len(FIELDS)))
+        return HistoryPoint(self.start, self.count, tuple(self.lo), mean, tuple(self.hi))
+
+
+class Tier(object):
+    """ Time-ordered points at one resolution, dropped once older than retention. """
+
+    def __init__(self, name, resolution, retention):
+        self.name = name
+        self.resolution = resolution
+        self.retention = retention
+        self._times = []
+        self._points = []
+        self._bucket = None
+
+    def __len__(self):
+        return len(self._points)
+
+    def add(self, t, values):
+        if self.resolution == 0:
+            v = tuple(values)
+            self._append(HistoryPoint(t, 1, v, v, v))
+        else:
+            start = t - t % self.resolution
+            if self._bucket is not None and start != self._bucket.start:
+                self._append(self._bucket.point())
+                self._bucket = None
+            if self._bucket is None:
+                self._bucket = _Bucket(start)
+            self._bucket.add(values)
+        self._expire(t)
+
+    def _append(self, point):
+        if self._times and point.time < self._times[-1]:
+            # the clock went backwards - start this tier over rather than lose ordering
+            logging.warning("History tier %s: time went backwards; discarding it" % self.name)
+            del self._times[:]
+            del self._points[:]
+        self._times.append(point.time)
+        self._points.append(point)
+
+    def _expire(self, now):
+        # old points are dropped in batches, so trimming stays amortized O(1) per sample
+        cut = bisect.bisect_left(self._times, now - self.retention)
+        if cut > 64 or cut > len(self._times) // 2:
+            del self._times[:cut]
+            del self._points[:cut]
+
+    @property
+    def oldest(self):
+        """ Start time of the oldest point we have (None if there are none). """
+        if self._times:
+            return self._times[0]
+        if self._bucket is not None:
+            return self._bucket.start
+        return None
+
+    def range(self, start=None, end=None, include_open=True):
+        """ Points with start <= time < end (and the bucket still being filled, if wanted). """
+        lo = 0 if start is None else bisect.bisect_left(self._times, start)
+        hi = len(self._times) if end is None else bisect.bisect_left(self._times, end, lo)
+        points = self._points[lo:hi]
+        if include_open and self._bucket is not None and \
+                (start is None or self._bucket.start >= start) and \
+                (end is None or self._bucket.start < end):
+            points.append(self._bucket.point())
+        return points
+
+    def count(self, start=None, end=None):
+        lo = 0 if start is None else bisect.bisect_left(self._times, start)
+        hi = len(self._times) if end is None else bisect.bisect_left(self._times, end, lo)
+        return hi - lo + (1 if self._bucket is not None else 0)
+
+    def to_dict(self):
+        return {"name": self.name, "resolution": self.resolution,
+                "points": [[p.time, p.count, p.min, p.mean, p.max] for p in self._points]}
+
+    def load_dict(self, d):
+        self._times = []
+        self._points = []
+        for (t, count, lo, mean, hi) in d["points"]:
+            self._times.append(t)
+            self._points.append(HistoryPoint(t, count, tuple(lo), tuple(mean), tuple(hi)))
+
+
+class History(object):
+    """ Tiered history of FIELDS.  See the module docstring. """
+
+    def __init__(self, tiers=DEFAULT_TIERS):
+        self.tiers = [Tier(*t) for t in tiers]
+        self._first = None          # time of the first sample we know of
+
+    def record(self, t, temp, setpoint, duty, heater):
+        """ Add a sample.  Values may be None (e.g. setpoint when there isn't one). """
+        if self._first is None:
+            self._first = t
+        values = (temp, setpoint, duty, None if heater is None else (1.0 if heater else 0.0))
+        for tier in self.tiers:
+            tier.add(t, values)
+
+    def tier(self, name):
+        for t in self.tiers:
+            if t.name == name:
+                return t
+        raise KeyError(name)
+
+    def query(self, start=None, end=None, max_points=None):
+        """ Returns (tier, points) for the finest tier that still has data back to start
+            (or to the beginning, if start is None), and no more than max_points points
+            in the range, if given.  Falls back to the coarsest tier if none fits.
+        """
+        populated = [t for t in self.tiers if t.oldest is not None]
+        if not populated:
+            return (self.tiers[0], [])
+        want = self._first if start is None else max(start, self._first)
+        for tier in populated:
+            if tier.oldest <= want and \
+                    (max_points is None or tier.count(start, end) <= max_points):
+                return (tier, tier.range(start, end))
+        return (populated[-1], populated[-1].range(start, end))
+
+    def as_json_dict(self, start=None, end=None, max_points=None):
+        """ query() results in a JSON-friendly form, for the control API. """
+        (tier, points) = self.query(start, end, max_points)
+        return {"tier": tier.name, "resolution": tier.resolution, "fields": FIELDS,
+                "points": [[p.time, p.count, p.min, p.mean, p.max] for p in points]}
+
+    def save(self, path, uid=None, gid=None):
+        """ Save everything but the buckets still being filled. """
+        atomic_file_write(path, json.dumps({"fields": FIELDS, 
+                                            "tiers": [t.to_dict() for t in self.tiers]},
+                                           separators=(',', ':')), uid, gid)
+
+    def load(self, path):
+        """ Pick up history saved by save(), if it's there and compatible. """
+        try:
+            with open(path) as f:
+                d = json.load(f)
+        except (IOError, ValueError):
+            return False
+        if tuple(d.get("fields", ())) != FIELDS:
+            return False
+        saved = dict((t["name"], t) for t in d.get("tiers", []))
+        for tier in self.tiers:
+            if tier.name in saved and saved[tier.name]["resolution"] == tier.resolution:
+                tier.load_dict(saved[tier.name])
+        oldest = [t.oldest for t in self.tiers if t.oldest is not None]
+        self._first = min(oldest) if oldest else None
+        return True
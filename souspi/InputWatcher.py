@@ -0,0 +1,152 @@
+#
+# Copyright 2014-2015 Joshua Heling <jrh@netfluvia.org>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+""" Debounced, cached GPIO input levels, kept current by edge detection.
+
+    Reading a GPIO input every time something wants to know the water level means a
+    syscall per question, and nobody asks while the controller is idle.  An
+    InputWatcher has RPi.GPIO watch for edges on its pins instead.  Reading a pin's
+    level() just returns the cached value, and callbacks hear about real changes as
+    they happen.
+
+    Edges only tell us that something happened.  So after an edge the pin is read
+    again once it has been quiet for the debounce time, and the change only counts if
+    it's still there.  We don't use RPi.GPIO's own bouncetime for this: it drops edges
+    that come too soon after the last one, and that can leave a cached level stuck on
+    the wrong value.  Where edge detection isn't available, the pin is sampled
+    whenever poll() is called instead (the controller calls it every tick).
+"""
+
+import time
+import logging
+import threading
+
+class _Pin(object):
+    __slots__ = ("port", "level", "debounce", "callback", "edges", "pending")
+
+    def __init__(self, port, level, debounce, callback):
+        self.port = port
+        self.level = level
+        self.debounce = debounce
+        self.callback = callback
+        self.edges = False          # are we getting edge events for it?
+        self.pending = None         # (level, since) for a change not yet confirmed
+
+
+class InputWatcher(object):
+    """ Cached input pin levels; see the module docstring.
+
+        callback(port, level) for a pin is called on every confirmed change, from
+        RPi.GPIO's event thread, a debounce timer, or whoever called poll().  It isn't
+        called with the watcher's lock held.  With timers False (as for a simulated
+        clock), changes are only confirmed in poll().
+    """
+
+    def __init__(self, gpio, clock=time.time, debounce=0.0, timers=True):
+        self._gpio = gpio
+        self._clock = clock
+        self.debounce = debounce
+        self._timers = timers
+        self._pins = {}
+        self._lock = threading.Lock()
+
+    def add(self, port, pull_up_down=None, callback=None, debounce=None):
+        """ Set port up as an input and start following it.  Returns its level. """
+        gpio = self._gpio
+        if pull_up_down is None:
+            gpio.setup(port, gpio.IN)
+        else:
+            gpio.setup(port, gpio.IN, pull_up_down=pull_up_down)
+        pin = _Pin(port, gpio.input(port), self.debounce if debounce is None else debounce,
+                   callback)
+        with self._lock:
+            self._pins[port] = pin
+        try:
+            gpio.add_event_detect(port, gpio.BOTH, callback=self._on_edge)
+            pin.edges = True
+        except (RuntimeError, AttributeError), e:
+            logging.warning("No edge detection on GPIO %s (%s); sampling it on each tick" %
+                            (port, e))
+        # anything that happened before the edge detection was on
+        self._on_edge(port)
+        return pin.level
+
+    def remove(self, port):
+        with self._lock:
+            pin = self._pins.pop(port, None)
+        if pin is not None and pin.edges:
+            try:
+                self._gpio.remove_event_detect(port)
+            except (RuntimeError, AttributeError):
+                pass
+
+    def close(self):
+        for port in list(self._pins):
+            self.remove(port)
+
+    def level(self, port):
+        """ The last confirmed level of port. """
+        return self._pins[port].level
+
+    def edge_detected(self, port):
+        """ Is port kept current by edge events (rather than only by poll())? """
+        return self._pins[port].edges
+
+    def _on_edge(self, port):
+        """ Note a (possible) change on port, and confirm it once it's settled. """
+        level = self._gpio.input(port)
+        with self._lock:
+            pin = self._pins.get(port)
+            if pin is None:
+                return
+            if level == pin.level:
+                pin.pending = None
+                return
+            if pin.pending is not None and pin.pending[0] == level:
+                return
+            pin.pending = (level, self._clock())
+            debounce = pin.debounce
+        if debounce <= 0:
+            self.poll()
+        elif self._timers:
+            t = threading.Timer(debounce, self.poll)
+            t.daemon = True
+            t.start()
+
+    def poll(self, now=None):
+        """ Sample the pins without edge detection, and confirm settled changes. """
+        for pin in [p for p in self._pins.values() if not p.edges]:
+            self._on_edge(pin.port)
+        if now is None:
+            now = self._clock()
+        changed = []
+        with self._lock:
+            for pin in self._pins.values():
+                if pin.pending is None or now < pin.pending[1] + pin.debounce:
+                    continue
+                level = self._gpio.input(pin.port)
+                if level == pin.pending[0]:
+                    pin.level = level
+                    changed.append(pin)
+                pin.pending = None
+        for pin in changed:
+            logging.debug("GPIO %s is now %s" % (pin.port, pin.level))
+            if pin.callback is not None:
+                pin.callback(pin.port, pin.level)
+        # a bounce back while we were confirming starts another round
+        for pin in changed:
+            if self._gpio.input(pin.port) != pin.level:
+                self._on_edge(pin.port)
@@ -0,0 +1,132 @@
+#
+# Copyright 2014-2015 Joshua Heling <jrh@netfluvia.org>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+""" Cheap timing and counters for the control loop.
+
+    Timing a stage is two clock reads and a bisect into a fixed set of histogram
+    buckets, so it's fine to leave on all the time:
+
+        t0 = inst.start()
+        pv = self._get_temp()
+        inst.stop("get_temp", t0)
+
+        inst.count("heater_toggles")
+"""
+
+import time
+import bisect
+
+# histogram bucket upper bounds, in seconds: 100us .. 5s (plus one for anything slower)
+DEFAULT_BOUNDS = (0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05,
+                  0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+class LatencyHistogram(object):
+    """ Counts of durations falling into fixed buckets, plus count/total/max. """
+
+    __slots__ = ("bounds", "buckets", "count", "total", "max")
+
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self.bounds = bounds
+        self.reset()
+
+    def reset(self):
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p):
+        """ Upper bound of the bucket holding the p'th percentile (None: above the last). """
+        if not self.count:
+            return 0.0
+        target = p / 100.0 * self.count
+        seen = 0
+        for (i, n) in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                return self.bounds[i] if i < len(self.bounds) else None
+        return None
+
+    def as_dict(self):
+        return {"count": self.count, "mean": self.mean, "max": self.max,
+                "p50": self.percentile(50), "p99": self.percentile(99),
+                "bounds": list(self.bounds), "buckets": list(self.buckets)}
+
+
+class Instruments(object):
+    """ A set of named stage histograms and counters.
+
+        Durations are measured with timer (wall-clock time.time by default - not the
+        controller's clock, which may be simulated).
+    """
+
+    def __init__(self, timer=time.time, bounds=DEFAULT_BOUNDS):
+        self.timer = timer
+        self.bounds = bounds
+        self.stages = {}
+        self.counters = {}
+        self.since = timer()
+
+    def start(self):
+        return self.timer()
+
+    def stop(self, stage, started):
+        """ Record the time since started (from start()) for stage; returns the duration. """
+        elapsed = self.timer() - started
+        self.record(stage, elapsed)
+        return elapsed
+
+    def record(self, stage, value):
+        h = self.stages.get(stage)
+        if h is None:
+            h = self.stages[stage] = LatencyHistogram(self.bounds)
+        h.record(value)
+
+    def count(self, counter, n=1):
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def reset(self):
+        self.stages = {}
+        self.counters = {}
+        self.since = self.timer()
+
+    def as_dict(self):
+        return {"since": self.since,
+                "stages": dict((k, h.as_dict()) for (k, h) in self.stages.items()),
+                "counters": dict(self.counters)}
+
+    def summary(self):
+        """ One line per stage (count, mean, p99, max in ms), then the counters. """
+        lines = []
+        for name in sorted(self.stages):
+            h = self.stages[name]
+            p99 = h.percentile(99)
+            lines.append("%-16s n=%-8d mean=%8.3fms p99<=%s max=%8.3fms" %
+                         (name, h.count, h.mean * 1000,
+                          "%gms" % (p99 * 1000) if p99 is not None else "inf", h.max * 1000))
+        lines.append(" ".join("%s=%d" % kv for kv in sorted(self.counters.items())))
+        return "\n".join(lines)
@@ -0,0 +1,119 @@
+#
+# Copyright 2014-2015 Joshua Heling <jrh@netfluvia.org>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+""" An append-only journal of controller state, so a restarted controller can pick up
+    where it left off.
+
+    Each record is one line: a CRC32 and a JSON object holding the fields that changed
+    (and the time).  Replaying the file merges the records in order.  A crash can
+    leave the last line half-written; its CRC won't match, and replay stops there.
+    Once the file has compact_every records, it's replaced (atomically) by a single
+    record of the whole state.
+"""
+
+import os
+import json
+import zlib
+import logging
+
+from souspi.util import atomic_file_write
+from souspi import *
+
+def _encode(record):
+    payload = json.dumps(record, sort_keys=True, separators=(',', ':'))
+    return "%08x %s\n" % (zlib.crc32(payload) & 0xffffffff, payload)
+
+def _decode(line):
+    """ The record on line, or None if it's damaged or incomplete. """
+    if not line.endswith("\n"):
+        return None
+    (crc, _, payload) = line[:-1].partition(" ")
+    try:
+        if int(crc, 16) != zlib.crc32(payload) & 0xffffffff:
+            return None
+        record = json.loads(payload)
+    except ValueError:
+        return None
+    return record if isinstance(record, dict) else None
+
+
+class StateJournal(object):
+    """ Journal of a dict of JSON-able controller state at path; see the module docstring.
+
+        With fsync, each record is on disk before append() returns.
+    """
+
+    def __init__(self, path, compact_every=100, fsync=True, uid=None, gid=None):
+        self.path = path
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self._uid = uid
+        self._gid = gid
+        self.state = {}
+        self._records = 0
+        self._file = None
+
+    def replay(self):
+        """ Read back the state from the journal (an empty dict if there's none), and
+            start it afresh with that as its one record.
+        """
+        self.state = {}
+        records = 0
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    record = _decode(line)
+                    if record is None:
+                        logging.warning("Journal %s is damaged after %d records; ignoring the "
+                                        "rest" % (self.path, records))
+                        break
+                    self.state.update(record)
+                    records += 1
+        except IOError:
+            pass
+        self.compact()
+        return dict(self.state)
+
+    def append(self, now, **fields):
+        """ Record whichever of fields differ from the current state, as of time now.
+            Returns True if anything was written.
+        """
+        changed = dict((k, v) for (k, v) in fields.items() if self.state.get(k) != v)
+        if not changed:
+            return False
+        changed["time"] = now
+        self.state.update(changed)
+        if self._file is None:
+            self._file = open(self.path, "a")
+        self._file.write(_encode(changed))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._records += 1
+        if self._records >= self.compact_every:
+            self.compact()
+        return True
+
+    def compact(self):
+        """ Replace the journal with a single record of the current state. """
+        self.close()
+        atomic_file_write(self.path, _encode(self.state), self._uid, self._gid, fsync=self.fsync)
+        self._records = 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
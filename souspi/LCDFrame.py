@@ -0,0 +1,114 @@
+#
+# Copyright 2014-2015 Joshua Heling <jrh@netfluvia.org>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+""" Flicker-free drawing on a character LCD.
+
+    Every command to the LCD plate is a handful of I2C transactions, and clearing the
+    display makes it visibly blink.  LCDFrame is drawn on like the LCD itself (clear,
+    set_cursor, message, set_color, blink), but only changes an in-memory frame.
+    flush() then sends just the cells that differ from what's on the display, and only
+    touches the backlight color or cursor if they changed.
+"""
+
+class LCDFrame(object):
+    """ Frame buffer for an Adafruit_CharLCD-style display of cols x rows characters. """
+
+    def __init__(self, lcd, cols=16, rows=2):
+        self.lcd = lcd
+        self.cols = cols
+        self.rows = rows
+        self._frame = [[" "] * cols for r in range(rows)]
+        self._col = 0
+        self._row = 0
+        self._color = None
+        self._blink = False
+        self.invalidate()
+
+    def invalidate(self):
+        """ Forget what's on the display, so the next flush() redraws everything. """
+        self._shown = [[None] * self.cols for r in range(self.rows)]
+        self._hw_cursor = None
+        self._shown_color = None
+        self._shown_blink = None
+
+    def clear(self):
+        self._frame = [[" "] * self.cols for r in range(self.rows)]
+        self._col = 0
+        self._row = 0
+
+    def set_cursor(self, col, row):
+        self._col = col
+        self._row = min(row, self.rows - 1)
+
+    def message(self, text):
+        """ Write text at the cursor, as LCD.message() would: newlines move to the start
+            of the next row, and anything past the right edge is dropped.
+        """
+        for c in text:
+            if c == "\n":
+                self._row = min(self._row + 1, self.rows - 1)
+                self._col = 0
+                continue
+            if self._col < self.cols:
+                self._frame[self._row][self._col] = c
+            self._col += 1
+
+    def set_color(self, red, green, blue):
+        self._color = (red, green, blue)
+
+    def blink(self, on):
+        self._blink = bool(on)
+
+    def text(self):
+        """ The frame's contents, one string per row. """
+        return ["".join(row) for row in self._frame]
+
+    def flush(self):
+        """ Bring the display up to date with the frame. """
+        lcd = self.lcd
+        if self._color is not None and self._color != self._shown_color:
+            lcd.set_color(*self._color)
+            self._shown_color = self._color
+
+        for r in range(self.rows):
+            want = self._frame[r]
+            shown = self._shown[r]
+            c = 0
+            while c < self.cols:
+                if want[c] == shown[c]:
+                    c += 1
+                    continue
+                # a run of changed cells, taking in single unchanged cells between
+                # changes (rewriting one is cheaper than another cursor move)
+                start = end = c
+                while end < self.cols and (want[end] != shown[end] or
+                        (end + 1 < self.cols and want[end + 1] != shown[end + 1])):
+                    end += 1
+                if self._hw_cursor != (start, r):
+                    lcd.set_cursor(start, r)
+                lcd.message("".join(want[start:end]))
+                shown[start:end] = want[start:end]
+                self._hw_cursor = (end, r) if end < self.cols else None
+                c = end
+
+        if self._blink:
+            pos = (min(self._col, self.cols - 1), self._row)
+            if self._hw_cursor != pos:
+                lcd.set_cursor(*pos)
+                self._hw_cursor = pos
+        if self._blink != self._shown_blink:
+            lcd.blink(self._blink)
+            self._shown_blink = self._blink
@@ -0,0 +1,198 @@
+#
+# Copyright 2014-2015 Joshua Heling <jrh@netfluvia.org>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+""" Button input for the LCD keypad.
+
+    The keypad buttons hang off the LCD plate's MCP23017 I/O expander, on the I2C bus.
+    Asking the plate about each button separately costs an I2C transaction per button,
+    so instead all the buttons are read at once, with a single read of the expander's
+    GPIO register.  If the expander's interrupt line is wired to one of the Pi's GPIO
+    pins, we don't even do that until a button actually changes.
+
+    ButtonInput turns those readings into a queue of debounced button presses, with
+    key-repeat for buttons held down.
+"""
+
+import time
+import Queue
+import logging
+import threading
+
+# MCP23017 registers (IOCON.BANK = 0)
+MCP23017_GPINTENA = 0x04
+MCP23017_INTCONA = 0x08
+MCP23017_IOCON = 0x0A
+MCP23017_IOCON_MIRROR = 0x40
+
+def plate_reader(lcd, buttons):
+    """ Returns a function giving the set of buttons currently pressed on an
+        Adafruit_CharLCDPlate, using one I2C read for all of them.
+
+        Falls back to asking about each button if the plate's expander doesn't
+        support bulk reads.
+    """
+    mcp = getattr(lcd, "_mcp", None)
+    if mcp is not None and hasattr(mcp, "input_pins"):
+        pins = list(buttons)
+        def read():
+            levels = mcp.input_pins(pins)
+            # buttons are pulled up, and read low when pressed
+            return frozenset(b for (b, level) in zip(pins, levels) if not level)
+    else:
+        logging.info("LCD plate can't read all buttons at once; reading them one by one")
+        def read():
+            return frozenset(b for b in buttons if lcd.is_pressed(b))
+    return read
+
+def enable_plate_interrupt(lcd, buttons):
+    """ Have the plate's MCP23017 raise its interrupt line when any button changes.
+
+        Returns False if the plate doesn't expose the expander's registers.  The
+        interrupt is cleared by reading the GPIO register, which plate_reader() does.
+    """
+    mcp = getattr(lcd, "_mcp", None)
+    i2c = getattr(mcp, "_i2c", None)
+    if i2c is None:
+        return False
+    mask = 0
+    for b in buttons:
+        mask |= 1 << b
+    # INTA/INTB mirrored, so it doesn't matter which is wired up
+    i2c.write8(MCP23017_IOCON, i2c.readU8(MCP23017_IOCON) | MCP23017_IOCON_MIRROR)
+    i2c.write8(MCP23017_INTCONA, 0)          # interrupt on any change, not vs. DEFVAL
+    i2c.write8(MCP23017_GPINTENA, mask)
+    return True
+
+
+class ButtonInput(object):
+    """ Queue of debounced button presses, fed by read_buttons().
+
+        read_buttons() returns the set of buttons down right now.  A change has to hold
+        for debounce seconds before it counts.  Each press is queued once; buttons in
+        repeat_buttons are queued again after being held for repeat_delay, and then every
+        repeat_interval.
+
+        Readings are taken by a background thread (see start()) every poll_interval
+        while any button is down or bouncing.  Otherwise, if wakeup is given, the thread
+        sleeps until wakeup is set (e.g. from a GPIO edge callback on the expander's
+        interrupt line) and only reads every idle_interval as a safety net; without it,
+        it keeps polling every poll_interval.  poll() can also be called directly.
+    """
+
+    def __init__(self, read_buttons, repeat_buttons=(), debounce=0.02, repeat_delay=0.5,
+                 repeat_interval=0.15, poll_interval=0.05, wakeup=None, idle_interval=1.0,
+                 clock=time.time):
+        self._read = read_buttons
+        self.repeat_buttons = frozenset(repeat_buttons)
+        self.debounce = debounce
+        self.repeat_delay = repeat_delay
+        self.repeat_interval = repeat_interval
+        self.poll_interval = poll_interval
+        self.idle_interval = idle_interval
+        self._wakeup = wakeup
+        self._clock = clock
+
+        self.events = Queue.Queue()
+        self.reads = 0           # how many times we've read the buttons
+        self._raw = frozenset()
+        self._raw_since = None
+        self._stable = frozenset()
+        self._repeat_at = {}
+
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def pressed(self):
+        """ The (debounced) set of buttons currently down. """
+        return self._stable
+
+    @property
+    def busy(self):
+        """ True if a button is down or bouncing, so we need to keep reading. """
+        return bool(self._stable) or self._raw != self._stable
+
+    def poll(self, now=None):
+        """ Take one reading and queue any resulting presses. """
+        if now is None:
+            now = self._clock()
+        raw = frozenset(self._read())
+        self.reads += 1
+        if raw != self._raw:
+            self._raw = raw
+            self._raw_since = now
+        if raw != self._stable and now - self._raw_since >= self.debounce:
+            for b in sorted(raw - self._stable):
+                self.events.put(b)
+                self._repeat_at[b] = now + self.repeat_delay
+            for b in self._stable - raw:
+                self._repeat_at.pop(b, None)
+            self._stable = raw
+        for b in self._stable & self.repeat_buttons:
+            if now >= self._repeat_at[b]:
+                self.events.put(b)
+                self._repeat_at[b] = max(self._repeat_at[b] + self.repeat_interval, now)
+
+    def get(self, timeout=None):
+        """ Return the next button pressed, or None if there's none within timeout
+            seconds (None blocks indefinitely).
+        """
+        try:
+            if timeout is None:
+                # a plain blocking get() can't be interrupted by ^C
+                while True:
+                    try:
+                        return self.events.get(True, 3600)
+                    except Queue.Empty:
+                        pass
+            return self.events.get(True, timeout)
+        except Queue.Empty:
+            return None
+
+    def clear(self):
+        """ Forget any presses not yet picked up. """
+        while True:
+            try:
+                self.events.get_nowait()
+            except Queue.Empty:
+                return
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ButtonInput")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._wakeup is not None:
+            self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self._wakeup is not None:
+                self._wakeup.clear()
+            try:
+                self.poll()
+            except IOError, e:
+                logging.warning("Couldn't read buttons: %s" % e)
+            if self.busy or self._wakeup is None:
+                self._stop.wait(self.poll_interval)
+            else:
+                self._wakeup.wait(self.idle_interval)
@@ -0,0 +1,201 @@
+#
+# Copyright 2014-2015 Joshua Heling <jrh@netfluvia.org>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+""" PID tuning from a recorded trace, rather than by experimenting on a live bath.
+
+    Given a trace of heater output and bath temperature (a controller datalog, or a CSV
+    with time, pv and on_time columns - e.g. as exported by SousVideDatalog), we fit a
+    first-order-plus-dead-time (FOPDT) process model:
+
+        tau * dy/dt = K * u(t - theta) - (y - ambient)
+
+    and derive PID gains from it with one of the standard rules.  u is in the PID's
+    output units (ms of heater on-time per control window), so the gains can be used
+    as-is.  Gains are for the parallel form (Ki = Kp / Ti, Kd = Kp * Td, times in
+    seconds).
+
+    Needs numpy.
+"""
+
+import os
+import re
+import csv
+import stat
+import math
+import collections
+
+import numpy
+
+from souspi import DataLog
+from souspi import *
+
+FOPDTModel = collections.namedtuple("FOPDTModel", "K tau theta ambient dt rmse")
+PIDGains = collections.namedtuple("PIDGains", "Kp Ki Kd")
+
+RULES = ("zn", "cc", "imc")
+
+def load_trace(path):
+    """ Returns (t, pv, u) arrays from a datalog or CSV trace, skipping incomplete rows.
+
+        u is the PID output (on_time in ms).
+    """
+    try:
+        arr = DataLog.DataLogReader(path).to_array()
+        t = arr["time"].astype(float)
+        pv = arr["pv"].astype(float)
+        u = arr["on_time"].astype(float) * 1000.0
+    except DataLogError:
+        (t, pv, u) = ([], [], [])
+        with open(path) as f:
+            for row in csv.DictReader(f):
+                try:
+                    vals = (float(row["time"]), float(row["pv"]), float(row["on_time"]))
+                except (KeyError, TypeError, ValueError):
+                    continue
+                t.append(vals[0])
+                pv.append(vals[1])
+                u.append(vals[2] * 1000.0)
+        (t, pv, u) = (numpy.array(t), numpy.array(pv), numpy.array(u))
+
+    ok = numpy.isfinite(t) & numpy.isfinite(pv) & numpy.isfinite(u)
+    (t, pv, u) = (t[ok], pv[ok], u[ok])
+    order = numpy.argsort(t, kind="mergesort")
+    return (t[order], pv[order], u[order])
+
+def _resample(t, pv, u, dt):
+    """ Put the trace on a uniform grid: pv interpolated, u held from the last sample. """
+    grid = numpy.arange(t[0], t[-1], dt)
+    y = numpy.interp(grid, t, pv)
+    idx = numpy.searchsorted(t, grid, side="right") - 1
+    return (y, u[numpy.clip(idx, 0, len(u) - 1)])
+
+def fit_fopdt(t, pv, u, dt=None, max_dead_time=300.0):
+    """ Least-squares fit of an FOPDT model to a trace.
+
+        The trace is resampled every dt seconds (default: the median sample spacing),
+        and the discrete model y[k+1] = a*y[k] + b*u[k-d] + c is fitted for every dead
+        time d up to max_dead_time, keeping the best.  Raises TuningError if the trace
+        is too short or doesn't look like a stable first-order process.
+    """
+    if len(t) < 10:
+        raise TuningError("Need at least 10 samples to fit a model (got %d)" % len(t))
+    if dt is None:
+        dt = float(numpy.median(numpy.diff(t)))
+    if dt <= 0:
+        raise TuningError("Trace timestamps don't increase")
+    (y, uu) = _resample(t, pv, u, dt)
+    if numpy.ptp(uu) == 0:
+        raise TuningError("Heater output never changes in this trace, so there's nothing to fit")
+
+    n = len(y)
+    max_d = min(int(max_dead_time / dt), n // 2)
+    best = None
+    for d in xrange(max_d + 1):
+        target = y[d + 1:]
+        X = numpy.column_stack((y[d:-1], uu[:n - d - 1], numpy.ones(n - d - 1)))
+        (coef, resid, rank, sv) = numpy.linalg.lstsq(X, target, rcond=None)
+        if rank < 3:
+            continue
+        sse = float(numpy.sum((X.dot(coef) - target) ** 2))
+        if best is None or sse < best[0]:
+            best = (sse, d, coef, len(target))
+    if best is None:
+        raise TuningError("Couldn't fit a model to this trace")
+
+    (sse, d, (a, b, c), m) = best
+    if not (0 < a < 1) or b <= 0:
+        raise TuningError("Trace doesn't look like a stable heating process (a=%g, b=%g)" % (a, b))
+    tau = -dt / math.log(a)
+    K = b / (1 - a)
+    ambient = c / (1 - a)
+    # the rules below need some dead time; half a step is as close to none as we can tell
+    theta = max(d * dt, dt / 2.0)
+    return FOPDTModel(K, tau, theta, ambient, dt, math.sqrt(sse / m))
+
+def pid_gains(model, rule="imc", lam=None):
+    """ PID gains for model by rule: "zn" (Ziegler-Nichols reaction curve), "cc"
+        (Cohen-Coon), or "imc" (internal model control; lam is the desired closed-loop
+        time constant, by default the larger of 0.8*theta and 0.1*tau).
+    """
+    (K, tau, theta) = (model.K, model.tau, model.theta)
+    r = theta / tau
+    if rule == "zn":
+        Kp = 1.2 * tau / (K * theta)
+        Ti = 2.0 * theta
+        Td = 0.5 * theta
+    elif rule == "cc":
+        Kp = (1.0 / K) * (tau / theta) * (4.0 / 3 + r / 4.0)
+        Ti = theta * (32 + 6 * r) / (13 + 8 * r)
+        Td = theta * 4.0 / (11 + 2 * r)
+    elif rule == "imc":
+        if lam is None:
+            lam = max(0.8 * theta, 0.1 * tau)
+        Kp = (2 * tau + theta) / (K * (2 * lam + theta))
+        Ti = tau + theta / 2.0
+        Td = tau * theta / (2 * tau + theta)
+    else:
+        raise ValueError("Unknown tuning rule %s (choose from %s)" % (rule, ", ".join(RULES)))
+    return PIDGains(Kp, Kp / Ti, Kp * Td)
+
+def write_gains(cfgfile, gains):
+    """ Set Kp/Ki/Kd in the [PID] section of cfgfile, leaving everything else (including
+        comments) alone.  Missing options are added at the top of the section.
+    """
+    _write_options(cfgfile, "PID", [("Kp", gains.Kp), ("Ki", gains.Ki), ("Kd", gains.Kd)],
+                   "%.4f")
+
+def write_heatup_model(cfgfile, model):
+    """ Save a HeatUp.BathModel to the [HeatUp] section of cfgfile (as write_gains()). """
+    _write_options(cfgfile, "HeatUp", [("heat_rate", model.heat_rate), ("heat_loss", model.loss),
+                                       ("ambient_temp", model.ambient),
+                                       ("dead_time", model.dead_time)], "%.6g")
+
+def _write_options(cfgfile, section_name, options, fmt):
+    """ Set options (a list of (name, float), formatted with fmt) in section_name of cfgfile. """
+    with open(cfgfile) as f:
+        lines = f.readlines()
+
+    vals = dict((name.lower(), v) for (name, v) in options)
+    section = None
+    header = None
+    option = re.compile(r"^\s*(\w+)\s*[:=]")
+    for (i, line) in enumerate(lines):
+        m = re.match(r"^\s*\[([^\]]+)\]", line)
+        if m:
+            section = m.group(1).strip()
+            if section == section_name:
+                header = i
+            continue
+        if section != section_name:
+            continue
+        m = option.match(line)
+        if m and m.group(1).lower() in vals:
+            key = m.group(1).lower()
+            lines[i] = "%s: %s\n" % (m.group(1), fmt % vals.pop(key))
+
+    if vals:
+        if header is None:
+            lines.append("\n[%s]\n" % section_name)
+            header = len(lines) - 1
+        for (name, v) in reversed(options):
+            if name.lower() in vals:
+                lines.insert(header + 1, "%s: %s\n" % (name, fmt % v))
+
+    # the new file has to stay readable by whoever could read the old one (the web UI
+    # doesn't run as root)
+    st = os.stat(cfgfile)
+    atomic_file_write(cfgfile, "".join(lines), st.st_uid, st.st_gid, fsync=True,
+                      mode=stat.S_IMODE(st.st_mode))
@@ -0,0 +1,201 @@
+#
+# Copyright 2014-2015 Joshua Heling <jrh@netfluvia.org>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+""" Turns each control window's on_time into heater switching at the right instants.
+
+    The controller only runs every alarm_interval, so switching the heater from its
+    tick quantizes on_time to whole ticks - with the defaults, all or nothing per window.
+    An OutputModulator is given the window and on_time once, works out when the heater
+    should switch, and (with start()) does the switching from its own thread, on time,
+    however seldom the control logic runs.
+
+    min_on and min_off keep pulses and gaps from being too short for the relay (or
+    whatever's switching the heater).  Heat that can't be delivered in a window because
+    of them is carried over to the next one, so the average power still comes out
+    right.  burst_cycles > 1 spreads a window's heat over that many evenly spaced
+    pulses, for smaller temperature ripple.
+"""
+
+import time
+import logging
+import threading
+
+class OutputModulator(object):
+    """ Schedules on/off switching within control windows; see the module docstring.
+
+        switch is called with True or False to turn the heater on or off.  It's never
+        called with the modulator's lock held, so it may take the caller's own locks.
+        If the caller holds a lock of its own around set_window() and clear(), pass it
+        as lock: the thread then switches with it held, and drops a switch that an
+        update of the schedule has overtaken (rather than, say, turning the heater off
+        just after the new window turned it on).  If instruments (see Instrumentation)
+        is given, how late each switch happens is recorded as "switch_lateness".
+    """
+
+    spin_threshold = 0.1        # s; the last stretch before a switch is slept, not waited
+
+    def __init__(self, switch, clock=time.time, min_on=0.0, min_off=0.0, burst_cycles=1,
+                 instruments=None, lock=None):
+        self._switch = switch
+        self._lock = lock
+        self._clock = clock
+        self.min_on = min_on
+        self.min_off = min_off
+        self.burst_cycles = burst_cycles
+        self._instruments = instruments
+
+        self._cond = threading.Condition()
+        self._events = []           # [(time, on)] still to happen, in time order
+        self._generation = 0        # bumped whenever the schedule is replaced
+        self._carry = 0.0           # heat (s) owed from earlier windows (or over-delivered)
+        self._thread = None
+        self._running = False
+
+    def pulses(self, window, on_time):
+        """ Returns [(offset, length)] heater pulses for a window (including anything
+            carried over), and updates the carry.
+        """
+        want = min(max(on_time, 0.0), window) + self._carry
+        on = min(max(want, 0.0), window)
+        n = max(int(self.burst_cycles), 1)
+        # fewer, longer pulses and gaps if they'd be too short
+        if self.min_on > 0 and on > 0:
+            n = min(n, max(int(on / self.min_on), 1))
+        if self.min_off > 0 and on < window:
+            n = min(n, max(int((window - on) / self.min_off), 1))
+        if on < self.min_on:
+            on = 0.0
+        elif window - on < self.min_off:
+            on = window
+        # what rounding to the minimums left out (or added) goes in the next window
+        limit = max(self.min_on, self.min_off)
+        self._carry = max(min(want - on, limit), -limit)
+
+        if on <= 0:
+            return []
+        if on >= window:
+            return [(0.0, window)]
+        period = window / n
+        return [(i * period, on / n) for i in range(n)]
+
+    def set_window(self, start, window, on_time):
+        """ Replace the schedule with switching for the window starting at start. """
+        events = []
+        for (offset, length) in self.pulses(window, on_time):
+            events.append((start + offset, True))
+            if length < window:
+                events.append((start + offset + length, False))
+        if not events:
+            events = [(start, False)]
+        with self._cond:
+            self._events = events
+            self._generation += 1
+            self._cond.notify()
+
+    def clear(self):
+        """ Drop any scheduled switching (and carried-over heat).  Doesn't touch the heater. """
+        with self._cond:
+            self._events = []
+            self._carry = 0.0
+            self._generation += 1
+            self._cond.notify()
+
+    @property
+    def next_switch(self):
+        """ Time of the next scheduled switch, or None. """
+        with self._cond:
+            return self._events[0][0] if self._events else None
+
+    def _take_due(self, now):
+        """ Pop events due by now; returns the last of them, or None.  Call with _cond held. """
+        due = None
+        while self._events and self._events[0][0] <= now:
+            due = self._events.pop(0)
+        return due
+
+    def _apply(self, event, now):
+        if self._instruments is not None:
+            self._instruments.record("switch_lateness", max(now - event[0], 0.0))
+        self._switch(event[1])
+
+    def poll(self, now=None):
+        """ Carry out any switching that's due.  Returns the heater state set, or None. """
+        if now is None:
+            now = self._clock()
+        with self._cond:
+            due = self._take_due(now)
+        if due is None:
+            return None
+        self._apply(due, now)
+        return due[1]
+
+    def start(self):
+        """ Switch from a thread of our own, at the scheduled times (by the real clock). """
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="OutputModulator")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                now = self._clock()
+                due = self._take_due(now)
+                generation = self._generation
+                if due is None:
+                    delay = self._events[0][0] - now if self._events else None
+                    if delay is None or delay > self.spin_threshold:
+                        # Condition.wait() with a timeout wakes up late (by up to 50ms
+                        #  in Python 2), so only use it to get close
+                        self._cond.wait(None if delay is None else delay - self.spin_threshold / 2)
+                        continue
+            if due is None:
+                time.sleep(delay)
+                continue
+            try:
+                self._apply_current(due, now, generation)
+            except Exception:
+                logging.exception("Heater switch failed")
+
+    def _apply_current(self, event, now, generation):
+        """ Apply event (taken from the schedule of that generation) unless the schedule
+            has been replaced since.
+        """
+        if self._lock is None:
+            with self._cond:
+                if generation != self._generation:
+                    return
+            self._apply(event, now)
+            return
+        # with the caller's lock, the schedule can't change between the check and the switch
+        with self._lock:
+            with self._cond:
+                if generation != self._generation:
+                    return
+            self._apply(event, now)
@@ -0,0 +1,131 @@
+#
+# Copyright 2014-2015 Joshua Heling <jrh@netfluvia.org>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+import json
+import logging
+
+from souspi import *
+
+class SetpointTimer(object):
+    """ Keeps track of how long the bath has been at its setpoint.
+
+        The bath counts as at temperature once it's within threshold of the setpoint,
+        and stays that way until it's more than threshold + hysteresis away, so noise
+        right at the edge of the band doesn't restart the clock.  Leaving the band only
+        resets the time if the bath doesn't come back within tolerance seconds (e.g.
+        after the lid was lifted).  A setpoint change, or a gap of more than tolerance
+        between updates, also resets it.
+
+        Each update() is O(1).  If state_file is given, the state is saved there when it
+        changes (and every checkpoint_interval while at temp), and picked up again at
+        construction, so a restarted controller carries on counting.
+    """
+
+    def __init__(self, threshold, hysteresis=0.0, tolerance=120.0, state_file=None,
+                 checkpoint_interval=60.0, uid=None, gid=None):
+        self.threshold = threshold
+        self.hysteresis = hysteresis
+        self.tolerance = tolerance
+        self.state_file = state_file
+        self.checkpoint_interval = checkpoint_interval
+        self._uid = uid
+        self._gid = gid
+
+        self._setpoint = None
+        self._since = None          # when the bath (last) reached the setpoint
+        self._in_band = False
+        self._left_at = None        # when it last left the band, while still counting
+        self._last_update = None
+        self._saved_at = None
+        self._load()
+
+    def _reset(self, setpoint):
+        self._setpoint = setpoint
+        self._since = None
+        self._in_band = False
+        self._left_at = None
+
+    def update(self, temp, setpoint, now):
+        """ Account for the bath being at temp (with setpoint as the target) at time now. """
+        changed = False
+        if setpoint is not None:
+            setpoint = float(setpoint)
+        if temp is None or setpoint is None or setpoint != self._setpoint or \
+                (self._last_update is not None and now - self._last_update > self.tolerance):
+            changed = self._since is not None or setpoint != self._setpoint
+            self._reset(setpoint)
+        self._last_update = now
+        if setpoint is None or temp is None:
+            if changed:
+                self.save(now)
+            return
+
+        err = abs(temp - setpoint)
+        if self._in_band:
+            if err > self.threshold + self.hysteresis:
+                self._in_band = False
+                self._left_at = now
+                changed = True
+        elif err <= self.threshold:
+            self._in_band = True
+            self._left_at = None
+            if self._since is None:
+                self._since = now
+            changed = True
+
+        if self._since is not None and not self._in_band and now - self._left_at > self.tolerance:
+            logging.info("Bath left setpoint %.2f for more than %ss; restarting time at setpoint" %
+                         (setpoint, self.tolerance))
+            self._since = None
+            self._left_at = None
+            changed = True
+
+        if changed or (self._since is not None and
+                       (self._saved_at is None or now >= self._saved_at + self.checkpoint_interval)):
+            self.save(now)
+
+    def elapsed(self, now):
+        """ Seconds the bath has been at the setpoint as of now, or None if it isn't. """
+        if self._since is None:
+            return None
+        return max(now - self._since, 0.0)
+
+    def save(self, now):
+        self._saved_at = now
+        if self.state_file is None:
+            return
+        state = {"setpoint": self._setpoint, "since": self._since, "in_band": self._in_band,
+                 "left_at": self._left_at, "updated": self._last_update}
+        try:
+            atomic_file_write(self.state_file, json.dumps(state), self._uid, self._gid)
+        except (OSError, IOError), e:
+            logging.error("Couldn't save time at setpoint to %s: %s" % (self.state_file, e))
+
+    def _load(self):
+        if self.state_file is None:
+            return
+        try:
+            with open(self.state_file) as f:
+                state = json.load(f)
+            self._setpoint = state["setpoint"]
+            self._since = state["since"]
+            self._in_band = state["in_band"]
+            self._left_at = state["left_at"]
+            self._last_update = state["updated"]
+        except (IOError, ValueError, KeyError, TypeError):
+            # no (usable) saved state - start from scratch
+            self._reset(None)
+            self._last_update = None
@@ -0,0 +1,160 @@
+#
+# Copyright 2014-2015 Joshua Heling <jrh@netfluvia.org>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+import os
+import shutil
+import tempfile
+import ConfigParser
+
+from souspi import SousPi
+from souspi import SousPiHardware
+
+class Simulation(object):
+    """ Runs the real SousPi control logic against a simulated bath, faster than real time.
+
+        The controller gets a SimulatedGPIO, a SimulatedBath as its temperature source, and
+        a VirtualClock.  Its files (status, setpoint, etc.) live in a scratch directory
+        that's removed by cleanup().  Each call to run() advances the clock one
+        alarm_interval at a time, ticking the controller and the bath model in step.
+
+            sim = Simulation(setpoint=56.5)
+            sim.run(24 * 3600)
+            print sim.samples[-1]
+
+        config is a dict of {(section, option): value} overriding the simulation defaults;
+        bath_args are passed through to SimulatedBath.  bath, if given, is used in its place:
+        it should be a function of (heater function, clock) returning an object with the
+        same advance(), temperature and get_temperature() (see Benchmark.TraceReplay).
+    """
+
+    output_control_port = 23
+    water_sensor_port = 24
+    pump_control_port = 17
+
+    def __init__(self, setpoint=None, alarm_interval=1.0, window_size=10, config=None,
+                 start_time=1.0e9, workdir=None, bath=None, **bath_args):
+        self._own_workdir = workdir is None
+        self.workdir = workdir if workdir is not None else tempfile.mkdtemp(prefix="souspi-sim-")
+        self.cfgfile = os.path.join(self.workdir, "souspi.cfg")
+        self.alarm_interval = alarm_interval
+
+        cfg = self._default_config(window_size)
+        if config:
+            cfg.update(config)
+        self._write_config(cfg)
+
+        self.clock = SousPiHardware.VirtualClock(start_time)
+        self.gpio = SousPiHardware.SimulatedGPIO()
+        # the bath is in water unless a scenario says otherwise
+        self.gpio.set_input(self.water_sensor_port, 1)
+        heater = lambda: self.gpio.levels.get(self.output_control_port, 0)
+        if bath is None:
+            self.bath = SousPiHardware.SimulatedBath(heater, self.clock, **bath_args)
+        else:
+            self.bath = bath(heater, self.clock)
+
+        self.sp = SousPi.SousPi(self.cfgfile, gpio=self.gpio, clock=self.clock,
+                                temp_source=self.bath)
+
+        # (time, temperature, heater state, setpoint) after every tick
+        self.samples = []
+
+        if setpoint is not None:
+            self.sp.setpoint = setpoint
+            self.sp.start()
+
+    def _default_config(self, window_size):
+        d = self.workdir
+        return {
+            ("general", "command_dir"): d,
+            ("general", "temperature_file"): os.path.join(d, "temptracker.dat"),
+            ("general", "setpoint_file"): os.path.join(d, "spsetpoint"),
+            ("general", "log_dir"): d,
+            ("general", "file_uid"): os.getuid(),
+            ("general", "file_gid"): os.getgid(),
+            ("general", "debug_log_enabled"): "false",
+            ("PID", "Kp"): SousPi.SousPi.config_defaults["kp"],
+            ("PID", "Ki"): SousPi.SousPi.config_defaults["ki"],
+            ("PID", "Kd"): SousPi.SousPi.config_defaults["kd"],
+            ("PID", "at_temp_threshold"): 0.5,
+            ("hardware", "output_control_port"): self.output_control_port,
+            ("hardware", "water_sensor_port"): self.water_sensor_port,
+            ("hardware", "pump_control_port"): self.pump_control_port,
+            ("AutoTune", "noise_band"): 1,
+            ("AutoTune", "output_step"): 50,
+            ("AutoTune", "lookback_sec"): 20,
+            ("AutoTune", "stable_time_goal"): 100,
+            ("AutoTune", "stablization_output"): 600,
+            ("PID Internals", "control_window_size"): window_size,
+            ("PID Internals", "alarm_interval"): self.alarm_interval,
+            ("PID Internals", "control_engine"): "external",
+            ("internal", "start_file_name"): "start",
+            ("internal", "stop_file_name"): "stop",
+            ("internal", "status_file_name"): "status",
+            ("internal", "command_check_interval"): 0.5,
+            ("internal", "command_watch"): "poll",
+            # a scratch directory; no need to wait for the disk
+            ("internal", "journal_fsync"): "false",
+        }
+
+    def _write_config(self, cfg):
+        cp = ConfigParser.RawConfigParser()
+        for ((section, option), value) in sorted(cfg.items()):
+            if not cp.has_section(section):
+                cp.add_section(section)
+            cp.set(section, option, str(value))
+        with open(self.cfgfile, "w") as f:
+            cp.write(f)
+
+    @property
+    def now(self):
+        return self.clock()
+
+    @property
+    def heater_on(self):
+        return bool(self.gpio.levels.get(self.output_control_port, 0))
+
+    def step(self):
+        """ Advance one alarm_interval and tick the controller. 
+        
+            Heater switching scheduled between ticks (see OutputModulator) happens at 
+            its own time, as it would on the real thing.
+        """
+        end = self.clock() + self.alarm_interval
+        modulator = self.sp._modulator
+        while modulator is not None and modulator.next_switch is not None and \
+                modulator.next_switch < end:
+            self.clock.advance(max(modulator.next_switch - self.clock(), 0.0))
+            modulator.poll()
+            self.bath.advance()
+        self.clock.advance(end - self.clock())
+        self.sp.tick()
+        # let the bath know about any heater change the tick made
+        self.bath.advance()
+        self.samples.append((self.clock(), self.bath.temperature, self.heater_on, self.sp.setpoint))
+
+    def run(self, duration, until=None):
+        """ Simulate duration seconds (or until until() returns True, if sooner). """
+        end = self.clock() + duration
+        while self.clock() < end:
+            self.step()
+            if until is not None and until():
+                break
+
+    def cleanup(self):
+        self.sp.cleanup()
+        if self._own_workdir:
+            shutil.rmtree(self.workdir, ignore_errors=True)
@@ -23,17 +23,30 @@ import signal
 import os
 import time
 import sys
-import ConfigParser
 import logging
 import tempfile
 import threading
 import json
 
-import RPi.GPIO as GPIO
-
 from pid_controller import PID
 from pid_controller import PID_ATune
 from souspi import SousPiStatus
+from souspi import CommandWatcher
+from souspi import TempChannel
+from souspi import ControlEngine
+from souspi import SousPiHardware
+from souspi import DataLog
+from souspi import SousPiRPC
+from souspi import SetpointTimer
+from souspi import History
+from souspi import Instrumentation
+from souspi import SousPiConfig
+from souspi import HeatUp
+from souspi import OutputModulator
+from souspi import Estimator
+from souspi import InputWatcher
+from souspi import StateStore
+from souspi import Journal
 from souspi import *
             
 class SousPi(object):
@@ -46,46 +59,157 @@ class SousPi(object):
         ## general
         'temperature_file': '"/var/souspi/temptracker.dat"', 
         'setpoint_file': "/var/souspi/spsetpoint",
+        'temperature_channel': '',
+        'temperature_channel_max_age': '5',
+        'state_dir': '',
         ## PID
         'kp': '174.81', 
         'ki': '29.80', 
         'kd': '256.32', 
+        'at_temp_threshold': '0.5',
+        'at_temp_hysteresis': '0.25',
+        'at_temp_tolerance': '120',
         ## hardware
         'output_control_port': '23', 
+        'water_sensor_debounce': '0.2',
         ## autotune
         'noise_band': '1', 
         'output_step': '50', 
         'lookback_sec': '20', 
         'stable_time_goal': '100',
         'stabilization_output': '600',
+        'max_attempts': '5',
+        ## heat-up
+        'heatup_mode': 'off',
+        'heat_rate': '0',
+        'heat_loss': '0',
+        'ambient_temp': '20',
+        'dead_time': '0',
+        'max_overshoot': '0',
+        'engage_band': '2.0',
+        'handoff_band': '0.5',
+        ## estimator
+        'estimator': 'off',
+        'sensor_lag': '0',
+        'sensor_noise': '0.1',
+        'process_noise': '0.01',
+        'drift_noise': '0.0001',
+        'reading_hold': '1.0',
         ## pid internals
         'control_window_size': '10', 
         'alarm_interval': '10',
+        'control_engine': 'thread',
+        'output_timing': 'exact',
+        'min_on_time': '0',
+        'min_off_time': '0',
+        'burst_cycles': '1',
+        ## internal
+        'command_watch': 'auto',
+        'datalog_records': '100000',
+        'status_min_interval': '0.5',
+        'control_socket_name': 'control.sock',
+        'setpoint_timer_file_name': 'at_setpoint',
+        'history_file_name': 'history.json',
+        'config_watch': 'true',
+        'timing_file_name': 'timing.json',
+        'timing_dump_interval': '0',
+        'state_sync_interval': '60',
+        'journal_file_name': 'journal',
+        'journal_max_age': '600',
+        'journal_fsync': 'true',
     }
     
-    def __init__(self, cfgfile="/etc/souspi.cfg"):
+    def __init__(self, cfgfile="/etc/souspi.cfg", gpio=None, clock=time.time, temp_source=None,
+                 engine=None, name="control", phase=0.0):
+        """ Set up the controller as described by cfgfile.
+        
+            By default we drive the Pi's GPIO pins and read the temperature TempTracker
+            maintains, in real time.  For simulation and testing, any of those can be 
+            replaced (see SousPiHardware): gpio with something providing the RPi.GPIO 
+            API, clock with a function returning the current time, and temp_source with 
+            an object whose get_temperature() returns the current temperature.  With a 
+            non-default clock you'll want control_engine = external, and to call tick() 
+            yourself.
+
+            When several controllers share a process (see BathSupervisor), engine is the 
+            shared ControlEngine to schedule our tick on (as task name, overriding 
+            control_engine), and phase (0..1) staggers our ticks and control windows by 
+            that fraction of a period relative to the others.  A controller on a shared 
+            engine only releases its own GPIO pins on cleanup, and keeps its files in
+            log_dir and state_dir in a subdirectory named after it, so that baths can
+            share those directories.
+        """
         
         self._init_complete = False
+
+        if gpio is None:
+            gpio = SousPiHardware.raspi_gpio()
+        self._gpio = gpio
+        self._clock = clock
+        self._temp_source = temp_source
+        self._inputs = None
                 
         self.p = PID.PID()
         self.status = None  
         
         self._PID_running = False
         self.heater_is_on = False
+        self._heated_this_window = False   # was the heater on at all in the current window?
         self._last_temp_read_time = 0
+        self._temp_channel = None
+        self._last_temp_seq = 0
+        self._channel_live = False      # did the last reading come from the channel?
+        self._temp_readings = 0         # bumped for every fresh reading _get_temp() sees
+        self._estimated_readings = 0    # ... and how many of those the estimator has had
+        self._estimated_time = None     # when the estimator last had a reading
         self._last_setpoint_read_time = 0
         self._setpoint = None
+        self._watcher = None
+        self._datalog = None
+        self._rpc_server = None
+        self.history = History.History()
+        self.instruments = Instrumentation.Instruments()
+        self._last_tick = None
+        self._last_timing_dump = None
 
-        ## won't actually do anything until self._init_complete is True
-        signal.signal(signal.SIGALRM, self._drive_output)        
+        ## serializes control ticks with commands arriving on the watcher thread
+        self._lock = threading.RLock()
 
-        self._window_start = time.time()
+        ## control ticks come either from the engine's thread or (legacy) from SIGALRM;
+        ##  _configure() decides which.  Either way, they won't actually do anything 
+        ##  until self._init_complete is True
+        self._engine = None
+        self._shared_engine = engine
+        self._engine_task = None
+        self._external_ticks = False
+        self._alarm_interval = 0
+        self.name = name
+        self._phase = phase
+
+        self._window_start = self._clock()
         self._on_time = 0.0   # this is the output of the PID, converted to seconds (treating PID output like ms)
 
-        self._last_command_check = time.time() 
+        self._last_command_check = self._clock() 
 
         self._config_file = cfgfile
+        self.config = None
+        self._pending_config = None     # reloaded config, waiting for a window boundary
+        self._setpoint_timer = None
+        self._heatup = None
+        self._modulator = None
+        self._estimator = None
+        self._state = None
+        self._journal = None
         self._configure()
+        if self.history.load(self._history_file):
+            logging.info("Picked up history from %s" % self._history_file)
+        self._setpoint_timer = SetpointTimer.SetpointTimer(self._at_temp_threshold, 
+                                    self._at_temp_hysteresis, self._at_temp_tolerance,
+                                    state_file=self._setpoint_timer_file,
+                                    checkpoint_interval=self._at_temp_tolerance / 2.0,
+                                    uid=self._file_uid, gid=self._file_gid)
+        # start partway into the first window, so staggered controllers switch at different times
+        self._window_start -= self._phase * self._window_size
 
         try:
             os.unlink(self.start_file)
@@ -98,14 +222,22 @@ class SousPi(object):
         self._setup_raspi()
 
         # this could raise an exception if the file can't be written
-        self.status = SousPiStatus.SousPiStatus(spobj=self, tofile=self.status_file)
+        self.status = SousPiStatus.SousPiStatus(spobj=self, tofile=self.status_file,
+                                                min_interval=self._status_min_interval,
+                                                clock=self._clock)
         self.status.file_uid = self._file_uid
         self.status.file_gid = self._file_gid
                 
         self.status.refresh()
+
+        # carry on where a previous run (crashed or not) left off
+        self._resume_from_journal()
         
         self._init_complete = True
 
+        self._start_watcher()
+        self._start_rpc_server()
+
     @property
     def PID_running(self):
         return self._PID_running
@@ -117,13 +249,44 @@ class SousPi(object):
 
     @property
     def in_water(self):
-        if GPIO.input(self._water_sensor_port):
+        # kept current by the input watcher, even while we're idle
+        if self._inputs.level(self._water_sensor_port):
             return True
         return False
 
+    @property
+    def time_at_setpoint(self):
+        """ Whole minutes the bath has been at the setpoint, or None. """
+        if not self.PID_running:
+            return None
+        elapsed = self._setpoint_timer.elapsed(self._clock())
+        if elapsed is None:
+            return None
+        return int(elapsed // 60)
+
     @property
     def last_temp(self):
         return self._current_temp
+
+    @property
+    def temp_estimate(self):
+        """ The estimator's bath temperature (None if it's off or has nothing yet). """
+        if self._estimator is None or not self._estimator.ready:
+            return None
+        return round(self._estimator.temperature, 3)
+
+    @property
+    def temp_variance(self):
+        if self._estimator is None or not self._estimator.ready:
+            return None
+        return round(self._estimator.variance, 6)
+
+    @property
+    def temp_rate(self):
+        """ Estimated rate of change of the bath temperature, in degC/min. """
+        if self._estimator is None or not self._estimator.ready:
+            return None
+        return round(self._estimator.rate * 60.0, 3)
     
     # def register_UI(self, UI, handle=None):
     #     """ Add a UI. Returns handle, which is generated if not provided. """
@@ -134,11 +297,17 @@ class SousPi(object):
     # pass
     
     def do_auto_tune(self):
+        """ Run the relay auto-tuner against the live bath, returning (Kp, Ki, Kd).
+
+            If the tuner finds the bath has gone unstable, we re-stabilize and try again,
+            up to autotune max_attempts times; None is returned if it never succeeds.
+            (See also OfflineTune, which works from a recorded datalog instead.)
+        """
         logging.info("tuning")
 
         if self.in_water is False:
             logging.error("Refusing to auto-tune in absence of detected water.")
-            return
+            return None
 
         at = PID_ATune.PID_ATune(self._get_temp, self.p.manual_override)
 
@@ -147,70 +316,122 @@ class SousPi(object):
         at.output_step = self._autotune_output_step
         at.lookback_sec = self._autotune_lookback_sec
         
-        ## before we can call the PID's AutoTuner, we need to get in a stable state
-        #
-        stable = False
-        stable_since = None
-        stable_time_goal = self._autotune_stable_time_goal  
+        # (so a controller restarted mid-tune knows not to trust the PID's state)
+        self._journal_note(autotune=True)
+        try:
+            for attempt in xrange(1, self._autotune_max_attempts + 1):
+                self._autotune_stabilize(at)
+                try:
+                    at.Tune()
+                except PID_ATune.PIDNotStableError, e:
+                    logging.warning("Instability detected in at.Tune() (attempt %d of %d): %s" % 
+                                    (attempt, self._autotune_max_attempts, e))
+                    continue
+                logging.info("auto-tune values: Kp = %f, Ki = %f, Kd = %f" % (at.Kp, at.Ki, at.Kd))
+                return (at.Kp, at.Ki, at.Kd)
+        finally:
+            self._journal_note(autotune=False)
+
+        logging.error("Giving up on auto-tune after %d attempts" % self._autotune_max_attempts)
+        return None
+
+    def _autotune_stabilize(self, at):
+        """ Hold the heater output steady until the tuner sees a stable temperature. 
         
-        ## normally, the PID figures out how to drive the heaters in order to hit a target
-        #   temp (the "setpoint", or "process variable").  Here, we don't care what the 
-        #   temp is, but just that it (and the driver value we call the 'output' here) 
-        #   are stable in relation to each other.  So we pick an output and stay with 
-        #   it until a temp settles in.
+            Normally, the PID figures out how to drive the heaters in order to hit a target
+            temp (the "setpoint", or "process variable").  Here, we don't care what the 
+            temp is, but just that it (and the driver value we call the 'output' here) 
+            are stable in relation to each other.  So we pick an output and stay with 
+            it until a temp settles in.
+        """
+        stable_since = None
         self.p.manual_override(self._autotune_stabilization_output)    # peg heater output 
-        while (not stable) or (time.time() < stable_since + self._autotune_stable_time_goal):
-            logging.info("stable: %s" % str(stable))
-            if stable:
-                logging.debug("%f < %f + %f : %s" % (time.time(), stable_since, 
-                                                self._autotune_stable_time_goal, 
-                                                str(time.time() < stable_since + 
-                                                self._autotune_stable_time_goal)))
+        while stable_since is None or self._clock() < stable_since + self._autotune_stable_time_goal:
+            logging.info("stable: %s" % str(stable_since is not None))
             try:
                 logging.debug("calling at.verify_stability()")
                 at.verify_stability()
             except PID_ATune.PIDNotStableError, e:
-                stable = False
+                stable_since = None
                 logging.debug("still not stable: %s" % e)
             else:
-                if not stable:
-                    stable = True
+                if stable_since is None:
                     logging.debug("**** updating stable_since")
-                    stable_since = time.time()
-        
-        try:
-            at.Tune()
-        except PID_ATune.PIDNotStableError, e:
-            logging.warning("Instability detected in at.Tune(): %s" % e)
-            return self.do_auto_tune()   # FIXME - refactor this loop to avoid the need for this
+                    stable_since = self._clock()
+
+    def process_commands(self, changed=None):
+        """ Check for command files or setpoint changes. 
         
-        print "values: Kp = %f, Ki = %f, Kd = %f" % (at.Kp, at.Ki, at.Kd)
-        # FIXME - should save results, rather than just print to screen ;) 
+            If changed is given (by the file watcher), it's the set of command/setpoint
+            file paths known to have changed, and only those are looked at.  Otherwise
+            everything is checked.
+        """
+        self._last_command_check = self._clock()
 
-    def process_commands(self):
-        """ Check for command files or setpoint changes. """
-        self._last_command_check = time.time()
+        # config file changes
+        if changed is None or self._config_file in changed:
+            self._check_config_file()
 
         # setpoint changes 
-        self._update_setpoint()
+        if changed is None or self.setpoint_file in changed:
+            self._update_setpoint()
         
         # start file
-        if os.path.isfile(self.start_file):
+        if (changed is None or self.start_file in changed) and os.path.isfile(self.start_file):
             self.start()
             os.unlink(self.start_file)  # intentionally don't catch exceptions
         
         # stop file
-        if os.path.isfile(self.stop_file):
+        if (changed is None or self.stop_file in changed) and os.path.isfile(self.stop_file):
             self.stop()
             os.unlink(self.stop_file)
 
+    def _start_watcher(self):
+        """ Get notified of command/setpoint file changes, if the platform allows it. 
+        
+            If no watcher can be set up, commands are picked up by polling from 
+            _drive_output() every command_check_interval.
+        """
+        paths = [self.start_file, self.stop_file]
+        if self.setpoint_file is not None:
+            paths.append(self.setpoint_file)
+        if self._config_watch:
+            paths.append(self._config_file)
+        self._watcher = CommandWatcher.create_watcher(paths, self._on_command_files_changed,
+                                                      self._command_watch)
+        if self._watcher is not None:
+            logging.info("Watching for commands with inotify.")
+            # pick up anything that arrived before the watch was in place
+            self._on_command_files_changed(None)
+        else:
+            logging.info("Polling for commands every %ss." % self._command_check_interval)
+
+    def _start_rpc_server(self):
+        """ Serve the socket control API (see SousPiRPC), unless it's been disabled. """
+        if self.control_socket is None:
+            return
+        try:
+            self._rpc_server = SousPiRPC.RPCServer(self.control_socket, self, 
+                                                   self._file_uid, self._file_gid)
+        except (OSError, IOError), e:
+            # UIs fall back to command files, so this isn't fatal
+            logging.error("Couldn't serve control API on %s: %s" % (self.control_socket, e))
+            return
+        self._rpc_server.start()
+        logging.info("Serving control API on %s" % self.control_socket)
+
+    def _on_command_files_changed(self, changed):
+        """ Called from the watcher thread when command or setpoint files change. """
+        with self._lock:
+            self.process_commands(changed)
+
     def _start_pump(self):
         """ Turn the water pump on. """
-        GPIO.output(self._pump_control_port, 0)
+        self._gpio.output(self._pump_control_port, 0)
         
     def _stop_pump(self):
         """ Turn the water pump on. """
-        GPIO.output(self._pump_control_port, 1)    
+        self._gpio.output(self._pump_control_port, 1)    
 
     def start(self):
         """ Initiate operations. 
@@ -228,28 +449,67 @@ class SousPi(object):
             return
         else:
             logging.info("Starting PID.")
+            if self._estimator is not None:
+                # whatever it knew is stale by now
+                self._estimator.reset()
             self._start_pump()
             self.PID_running = True
+            self._journal_note(running=True)
     
     def stop(self):
         """ Stop PID control.
         
             Turns off the heaters and stops the PID logic.  
         """
+        if self._modulator is not None:
+            self._modulator.clear()
         self._turn_off()
         self._stop_pump()
         self.PID_running = False   
+        self._journal_note(running=False)
         logging.info("Stopping PID.")
     
     def cleanup(self, signum=None, frame=None): # FIXME - is it desirable to hook this into object destruction?
         """docstring for cleanup"""
-        self.alarm_interval = 0         # un-set itimer
-        GPIO.cleanup()
+        self._set_alarm_interval(0)         # un-set itimer / stop the engine
+        if self._modulator is not None:
+            self._modulator.stop()
+            self._modulator.clear()
+            self._turn_off()
+        if self.status is not None:
+            self.status.flush(force=True)
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+        if self._rpc_server is not None:
+            self._rpc_server.stop()
+            self._rpc_server = None
+        if self._inputs is not None:
+            self._inputs.close()
+        if self._shared_engine is not None:
+            # other controllers in this process are still using their pins
+            self._gpio.cleanup([self._output_control_port, self._water_sensor_port, 
+                                self._pump_control_port])
+        else:
+            self._gpio.cleanup()
         logging.info("Shutting down SousPi instance.")
+        if self._datalog is not None:
+            self._datalog.close()
+            self._datalog = None
+        if self._temp_channel is not None:
+            self._temp_channel.close()
+            self._temp_channel = None
+        self._setpoint_timer.save(self._clock())
+        if self._state is not None:
+            self._state.checkpoint(self._clock(), force=True)
         try:
-            self._datalogf.close()
-        except:   ## FIXME lazy 
-            pass
+            self.history.save(self._history_file, self._file_uid, self._file_gid)
+        except OSError, e:
+            logging.error("Couldn't save history to %s: %s" % (self._history_file, e))
+        if self._timing_dump_interval > 0:
+            self.dump_timing()
+        if self._journal is not None:
+            self._journal.close()
     
     @property
     def setpoint(self): 
@@ -294,6 +554,9 @@ class SousPi(object):
         
         self._setpoint = arg
         self.p.setpoint = self._setpoint
+        if self._state is not None:
+            self._state.changed(self.setpoint_file)
+        self._journal_note(setpoint=new_setpoint_val)
         if self.status is not None:
             self.status.refresh()
 
@@ -313,68 +576,251 @@ class SousPi(object):
 
     def _configure(self):
         """ Set up configuration, based on file or hardcoded defaults if no file. """
-        cp = ConfigParser.ConfigParser(self.config_defaults)
-        cp.read(self._config_file)  
+        config = SousPiConfig.SousPiConfig.load(self._config_file, self.config_defaults)
+        self._config_mtime = self._get_config_mtime()
+        self.config = config
         
-        self._set_window_size(cp.getfloat("PID Internals", "control_window_size"))
-        self._set_alarm_interval(cp.getfloat("PID Internals", "alarm_interval"))
-        self.temperature_file = cp.get("general", "temperature_file")
-        self.setpoint_file = cp.get("general", "setpoint_file")
+        self._set_control_engine(config.control_engine)
+        self.temperature_file = config.temperature_file
+        self.temperature_channel_file = config.temperature_channel or None
+        self._channel_max_age = config.temperature_channel_max_age
+        self.setpoint_file = config.setpoint_file
 
-        self.p.Kp = cp.getfloat("PID", "Kp")
-        self.p.Ki = cp.getfloat("PID", "Ki")
-        self.p.Kd = cp.getfloat("PID", "Kd")
-        
-        self.p.out_max = self._window_size * 1000
         self.p.out_min = 0
+        if config.output_timing == "exact" and self._modulator is None:
+            self._modulator = OutputModulator.OutputModulator(self._modulated_switch, 
+                                                              self._clock, 
+                                                              instruments=self.instruments,
+                                                              lock=self._lock)
+            if not self._external_ticks:
+                # with a real clock, switch at the exact instants; otherwise on ticks
+                self._modulator.start()
+        self._apply_config(config)
         
-        self._file_uid = cp.getint("general", "file_uid")
-        self._file_gid = cp.getint("general", "file_gid")
+        self._file_uid = config.file_uid
+        self._file_gid = config.file_gid
         
-        self._output_control_port = cp.getint("hardware", "output_control_port")
-        self._water_sensor_port = cp.getint("hardware", "water_sensor_port")
-        self._pump_control_port = cp.getint("hardware", "pump_control_port")
+        self._output_control_port = config.output_control_port
+        self._water_sensor_port = config.water_sensor_port
+        self._water_sensor_debounce = config.water_sensor_debounce
+        self._pump_control_port = config.pump_control_port
         
-        self._autotune_noise_band = cp.getfloat("AutoTune", "noise_band")
-        self._autotune_output_step = cp.getfloat("AutoTune", "output_step")
-        self._autotune_lookback_sec = cp.getfloat("AutoTune", "lookback_sec")
-        self._autotune_stable_time_goal  = cp.getfloat("AutoTune", "stable_time_goal")
-        self._autotune_stabilization_output = cp.getfloat("AutoTune", "stablization_output")
+        self._command_watch = config.command_watch
+        self._config_watch = config.config_watch
 
-        self._command_check_interval = cp.getfloat("internal", "command_check_interval")
+        self._log_dir = self._own_dir(config.log_dir)
+        self._history_file = os.path.join(self._log_dir, config.history_file_name)
+        self._timing_file = os.path.join(self._log_dir, config.timing_file_name)
+        self._debug_log_enabled = config.debug_log_enabled
 
-        self._log_dir = cp.get("general", "log_dir")
-        self._debug_log_enabled = cp.getboolean("general", "debug_log_enabled")
+        if self._debug_log_enabled and self._datalog is None:
+            # fixed-size ring, so this can't grow without bound over a long cook
+            self._datalog = DataLog.RingDataLog(os.path.join(self._log_dir, "datalog.ring"),
+                                                config.datalog_records)
 
-        if self._debug_log_enabled:
-            datalogf_name = self._log_dir + "/" + ("debug.log-%s" % time.strftime("%Y-%m-%d_%X"))
-            self._datalogf = open(datalogf_name, 'w')  
-            self._datalog("time, setpoint, self._get_temp(), error, onTime, p, i, d\n")
+        self.status_file = config.command_dir + "/" + config.status_file_name
+        self.start_file = config.command_dir + "/" + config.start_file_name
+        self.stop_file = config.command_dir + "/" + config.stop_file_name
+        self._setpoint_timer_file = config.command_dir + "/" + config.setpoint_timer_file_name
+        if config.control_socket_name:
+            self.control_socket = config.command_dir + "/" + config.control_socket_name
+        else:
+            self.control_socket = None
+
+        if config.state_dir and self._state is None:
+            # command_dir is (probably) in RAM; keep what has to outlive a reboot on disk
+            self._state = StateStore.StateStore(self._own_dir(config.state_dir),
+                                                config.state_sync_interval,
+                                                self._clock, self._file_uid, self._file_gid)
+            self._state.track(self.setpoint_file, urgent=True)
+            self._state.track(self._setpoint_timer_file)
 
         self._restore_setpoint()
 
-        self.status_file = cp.get("general", "command_dir") + "/" \
-                                    + cp.get("internal", "status_file_name")
-        self.start_file = cp.get("general", "command_dir") + "/" \
-                                    + cp.get("internal", "start_file_name")
-        self.stop_file = cp.get("general", "command_dir") + "/" \
-                                    + cp.get("internal", "stop_file_name")
+        if config.journal_file_name and self._journal is None:
+            path = config.command_dir + "/" + config.journal_file_name
+            if self._state is not None:
+                self._state.track(path)
+            self._journal = Journal.StateJournal(path, fsync=config.journal_fsync,
+                                                 uid=self._file_uid, gid=self._file_gid)
+        self._journal_max_age = config.journal_max_age
+
+    def _own_dir(self, base):
+        """ base - or, for one of several baths (see __init__), our subdirectory of it,
+            created if need be.  (Otherwise they'd all use the same datalog, history and
+            durable setpoint and journal.)
+        """
+        if self._shared_engine is None:
+            return base
+        d = os.path.join(base, self.name)
+        if not os.path.isdir(d):
+            os.makedirs(d)
+            if self._file_uid is not None or self._file_gid is not None:
+                os.chown(d, -1 if self._file_uid is None else self._file_uid,
+                         -1 if self._file_gid is None else self._file_gid)
+        return d
+
+    def _apply_config(self, config):
+        """ Put the settings that can change while running (SousPiConfig.HOT) into effect. """
+        self._set_window_size(config.window_size)
+        if config.alarm_interval != self._alarm_interval:
+            self._set_alarm_interval(config.alarm_interval)    # re-arms the timer
+
+        self.p.Kp = config.kp
+        self.p.Ki = config.ki
+        self.p.Kd = config.kd
+        self.p.out_max = self._window_size * 1000
+        # a shorter window mustn't leave us heating past its end
+        self._on_time = min(self._on_time, self._window_size)
+        if self._modulator is not None:
+            self._modulator.min_on = config.min_on_time
+            self._modulator.min_off = config.min_off_time
+            self._modulator.burst_cycles = config.burst_cycles
+
+        self._at_temp_threshold = config.at_temp_threshold
+        self._at_temp_hysteresis = config.at_temp_hysteresis
+        self._at_temp_tolerance = config.at_temp_tolerance
+        if self._setpoint_timer is not None:
+            self._setpoint_timer.threshold = self._at_temp_threshold
+            self._setpoint_timer.hysteresis = self._at_temp_hysteresis
+            self._setpoint_timer.tolerance = self._at_temp_tolerance
+            self._setpoint_timer.checkpoint_interval = self._at_temp_tolerance / 2.0
+
+        self._autotune_noise_band = config.autotune_noise_band
+        self._autotune_output_step = config.autotune_output_step
+        self._autotune_lookback_sec = config.autotune_lookback_sec
+        self._autotune_stable_time_goal = config.autotune_stable_time_goal
+        self._autotune_stabilization_output = config.autotune_stabilization_output
+        self._autotune_max_attempts = config.autotune_max_attempts
+
+        self._command_check_interval = config.command_check_interval
+        self._status_min_interval = config.status_min_interval
+        if self.status is not None:
+            self.status.min_interval = self._status_min_interval
+        self._timing_dump_interval = config.timing_dump_interval
+        if self._state is not None:
+            self._state.interval = config.state_sync_interval
+        self._configure_heatup(config)
+        self._configure_estimator(config)
+
+    def _configure_heatup(self, config):
+        """ Set up (or update, or drop) the model-based heat-up controller. """
+        if config.heatup_mode == "off":
+            self._heatup = None
+            return
+        model = HeatUp.BathModel(config.heat_rate, config.heat_loss, config.ambient_temp,
+                                 config.dead_time)
+        if self._heatup is None:
+            self._heatup = HeatUp.HeatUp(model, self._window_size)
+        hu = self._heatup
+        hu.model = model
+        hu.window_size = self._window_size
+        hu.mode = config.heatup_mode
+        hu.max_overshoot = config.max_overshoot
+        hu.engage_band = config.engage_band
+        hu.handoff_band = config.handoff_band
+
+    def _configure_estimator(self, config):
+        """ Set up (or update, or drop) the temperature estimator. """
+        if config.estimator == "off":
+            self._estimator = None
+            return
+        # the heat-up model, if there is one, lets it predict between readings
+        if config.heat_rate > 0 and config.heat_loss > 0:
+            model = HeatUp.BathModel(config.heat_rate, config.heat_loss, config.ambient_temp,
+                                     config.dead_time)
+        else:
+            model = None
+        if self._estimator is None:
+            self._estimator = Estimator.TempEstimator()
+        est = self._estimator
+        est.model = model
+        est.sensor_lag = config.sensor_lag
+        est.sensor_noise = config.sensor_noise
+        est.process_noise = config.process_noise
+        est.drift_noise = config.drift_noise
+        self._reading_hold = config.reading_hold
+
+    def _get_config_mtime(self):
+        try:
+            return os.stat(self._config_file).st_mtime
+        except OSError:
+            return None
+
+    def reload_config(self, signum=None, frame=None):
+        """ Re-read the config file, to be put into effect at the next window boundary 
+            (or the next tick, if the PID isn't running).
+
+            Usable as a SIGHUP handler.  Returns False (keeping the current config) if 
+            the file doesn't check out.  Options that need a restart are left alone.
+        """
+        self._config_mtime = self._get_config_mtime()
+        try:
+            config = SousPiConfig.SousPiConfig.load(self._config_file, self.config_defaults)
+        except ConfigError, e:
+            logging.error("Not reloading configuration: %s" % e)
+            return False
+        changed = config.changes(self.config)
+        cold = [f for f in changed if f not in SousPiConfig.HOT]
+        if cold:
+            logging.warning("Configuration changes to %s need a restart; ignoring them." %
+                            ", ".join(cold))
+            config = config._replace(**dict((f, getattr(self.config, f)) for f in cold))
+        if not [f for f in changed if f in SousPiConfig.HOT]:
+            logging.info("Configuration reloaded; nothing to change.")
+            return True
+        logging.info("Configuration reloaded; will apply %s" % 
+                     ", ".join(f for f in changed if f in SousPiConfig.HOT))
+        self._pending_config = config
+        return True
+
+    def _check_config_file(self):
+        """ Reload the config if the file has changed (with config_watch on). """
+        if self._config_watch and self._get_config_mtime() != self._config_mtime:
+            self.reload_config()
 
+    def _apply_pending_config(self):
+        config = self._pending_config
+        self._pending_config = None
+        if config is None:
+            return
+        self._apply_config(config)
+        self.config = config
+        logging.info("New configuration in effect: Kp = %s, Ki = %s, Kd = %s, window %ss, "
+                     "tick %ss" % (config.kp, config.ki, config.kd, config.window_size,
+                                   config.alarm_interval))
 
-    def _datalog(self, logline):
-        if self._debug_log_enabled:
-            self._datalogf.write(logline)
+    def _log_window(self, pv):
+        """ Record the state of the control window that's just starting in the datalog. """
+        if self._datalog is None:
+            return
+        if self.p.manual_mode:
+            self._datalog.append(self._clock(), DataLog.NAN, pv, DataLog.NAN, self._on_time,
+                                 DataLog.NAN, DataLog.NAN, DataLog.NAN, self.heater_is_on)
+        else:
+            self._datalog.append(self._clock(), self.setpoint, pv, self.setpoint - pv, 
+                                 self._on_time, self.p.Cp, self.p.Ci, self.p.Cd, 
+                                 self.heater_is_on)
 
     def _setup_raspi(self):
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(self._output_control_port, GPIO.OUT)
-        GPIO.setup(self._water_sensor_port, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
-        GPIO.setup(self._pump_control_port, GPIO.OUT)
+        gpio = self._gpio
+        gpio.setmode(gpio.BCM)
+        gpio.setup(self._output_control_port, gpio.OUT)
+        # with a simulated clock, changes are confirmed on ticks rather than by timers
+        self._inputs = InputWatcher.InputWatcher(gpio, self._clock, 
+                                                 timers=not self._external_ticks)
+        self._inputs.add(self._water_sensor_port, pull_up_down=gpio.PUD_DOWN,
+                         callback=self._on_water_change, debounce=self._water_sensor_debounce)
+        gpio.setup(self._pump_control_port, gpio.OUT)
         # pump control pin must be immediately brought high to stay off
         self._stop_pump()
             
     def _drive_output(self, signum, frame):
-        """ Called by timer interrupt every alarmIntervalMS
+        """ SIGALRM handler, used when control_engine is "signal". """
+        self.tick()
+
+    def tick(self):
+        """ Called every alarm_interval seconds, by the control engine or timer interrupt.
     
             NB: conceptually based on adafruit arduino-based sous-vide controller
         """
@@ -390,25 +836,104 @@ class SousPi(object):
         if not self._init_complete:
             return
 
+        inst = self.instruments
+        t0 = inst.start()
+        with self._lock:
+            t1 = inst.stop("lock_wait", t0)
+            self._note_tick_time(self._clock())
+            self._control_tick()
+        if inst.stop("tick", t0) - t1 > self._alarm_interval > 0:
+            inst.count("tick_overruns")
+
+    def _note_tick_time(self, now):
+        """ Record how late this tick is relative to the last one, and dump timing if due. """
+        inst = self.instruments
+        inst.count("ticks")
+        if self._last_tick is not None and self._alarm_interval > 0:
+            late = now - self._last_tick - self._alarm_interval
+            inst.record("tick_lateness", max(late, 0.0))
+            if late >= self._alarm_interval:
+                inst.count("missed_ticks", int(late / self._alarm_interval))
+        self._last_tick = now
+
+        if self._timing_dump_interval > 0:
+            if self._last_timing_dump is None:
+                self._last_timing_dump = now
+            elif now >= self._last_timing_dump + self._timing_dump_interval:
+                self._last_timing_dump = now
+                self.dump_timing()
+
+    def dump_timing(self):
+        """ Write timing_stats to the timing file (in log_dir) and a summary to the log. """
+        logging.info("Control loop timing (%s):\n%s" % (self.name, self.instruments.summary()))
+        try:
+            atomic_file_write(self._timing_file, json.dumps(self.timing_stats),
+                              self._file_uid, self._file_gid)
+        except (OSError, IOError), e:
+            logging.error("Couldn't write timing stats to %s: %s" % (self._timing_file, e))
+
+    @property
+    def timing_stats(self):
+        """ Control-loop stage timings and counters (see Instrumentation), plus the 
+            engine's tick stats, as a dict. 
+        """
+        return {"name": self.name, "alarm_interval": self._alarm_interval,
+                "engine": self.engine_stats, "loop": self.instruments.as_dict()}
+
+    def _control_tick(self):
+        """ One pass of the control logic.  Callers must hold self._lock. """
+        inst = self.instruments
+
         # periodically check for new commands or setpoint changes (even if the PID is off)
-        if time.time() > self._last_command_check + self._command_check_interval:
+        #   - unnecessary when the watcher is telling us about them as they happen
+        if self._watcher is None and \
+                self._clock() > self._last_command_check + self._command_check_interval:
+            t0 = inst.start()
             self.process_commands()
+            inst.stop("process_commands", t0)
+
+        # sample inputs that can't tell us about edges, and confirm debounced changes
+        self._inputs.poll()
+
+        # write out any status change that was held back to coalesce it with others
+        t0 = inst.start()
+        self.status.flush()
+        inst.stop("status_flush", t0)
+
+        # durable copies of the state that has to survive a reboot, when they're due
+        if self._state is not None:
+            t0 = inst.start()
+            saved = self._state.checkpoint(self._clock())
+            inst.stop("checkpoint", t0)
+            if saved:
+                inst.count("checkpoint_writes", saved)
 
         # if the PID controller isn't actually doing anything, we're done
         if not self.PID_running:
+            # ... though with no cook to disturb, a new config can go in right away
+            if self._pending_config is not None:
+                self._apply_pending_config()
             return
 
         if not self.in_water:
-            #logging.ERROR("Turning self off due to lack of detected water.")
-            self._turn_off()
-            self.PID_running = False
+            # (normally _on_water_change() has already seen to this)
+            self._dry_shutdown()
             return
 
         ##### Remember: time math is in seconds, not ms
 
-        t1 = time.time()
+        if self._estimator is not None:
+            t0 = inst.start()
+            self._update_estimate()
+            inst.stop("estimate", t0)
+
+        t1 = self._clock()
         t2 = (self._window_start + self._on_time)
-        if time.time() <= (self._window_start + self._on_time):
+        if self._modulator is not None:
+            # switching is scheduled; this just catches up if we're ahead of its thread
+            #  (or switches on ticks, if there's no thread)
+            self._modulator.poll(t1)
+        elif t1 <= t2:
             if self._turn_on():
                 logging.debug("debugON: time.time() = %f" % t1)
                 logging.debug("debugON: (self._window_start + self._on_time) = %f " % t2)
@@ -419,29 +944,192 @@ class SousPi(object):
                 logging.debug("debugOFF: (self._window_start + self._on_time) = %f" % t2)
                 pass
         
-        if (time.time() + self._alarm_interval) > (self._window_start + self._window_size):
+        if (self._clock() + self._alarm_interval) > (self._window_start + self._window_size):
             # it's time to push the window down and refresh the PID
-            self._window_start = time.time()
+            self._window_start = self._clock()
+            inst.count("windows")
+
+            # a reloaded config goes in between windows, so no window straddles two
+            if self._pending_config is not None:
+                self._apply_pending_config()
 
             # we take this opportunity to make sure status is current
+            t0 = inst.start()
             self.status.refresh()
+            inst.stop("status_refresh", t0)
             
             if not self.p.manual_mode:
                 logging.debug("(p=%f, i=%d, d=%d)" % (self.p.Cp, self.p.Ci, self.p.Cd))
                 logging.debug("calling PID")
-            self._on_time = self.p.gen_out(self._get_temp()) / 1000.0
-            assert (self._on_time <= 10.0), "PID just produced an impossible output value"
+            t0 = inst.start()
+            if self._estimator is not None and self._estimator.ready:
+                # brought up to date at the top of this tick
+                pv = self._estimator.temperature
+            else:
+                pv = self._get_temp()
+            inst.stop("get_temp", t0)
+            self._setpoint_timer.update(pv, self.setpoint, self._clock())
+            t0 = inst.start()
+            self._on_time = self.p.gen_out(pv) / 1000.0
+            if self._heatup is not None and not self.p.manual_mode:
+                self._plan_heatup(pv)
+            inst.stop("gen_out", t0)
+            assert (self._on_time <= self._window_size), "PID just produced an impossible output value"
 
-            # log line reference: time, setpoint, current_temp, error, self._on_time, p, i, d
             if self.p.manual_mode:
-                logline = "%s, -, -, -, %.3f, -, -, -\n" % (time.time(), self._on_time)
                 logging.debug("in manual mode, self._on_time = %f" % self._on_time)
             else:            
-                logline = "%s, %.3f, %.3f, %.3f, %.3f, %f, %f, %f\n" % (time.time(), self.setpoint, self._get_temp(), self.setpoint - self._get_temp(), self._on_time, self.p.Cp, self.p.Ci, self.p.Cd)
-                logging.debug("error = %.3f, output = %.3f" % (self.setpoint - self._get_temp(), self._on_time))
+                logging.debug("error = %.3f, output = %.3f" % (self.setpoint - pv, self._on_time))
                 logging.debug("(p=%f, i=%d, d=%d)" % (self.p.Cp, self.p.Ci, self.p.Cd))
-            self._datalog(logline)        
+            t0 = inst.start()
+            self._log_window(pv)
+            self.history.record(self._clock(), pv, 
+                                None if self.p.manual_mode else self.setpoint,
+                                self._on_time / self._window_size, self._heated_this_window)
+            self._heated_this_window = self.heater_is_on
+            inst.stop("datalog", t0)
+            if self._heatup is not None:
+                self._heatup.record(self._window_start, self._on_time)
+            t0 = inst.start()
+            self._journal_window()
+            inst.stop("journal", t0)
+            if self._modulator is not None:
+                self._modulator.set_window(self._window_start, self._window_size, self._on_time)
+                self._modulator.poll(self._clock())
+
+    def _journal_note(self, **fields):
+        """ Record changed controller state in the journal (if there is one). """
+        if self._journal is None:
+            return
+        try:
+            written = self._journal.append(self._clock(), **fields)
+        except (OSError, IOError), e:
+            logging.error("Couldn't write to journal %s: %s" % (self._journal.path, e))
+            return
+        # the journal is appended every window, so it's checkpointed at the usual
+        # cadence - but a start or stop has to reach state_dir before a power cut can
+        # bring back a stale running: true
+        if written and "running" in fields and self._state is not None:
+            self._state.save(self._journal.path)
+
+    def _journal_window(self):
+        """ Record the control window that's just starting. """
+        self._journal_note(running=self.PID_running, window_start=self._window_start,
+                           on_time=self._on_time, manual=bool(self.p.manual_mode),
+                           integral=getattr(self.p, "Ci", None))
+
+    def _resume_from_journal(self):
+        """ Pick up control from the journal, if the last run was controlling recently.
+
+            The window phase and this window's output carry on as they were, and the
+            PID's integral is put back, so the first output after the restart matches
+            the last one before it.
+        """
+        if self._journal is None:
+            return
+        state = self._journal.replay()
+        now = self._clock()
+        if not state.get("running"):
+            return
+        age = now - state.get("time", now)
+        if not 0 <= age <= self._journal_max_age:
+            # a journal from the future means the clock came up behind (the Pi has no
+            # RTC), so there's no telling how long the bath has been sitting unheated
+            if age < 0:
+                logging.warning("Not resuming control: the journal is %ds in the future" % -age)
+            else:
+                logging.info("Not resuming control: the journal is %ds old" % age)
+            self._journal_note(running=False)
+            return
+        if self.setpoint is None and state.get("setpoint") is not None:
+            try:
+                self.setpoint = state["setpoint"]
+            except SousPiError, e:
+                logging.error("Not resuming control: %s" % e)
+                self._journal_note(running=False)
+                return
+
+        # a tune that was cut short left the PID in manual, with nothing worth keeping
+        if state.get("autotune"):
+            logging.warning("Auto-tune was interrupted by the restart; not resuming it.")
+            self._journal_note(autotune=False)
+        elif not state.get("manual"):
+            if state.get("integral") is not None and hasattr(self.p, "Ci"):
+                self.p.Ci = state["integral"]
+            if state.get("window_start") is not None:
+                # the window we'd be in by now, had we kept going
+                start = state["window_start"]
+                if now > start:
+                    start += ((now - start) // self._window_size) * self._window_size
+                self._window_start = start
+            self._on_time = min(state.get("on_time") or 0.0, self._window_size)
+
+        try:
+            self.start()
+        except SousPiError, e:
+            # e.g. no setpoint, in the journal or the setpoint file: come up idle
+            logging.error("Not resuming control: %s" % e)
+            self._journal_note(running=False)
+            return
+        if not self.PID_running:
+            return
+        logging.info("Resumed control from %s (%ds old)" % (self._journal.path, age))
+        if self._modulator is not None:
+            self._modulator.set_window(self._window_start, self._window_size, self._on_time)
+
+    def _on_water_change(self, port, level):
+        """ Input watcher callback for the water sensor (maybe on another thread). """
+        with self._lock:
+            if not level and self.PID_running:
+                self._dry_shutdown()
+            elif self.status is not None:
+                self.status.refresh()
+
+    def _dry_shutdown(self):
+        """ The bath has run dry (or the controller's out of the water): stop now. """
+        logging.error("Turning off due to lack of detected water.")
+        self.stop()
+
+    def _update_estimate(self):
+        """ Bring the temperature estimate up to now, with any new reading. """
+        self._get_temp()
+        now = self._clock()
+        reading = None
+        if self._temp_readings != self._estimated_readings:
+            self._estimated_readings = self._temp_readings
+            reading = self._current_temp
+        elif self._current_temp is not None and self._estimated_time is not None and \
+                now - self._estimated_time >= self._reading_hold:
+            # the temperature file only changes when the reading does, so one that has
+            #  stood for a sample period is a fresh measurement of the same temperature -
+            #  without it, a plateau looks like no data and the estimate coasts on its rate
+            reading = self._current_temp
+        if reading is not None:
+            self._estimated_time = now
+        self._estimator.step(now, self._on_time / self._window_size, reading)
+
+    def _plan_heatup(self, pv):
+        """ Let the heat-up controller override the PID's output for this window. """
+        hu = self._heatup
+        was_active = hu.active
+        on_time = hu.plan(pv, self.setpoint, self._window_start)
+        if on_time is not None:
+            self._on_time = on_time
+        elif was_active:
+            # bumpless handover: start the PID's integral at what it takes to hold the setpoint
+            hold = hu.model.steady_duty(self.setpoint) * self._window_size
+            if hasattr(self.p, "Ci"):
+                self.p.Ci = hold * 1000.0
+            self._on_time = hold
             
+    def _modulated_switch(self, on):
+        """ Heater switching from the OutputModulator (maybe on its own thread). """
+        with self._lock:
+            if on and self.PID_running:
+                self._turn_on()
+            else:
+                self._turn_off()
+
     def _turn_on(self):
         """ Ensure heating element is on.
     
@@ -450,7 +1138,9 @@ class SousPi(object):
         if (self.in_water is True) and (self.heater_is_on is False):
             logging.debug("turning heater on")
             self.heater_is_on = True
-            GPIO.output(self._output_control_port,1)
+            self._heated_this_window = True
+            self._gpio.output(self._output_control_port,1)
+            self.instruments.count("heater_toggles")
             return(1)
         return(0)
     
@@ -462,7 +1152,8 @@ class SousPi(object):
         if self.heater_is_on:
             logging.debug("turning heater off")
             self.heater_is_on = False
-            GPIO.output(self._output_control_port,0)
+            self._gpio.output(self._output_control_port,0)
+            self.instruments.count("heater_toggles")
             return(1)
         return(0)
     
@@ -494,14 +1185,69 @@ class SousPi(object):
 
         return(last_read, fdata)
     
+    def _get_temp_from_channel(self):
+        """ Update self._current_temp from the shared-memory channel, if we can.
+        
+            Returns True if the channel supplied a value (new or unchanged), and False if
+            the caller should fall back to the temperature file - either because there's
+            no channel configured, because the writer hasn't created it / published 
+            anything yet, because it can't be read, or because its last value is older than
+            temperature_channel_max_age (the writer publishes every sample, so it's died).
+        """
+        if self.temperature_channel_file is None:
+            return False
+        if self._temp_channel is None:
+            try:
+                self._temp_channel = TempChannel.TempChannelReader(self.temperature_channel_file)
+            except TempChannelError:
+                return False
+            logging.info("Reading temperature from channel %s" % self.temperature_channel_file)
+        try:
+            (val, ts, seq) = self._temp_channel.read()
+        except TempChannelError, e:
+            return self._channel_down(str(e))
+        if seq == 0:
+            return False
+        age = self._clock() - ts
+        if age > self._channel_max_age:
+            return self._channel_down("the last value in %s is %ds old" %
+                                      (self.temperature_channel_file, age))
+        if not self._channel_live:
+            self._channel_live = True
+            logging.info("Temperature channel %s is live" % self.temperature_channel_file)
+        if seq != self._last_temp_seq:
+            self._last_temp_seq = seq
+            self._current_temp = val
+            self._temp_readings += 1
+        return True
+
+    def _channel_down(self, why):
+        """ Switch (back) to the temperature file; returns False for _get_temp_from_channel. """
+        if self._channel_live:
+            self._channel_live = False
+            logging.warning("Falling back to %s: %s" % (self.temperature_file, why))
+            # read the file afresh, rather than keep the channel's last value
+            self._last_temp_read_time = 0
+        return False
+
     def _get_temp(self):
         """ Returns the current temp value (a/k/a PV). 
     
             side effect: updates self._current_temp
     
-            We expect the temp to be a single float in a file, e.g. as written by TempTracker.
+            If a temperature channel is configured and live, the value comes from there.
+            Otherwise, we expect the temp to be a single float in a file, e.g. as written 
+            by TempTracker.
             Note: raises BadTempValueError if file contents are not formatted as expected. 
         """
+        if self._temp_source is not None:
+            self._current_temp = self._temp_source.get_temperature()
+            self._temp_readings += 1
+            return self._current_temp
+
+        if self._get_temp_from_channel():
+            return self._current_temp
+
         try:
             (self._last_temp_read_time, tdata) = self._read_file_if_newer(self.temperature_file, 
                                                                            self._last_temp_read_time)
@@ -517,6 +1263,7 @@ class SousPi(object):
             except ValueError, e:
                 raise BadTempValueError("Couldn't parse temperature from %s: %s" % (self.temperature_file, e.strerror))
             self._current_temp = tempval
+            self._temp_readings += 1
         
         return self._current_temp
 
@@ -585,20 +1332,69 @@ class SousPi(object):
                 raise ValueError("window_size must be positive")
             self._window_size = newval
 
+    def _set_control_engine(self, arg):
+        """ Choose what drives the control loop.
+        
+            "thread"   : a ControlEngine thread, with deadline scheduling and timing stats
+            "signal"   : (legacy) SIGALRM from an interval timer, handled on the main thread
+            "external" : nothing - the owner calls tick() (e.g. for simulation)
+        """
+        if arg not in ("thread", "signal", "external"):
+            raise ValueError("control_engine must be 'thread', 'signal' or 'external', not %s" % arg)
+        if self._engine is not None or self._alarm_interval:
+            # switching engines on the fly isn't supported
+            return
+        if self._shared_engine is not None:
+            self._engine = self._shared_engine
+            return
+        self._external_ticks = (arg == "external")
+        if arg == "signal":
+            signal.signal(signal.SIGALRM, self._drive_output)
+        elif arg == "thread":
+            self._engine = ControlEngine.ControlEngine(name="SousPiControl")
+
     def _set_alarm_interval(self, arg):
         """ Set the alarm interval, or change it if already set. 
         
             The alarm interval is the time interval (in seconds) on which we'll adjust 
             the output based on PID values.
             
-            This implicitly sets the interrupt timer.  If set to 0, the timer is disabled.
+            This implicitly sets the interrupt timer (or reschedules the control engine).
+            If set to 0, the timer is disabled.
         """
-        try:
-            signal.setitimer(signal.ITIMER_REAL, arg, arg)
-        except signal.ItimerError, e:
-            raise ValueError("Invalid timer value: %s" % e.strerror)
+        if self._external_ticks:
+            if arg < 0:
+                raise ValueError("Invalid timer value: %s" % arg)
+        elif self._engine is not None:
+            if arg < 0:
+                raise ValueError("Invalid timer value: %s" % arg)
+            if arg == 0:
+                if self._shared_engine is not None:
+                    self._engine.remove_task(self.name)
+                else:
+                    self._engine.stop()
+                self._engine_task = None
+            elif self._engine_task is not None:
+                self._engine.set_interval(self.name, arg)
+            else:
+                self._engine_task = self._engine.add_task(self.name, self.tick, arg, 
+                                                          self._phase * arg)
+                if self._shared_engine is None:
+                    self._engine.start()
+        else:
+            try:
+                signal.setitimer(signal.ITIMER_REAL, arg, arg)
+            except signal.ItimerError, e:
+                raise ValueError("Invalid timer value: %s" % e.strerror)
         self._alarm_interval = arg
 
+    @property
+    def engine_stats(self):
+        """ Timing stats (as a dict) for the control tick, or None with the signal engine. """
+        if self._engine is None:
+            return None
+        return self._engine.task_stats(self.name).as_dict()
+
     def command_loop(self):  # FIXME get real impl
         """Wait for commands from the UI"""
         print "starting command loop"
@@ -0,0 +1,189 @@
+#
+# Copyright 2014-2015 Joshua Heling <jrh@netfluvia.org>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+""" The controller's configuration, as a validated, immutable snapshot.
+
+    load() reads the whole config file at once and checks it, so a controller that's
+    reloading its config (see SousPi.reload_config()) either gets a complete, sane set
+    of values or keeps the one it has.  Only the HOT options can change while running;
+    the rest (ports, paths, the control engine, ...) need a restart.
+"""
+
+import collections
+import ConfigParser
+
+from souspi import HeatUp
+from souspi import *
+
+# (field, section, option, type)
+OPTIONS = (
+    ("control_engine", "PID Internals", "control_engine", str),
+    ("window_size", "PID Internals", "control_window_size", float),
+    ("alarm_interval", "PID Internals", "alarm_interval", float),
+    ("output_timing", "PID Internals", "output_timing", str),
+    ("min_on_time", "PID Internals", "min_on_time", float),
+    ("min_off_time", "PID Internals", "min_off_time", float),
+    ("burst_cycles", "PID Internals", "burst_cycles", int),
+    ("temperature_file", "general", "temperature_file", str),
+    ("temperature_channel", "general", "temperature_channel", str),
+    ("temperature_channel_max_age", "general", "temperature_channel_max_age", float),
+    ("setpoint_file", "general", "setpoint_file", str),
+    ("command_dir", "general", "command_dir", str),
+    ("log_dir", "general", "log_dir", str),
+    ("state_dir", "general", "state_dir", str),
+    ("debug_log_enabled", "general", "debug_log_enabled", bool),
+    ("datalog_records", "general", "datalog_records", int),
+    ("file_uid", "general", "file_uid", int),
+    ("file_gid", "general", "file_gid", int),
+    ("kp", "PID", "Kp", float),
+    ("ki", "PID", "Ki", float),
+    ("kd", "PID", "Kd", float),
+    ("at_temp_threshold", "PID", "at_temp_threshold", float),
+    ("at_temp_hysteresis", "PID", "at_temp_hysteresis", float),
+    ("at_temp_tolerance", "PID", "at_temp_tolerance", float),
+    ("output_control_port", "hardware", "output_control_port", int),
+    ("water_sensor_port", "hardware", "water_sensor_port", int),
+    ("water_sensor_debounce", "hardware", "water_sensor_debounce", float),
+    ("pump_control_port", "hardware", "pump_control_port", int),
+    ("autotune_noise_band", "AutoTune", "noise_band", float),
+    ("autotune_output_step", "AutoTune", "output_step", float),
+    ("autotune_lookback_sec", "AutoTune", "lookback_sec", float),
+    ("autotune_stable_time_goal", "AutoTune", "stable_time_goal", float),
+    ("autotune_stabilization_output", "AutoTune", "stablization_output", float),
+    ("autotune_max_attempts", "AutoTune", "max_attempts", int),
+    ("heatup_mode", "HeatUp", "heatup_mode", str),
+    ("heat_rate", "HeatUp", "heat_rate", float),
+    ("heat_loss", "HeatUp", "heat_loss", float),
+    ("ambient_temp", "HeatUp", "ambient_temp", float),
+    ("dead_time", "HeatUp", "dead_time", float),
+    ("max_overshoot", "HeatUp", "max_overshoot", float),
+    ("engage_band", "HeatUp", "engage_band", float),
+    ("handoff_band", "HeatUp", "handoff_band", float),
+    ("estimator", "Estimator", "estimator", str),
+    ("sensor_lag", "Estimator", "sensor_lag", float),
+    ("sensor_noise", "Estimator", "sensor_noise", float),
+    ("process_noise", "Estimator", "process_noise", float),
+    ("drift_noise", "Estimator", "drift_noise", float),
+    ("reading_hold", "Estimator", "reading_hold", float),
+    ("command_check_interval", "internal", "command_check_interval", float),
+    ("command_watch", "internal", "command_watch", str),
+    ("config_watch", "internal", "config_watch", bool),
+    ("status_min_interval", "internal", "status_min_interval", float),
+    ("status_file_name", "internal", "status_file_name", str),
+    ("start_file_name", "internal", "start_file_name", str),
+    ("stop_file_name", "internal", "stop_file_name", str),
+    ("control_socket_name", "internal", "control_socket_name", str),
+    ("setpoint_timer_file_name", "internal", "setpoint_timer_file_name", str),
+    ("history_file_name", "internal", "history_file_name", str),
+    ("timing_file_name", "internal", "timing_file_name", str),
+    ("timing_dump_interval", "internal", "timing_dump_interval", float),
+    ("state_sync_interval", "internal", "state_sync_interval", float),
+    ("journal_file_name", "internal", "journal_file_name", str),
+    ("journal_max_age", "internal", "journal_max_age", float),
+    ("journal_fsync", "internal", "journal_fsync", bool),
+)
+
+# what a running controller can pick up without a restart
+HOT = frozenset(("window_size", "alarm_interval", "min_on_time", "min_off_time",
+                 "burst_cycles", "kp", "ki", "kd",
+                 "at_temp_threshold", "at_temp_hysteresis", "at_temp_tolerance",
+                 "autotune_noise_band", "autotune_output_step", "autotune_lookback_sec",
+                 "autotune_stable_time_goal", "autotune_stabilization_output",
+                 "autotune_max_attempts", "command_check_interval", "status_min_interval",
+                 "timing_dump_interval", "heatup_mode", "heat_rate", "heat_loss",
+                 "ambient_temp", "dead_time", "max_overshoot", "engage_band", "handoff_band",
+                 "estimator", "sensor_lag", "sensor_noise", "process_noise", "drift_noise",
+                 "reading_hold",
+                 "state_sync_interval"))
+
+_getters = {str: ConfigParser.ConfigParser.get, float: ConfigParser.ConfigParser.getfloat,
+            int: ConfigParser.ConfigParser.getint, bool: ConfigParser.ConfigParser.getboolean}
+
+
+class SousPiConfig(collections.namedtuple("SousPiConfig", [o[0] for o in OPTIONS])):
+    """ One complete, checked set of controller settings.  See load(). """
+
+    __slots__ = ()
+
+    @classmethod
+    def load(cls, path, defaults):
+        """ Read path (with defaults as for ConfigParser) into a new SousPiConfig.
+
+            Raises ConfigError if an option is missing or malformed, or the values
+            don't make sense together.
+        """
+        cp = ConfigParser.ConfigParser(defaults)
+        try:
+            cp.read(path)
+            # a missing section is just all defaults (options without one still fail)
+            for section in set(o[1] for o in OPTIONS):
+                if not cp.has_section(section):
+                    cp.add_section(section)
+            values = [_getters[kind](cp, section, option) for (field, section, option, kind)
+                      in OPTIONS]
+        except (ConfigParser.Error, ValueError), e:
+            raise ConfigError("Bad configuration in %s: %s" % (path, e))
+        config = cls(*values)
+        config.validate()
+        return config
+
+    def validate(self):
+        if self.control_engine not in ("thread", "signal", "external"):
+            raise ConfigError("control_engine must be 'thread', 'signal' or 'external', not %s" %
+                              self.control_engine)
+        if self.command_watch not in ("auto", "inotify", "poll"):
+            raise ConfigError("command_watch must be 'auto', 'inotify' or 'poll', not %s" %
+                              self.command_watch)
+        if self.window_size <= 0:
+            raise ConfigError("control_window_size must be positive")
+        if not 0 < self.alarm_interval <= self.window_size:
+            raise ConfigError("alarm_interval must be positive and no longer than "
+                              "control_window_size")
+        if self.output_timing not in ("exact", "tick"):
+            raise ConfigError("output_timing must be 'exact' or 'tick', not %s" %
+                              self.output_timing)
+        if self.min_on_time + self.min_off_time > self.window_size:
+            raise ConfigError("min_on_time and min_off_time don't fit in control_window_size")
+        if self.burst_cycles < 1:
+            raise ConfigError("burst_cycles must be at least 1")
+        if self.heatup_mode not in HeatUp.MODES:
+            raise ConfigError("heatup_mode must be one of %s, not %s" %
+                              (", ".join(HeatUp.MODES), self.heatup_mode))
+        if self.heatup_mode != "off" and (self.heat_rate <= 0 or self.heat_loss <= 0):
+            raise ConfigError("heatup_mode %s needs a bath model: positive heat_rate and "
+                              "heat_loss" % self.heatup_mode)
+        if self.estimator not in ("off", "kalman"):
+            raise ConfigError("estimator must be 'off' or 'kalman', not %s" % self.estimator)
+        if self.estimator != "off" and self.sensor_noise <= 0:
+            raise ConfigError("the estimator needs a positive sensor_noise")
+        for name in ("kp", "ki", "kd", "at_temp_threshold", "at_temp_hysteresis",
+                     "at_temp_tolerance", "status_min_interval", "timing_dump_interval",
+                     "dead_time", "max_overshoot", "engage_band", "handoff_band",
+                     "min_on_time", "min_off_time", "sensor_lag", "sensor_noise",
+                     "process_noise", "drift_noise", "reading_hold", "water_sensor_debounce",
+                     "state_sync_interval", "journal_max_age", "temperature_channel_max_age"):
+            if getattr(self, name) < 0:
+                raise ConfigError("%s can't be negative" % name)
+        if self.command_check_interval <= 0:
+            raise ConfigError("command_check_interval must be positive")
+        ports = (self.output_control_port, self.water_sensor_port, self.pump_control_port)
+        if len(set(ports)) != len(ports):
+            raise ConfigError("output_control_port, water_sensor_port and pump_control_port "
+                              "must all be different")
+
+    def changes(self, other):
+        """ Names of the fields that differ between this config and other. """
+        return [f for f in self._fields if getattr(self, f) != getattr(other, f)]
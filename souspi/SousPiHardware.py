@@ -0,0 +1,253 @@
+#
+# Copyright 2014-2015 Joshua Heling <jrh@netfluvia.org>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+""" Hardware backends for the controller, real and simulated.
+
+    SousPi talks to its GPIO backend through the same (small) subset of the RPi.GPIO
+    module API it has always used, so on a Pi the backend is just the RPi.GPIO module
+    itself (see raspi_gpio()).  Off the Pi, SimulatedGPIO stands in for it, and a
+    SimulatedBath (driven by the simulated heater output) stands in for the temperature
+    sensor.  Both can run on a VirtualClock, so hours of cooking can be simulated in
+    seconds.
+"""
+
+import math
+import bisect
+
+from souspi import *
+
+def raspi_gpio():
+    """ Returns the RPi.GPIO module, raising HardwareError if it isn't available. """
+    try:
+        import RPi.GPIO
+    except (ImportError, RuntimeError), e:
+        raise HardwareError("RPi.GPIO is not available: %s" % e)
+    return RPi.GPIO
+
+
+class VirtualClock(object):
+    """ A clock that only moves when told to.
+
+        Instances are callable (like time.time), so they can be passed anywhere a clock
+        function is expected.
+    """
+
+    def __init__(self, start=0.0):
+        self._now = float(start)
+
+    def __call__(self):
+        return self._now
+
+    def time(self):
+        return self._now
+
+    def advance(self, dt):
+        if dt < 0:
+            raise ValueError("time only moves forward")
+        self._now += dt
+        return self._now
+
+    def sleep(self, dt):
+        self.advance(dt)
+
+
+class SimulatedGPIO(object):
+    """ In-memory stand-in for the parts of RPi.GPIO used by SousPi.
+
+        Outputs are remembered (and can be read back with input(), as on the real
+        thing).  Inputs read whatever was last given to set_input(); they default to low.
+        Edge detection works as in RPi.GPIO, except that callbacks run synchronously in
+        set_input() and bouncetime is ignored.
+    """
+
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    HIGH = 1
+    LOW = 0
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self):
+        self.mode = None
+        self.directions = {}
+        self.levels = {}
+        # number of times each output port changed level
+        self.transitions = {}
+        # port -> [edge, [callbacks], event seen since event_detected() was last asked]
+        self._events = {}
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setup(self, port, direction, pull_up_down=None, initial=None):
+        if self.mode is None:
+            raise RuntimeError("Please set pin numbering mode using GPIO.setmode()")
+        self.directions[port] = direction
+        if port not in self.levels:
+            if pull_up_down == self.PUD_UP:
+                self.levels[port] = self.HIGH
+            else:
+                self.levels[port] = self.LOW if initial is None else initial
+
+    def output(self, port, value):
+        if self.directions.get(port) != self.OUT:
+            raise RuntimeError("The GPIO channel has not been set up as an OUTPUT")
+        value = 1 if value else 0
+        if self.levels.get(port) != value:
+            self.transitions[port] = self.transitions.get(port, 0) + 1
+        self.levels[port] = value
+
+    def input(self, port):
+        if port not in self.directions:
+            raise RuntimeError("You must setup() the GPIO channel first")
+        return self.levels.get(port, self.LOW)
+
+    def set_input(self, port, value):
+        """ Simulate an external signal on an input port. """
+        value = 1 if value else 0
+        old = self.levels.get(port, self.LOW)
+        self.levels[port] = value
+        ev = self._events.get(port)
+        if ev is None or old == value:
+            return
+        if ev[0] == self.BOTH or ev[0] == (self.RISING if value else self.FALLING):
+            ev[2] = True
+            for callback in list(ev[1]):
+                callback(port)
+
+    def add_event_detect(self, port, edge, callback=None, bouncetime=None):
+        if self.directions.get(port) != self.IN:
+            raise RuntimeError("You must setup() the GPIO channel as an input first")
+        if port in self._events:
+            raise RuntimeError("Conflicting edge detection already enabled for this GPIO channel")
+        self._events[port] = [edge, [], False]
+        if callback is not None:
+            self.add_event_callback(port, callback)
+
+    def add_event_callback(self, port, callback, bouncetime=None):
+        if port not in self._events:
+            raise RuntimeError("Add event detection using add_event_detect first before "
+                               "adding a callback")
+        self._events[port][1].append(callback)
+
+    def remove_event_detect(self, port):
+        self._events.pop(port, None)
+
+    def event_detected(self, port):
+        ev = self._events.get(port)
+        if ev is None or not ev[2]:
+            return False
+        ev[2] = False
+        return True
+
+    def cleanup(self, channel=None):
+        """ Release channel (a pin or list of pins), or all of them. """
+        if channel is None:
+            self.directions = {}
+            self._events = {}
+            self.mode = None
+            return
+        for c in (channel if isinstance(channel, (list, tuple)) else [channel]):
+            self.directions.pop(c, None)
+            self._events.pop(c, None)
+
+
+class SimulatedBath(object):
+    """ First-order-plus-dead-time model of a water bath with an on/off heater.
+
+            tau * dT/dt = gain * u(t - dead_time) - (T - ambient)
+
+        where u is 1 when the heater is on and 0 otherwise.  gain is how far above ambient
+        the bath would eventually settle with the heater on full time, time_constant (tau)
+        how quickly it gets there, and dead_time how long the probe takes to notice the
+        heater.  heater is a function returning the heater state; clock a function
+        returning the (possibly virtual) current time.
+
+        get_temperature() mimics W1ThermSensor, so the model can be used anywhere a
+        sensor is, and quantizes to the sensor's resolution.
+    """
+
+    def __init__(self, heater, clock, initial=20.0, ambient=20.0, gain=80.0,
+                 time_constant=2400.0, dead_time=20.0, resolution=0.0625):
+        self._heater = heater
+        self._clock = clock
+        self.temperature = float(initial)
+        self.ambient = float(ambient)
+        self.gain = float(gain)
+        self.time_constant = float(time_constant)
+        self.dead_time = float(dead_time)
+        self.resolution = resolution
+
+        self._last_update = clock()
+        # heater history, as parallel lists of (time it changed, new state)
+        self._u_times = [self._last_update - self.dead_time]
+        self._u_states = [1 if heater() else 0]
+
+    def _delayed_heater(self, t):
+        """ Heater state as felt by the bath at time t (i.e. as of t - dead_time). """
+        i = bisect.bisect_right(self._u_times, t - self.dead_time) - 1
+        return self._u_states[max(i, 0)]
+
+    def advance(self, now=None):
+        """ Bring the model up to the current time.
+
+            The heater state is sampled at the end, and taken to apply from now on, so
+            call this right after the heater is switched.
+        """
+        if now is None:
+            now = self._clock()
+
+        t = self._last_update
+        while t < now:
+            # integrate exactly over stretches where the (delayed) input is constant
+            i = bisect.bisect_right(self._u_times, t - self.dead_time)
+            if i < len(self._u_times):
+                seg_end = min(now, self._u_times[i] + self.dead_time)
+            else:
+                seg_end = now
+            target = self.ambient + self.gain * self._delayed_heater(t)
+            self.temperature = target + (self.temperature - target) * \
+                                    math.exp(-(seg_end - t) / self.time_constant)
+            t = seg_end
+        self._last_update = now
+
+        u = 1 if self._heater() else 0
+        if u != self._u_states[-1]:
+            self._u_times.append(now)
+            self._u_states.append(u)
+
+        # forget history that can no longer matter
+        cutoff = bisect.bisect_right(self._u_times, now - self.dead_time) - 1
+        if cutoff > 0:
+            del self._u_times[:cutoff]
+            del self._u_states[:cutoff]
+
+    def add_heat(self, delta):
+        """ Instantly change the bath temperature, e.g. to simulate cold food going in. """
+        self.advance()
+        self.temperature += delta
+
+    def get_temperature(self, unit=None):
+        self.advance()
+        if self.resolution:
+            return round(self.temperature / self.resolution) * self.resolution
+        return self.temperature
@@ -16,10 +16,16 @@
 
 import time
 import logging
+import threading
+import ConfigParser
 
 import Adafruit_CharLCD
 
 from souspi import SousPiUI
+from souspi import LCDInput
+from souspi import LCDFrame
+from souspi import SousPiHardware
+from souspi import *
 
 class LCDUI(SousPiUI.SousPiUIBase): 
     """ User interface for a 16x2 LCD + keypad module.
@@ -65,15 +71,18 @@ class LCDUI(SousPiUI.SousPiUIBase):
                Adafruit_CharLCD.DOWN, Adafruit_CharLCD.RIGHT)
     buttons = (SELECT, LEFT, UP, DOWN, RIGHT)
 
-    def __init__(self, backlight=True):
+    def __init__(self, backlight=True, cfgfile="/etc/souspi.cfg"):
         """ Set up the LCD and the order of its menu options. 
         
             By default, use background color as another status indicator.  Set backlight
             to False to avoid this.
         """
-        super(LCDUI, self).__init__()
+        super(LCDUI, self).__init__(cfgfile)
 
         self.lcd = Adafruit_CharLCD.Adafruit_CharLCDPlate()
+        # everything is drawn here, and sent to the LCD (changes only) by _get_button()
+        self.screen = LCDFrame.LCDFrame(self.lcd)
+        self._start_input(cfgfile)
 
         """ The menu is a list of tuples ("label", handler).  The label is displayed in the
             loop of menu choices, and the handler method is called if that choice is selected.
@@ -88,30 +97,62 @@ class LCDUI(SousPiUI.SousPiUIBase):
         self._menu_selection_timeout = 3  # in seconds
 
     def _message(self, arg):
-        self.lcd.message(arg)
+        self.screen.message(arg)
 
-    def _get_button(self, timeout=2):
-        """ Return the button being pressed, or None if no button was pressed in time. 
+    def _start_input(self, cfgfile):
+        """ Start reading the keypad in the background (see LCDInput). 
         
-            This will block indefinitely if timeout is set to None
+            If the LCD plate's interrupt line is wired to a GPIO pin (button_interrupt_port
+            in the [lcd] config section), the buttons are only read after it signals a 
+            change; otherwise they're polled.
         """
-        if timeout is not None:
-            end_time = time.time() + timeout
+        cp = ConfigParser.ConfigParser({'button_interrupt_port': '', 
+                                        'button_poll_interval': '0.05',
+                                        'button_debounce': '0.02', 
+                                        'button_repeat_delay': '0.5',
+                                        'button_repeat_interval': '0.15'})
+        cp.read(cfgfile)
+        if not cp.has_section("lcd"):
+            cp.add_section("lcd")
+
+        wakeup = None
+        port = cp.get("lcd", "button_interrupt_port")
+        if port:
+            try:
+                gpio = SousPiHardware.raspi_gpio()
+                if LCDInput.enable_plate_interrupt(self.lcd, self.buttons):
+                    wakeup = threading.Event()
+                    gpio.setmode(gpio.BCM)
+                    gpio.setup(int(port), gpio.IN, pull_up_down=gpio.PUD_UP)
+                    gpio.add_event_detect(int(port), gpio.FALLING, 
+                                          callback=lambda channel: wakeup.set())
+                    logging.info("Reading buttons on interrupt from GPIO %s" % port)
+            except HardwareError, e:
+                logging.error("Can't use button interrupt, polling instead: %s" % e.msg)
+                wakeup = None
+
+        self._input = LCDInput.ButtonInput(LCDInput.plate_reader(self.lcd, self.buttons),
+                        repeat_buttons=(self.UP, self.DOWN, self.LEFT, self.RIGHT),
+                        debounce=cp.getfloat("lcd", "button_debounce"),
+                        repeat_delay=cp.getfloat("lcd", "button_repeat_delay"),
+                        repeat_interval=cp.getfloat("lcd", "button_repeat_interval"),
+                        poll_interval=cp.getfloat("lcd", "button_poll_interval"),
+                        wakeup=wakeup)
+        self._input.start()
+
+    def _get_button(self, timeout=2):
+        """ Return the next button pressed, or None if no button was pressed in time. 
         
-        while True:
-            for i in range(10):
-                for b in self.buttons:
-                    if self.lcd.is_pressed(b):
-                        logging.debug("get_button sees %s pressed" % b)
-                        # wait for release (and for pin to return to normal)
-                        while self.lcd.is_pressed(b):
-                            time.sleep(0.01)
-                        return b
-            # only check to timeout every 10 times through the busy loop
-            if timeout is not None and time.time() - end_time > 0:
-                    logging.debug("get_button timed out")
-                    return None
-            time.sleep(0.1)
+            This will block indefinitely if timeout is set to None.  Whatever has been 
+            drawn so far is shown on the LCD first.
+        """
+        self.screen.flush()
+        b = self._input.get(timeout)
+        if b is None:
+            logging.debug("get_button timed out")
+        else:
+            logging.debug("get_button sees %s pressed" % b)
+        return b
 
     def _fmt_temp(self, arg, leadingZero = True):
         """ Return arg as string with at least 2 decimal digits.  By default 0-prepend 3 pre-point digits.
@@ -151,23 +192,26 @@ class LCDUI(SousPiUI.SousPiUIBase):
 
     def _draw_menu_item(self):
         """ Display the menu label for the currently selected item. """
-        self.lcd.clear()
+        self.screen.clear()
         self._message(self.menuitems[self._cur_menu][0])
 
     def blank(self):
         """ Clear and darken the screen. """
-        self.lcd.clear()
+        self.screen.clear()
+        self.screen.flush()
         self.lcd.set_backlight(0)
+        self.screen.invalidate()     # so the next set_color() turns the light back on
 
     def main_screen(self):
         """ Display the main screen, with current state values. """
         while True:
             self.status.refresh()
-            self.lcd.clear()
+            self.screen.clear()
             
             # set backlight color
             if self.status.error is True:
                 self._message("   Controller   \n     error.")
+                self.screen.flush()
                 time.sleep(10)
             else:
                 if self.status.running:
@@ -195,29 +239,29 @@ class LCDUI(SousPiUI.SousPiUIBase):
 
     def _screen_no_setpoint(self):
         # red if we have no setpoint
-        self.lcd.set_color(1.0, 0, 0)
+        self.screen.set_color(1.0, 0, 0)
         self._message("No target set.\n")            
         self._temp_line()
         
     def _screen_at_temp(self):
         # green if we're at temp
-        self.lcd.set_color(0, 1.0, 0)        
-        self._message("At temp.")
+        self.screen.set_color(0, 1.0, 0)        
         if self.status.time_at_setpoint is not None:
-            self._message("%s\n") % self.status.time_at_setpoint
+            # time_at_setpoint is in minutes
+            self._message("At temp. %3d:%02d\n" % divmod(self.status.time_at_setpoint, 60))
         else:
-            self._message("\n")
+            self._message("At temp.\n")
         self._temp_line()
     
     def _screen_heating_up(self):
         # yellow if we're heating up
-        self.lcd.set_color(1.0, 1.0, 0)
+        self.screen.set_color(1.0, 1.0, 0)
         self._message("Heating up.\n")    
         self._temp_line()        
 
     def _screen_not_running(self):
         # white if not running
-        self.lcd.set_color(1.0, 1.0, 1.0)
+        self.screen.set_color(1.0, 1.0, 1.0)
         self._message("Temp control off\n")    
         self._temp_line()        
 
@@ -248,7 +292,7 @@ class LCDUI(SousPiUI.SousPiUIBase):
     def do_start_stop(self):
         """ Toggle PID state. """
 
-        self.lcd.clear()
+        self.screen.clear()
 
         self._message("Controller %s\n" % ("on" if self.status.running else "off"))
         self._message("SELECT to %s." % ("stop" if self.status.running else "start"))
@@ -257,19 +301,16 @@ class LCDUI(SousPiUI.SousPiUIBase):
             if self.status.running:
                 self.stop()
             else:
-                self.start()
-                ## if we don't have water, the start attempt will fail - tell the user
-                ##
-                ## it is odd that we do this here rather than tell the user before they try to start
-                ##  in the first place.  There is an underlying issue (to be fixed) wherein the SousPi
-                ##  object doesn't update its "in_water" status when not running.
+                ## the controller keeps in_water current even while it's idle, so we can
+                ##  tell the user before trying rather than after the start fails
                 self.status.refresh()
                 if self.status.in_water is False:
-                    self.lcd.clear()
-                    self.lcd.set_cursor(0,0)
+                    self.screen.clear()
+                    self.screen.set_cursor(0,0)
                     self._message("Can't start\nwithout water.")
                     self._get_button(20)
                     return
+                self.start()
                 
         self.status.refresh()
         
@@ -283,8 +324,8 @@ class LCDUI(SousPiUI.SousPiUIBase):
         retry = True
         while retry is True:
             retry = False
-            self.lcd.clear()
-            self.lcd.set_color(0, 0, 1.0)
+            self.screen.clear()
+            self.screen.set_color(0, 0, 1.0)
         
             self._message("New setpoint:\n")
             if self.status.setpoint is not None:
@@ -293,7 +334,7 @@ class LCDUI(SousPiUI.SousPiUIBase):
                 sp_str = "000.00"
             dot_pos = 3  # we need to skip the dot when navigating around the string
 
-            self.lcd.blink(True)
+            self.screen.blink(True)
             # note: set_curson takes col, row - both are 0-indexed
 
             # use blinky cursor to indicate which char is selected for change
@@ -302,9 +343,9 @@ class LCDUI(SousPiUI.SousPiUIBase):
             sel_char = 0
         
             while (True):
-                self.lcd.set_cursor(0,1)
+                self.screen.set_cursor(0,1)
                 self._message(sp_str)
-                self.lcd.set_cursor(sel_char,1)
+                self.screen.set_cursor(sel_char,1)
 
                 b = self._get_button(None)
                 if b == self.SELECT:
@@ -314,7 +355,7 @@ class LCDUI(SousPiUI.SousPiUIBase):
                     if (new_sp == self.status.setpoint):
                         break
                 
-                    self.lcd.set_cursor(7,1)
+                    self.screen.set_cursor(7,1)
                     self._message("Set?")
                     confb = self._get_button(None)
                     if confb == self.SELECT:
@@ -322,7 +363,7 @@ class LCDUI(SousPiUI.SousPiUIBase):
                         self.status.refresh()
                         break
                     else:
-                        self.lcd.set_cursor(0,0)
+                        self.screen.set_cursor(0,0)
                         self._message("Up to cancel\nDown to retry")
                         cancelretry = self._get_button(None)
                         if cancelretry == self.UP:
@@ -358,10 +399,10 @@ class LCDUI(SousPiUI.SousPiUIBase):
                     newstr = sp_str[:sel_char] + str(c) + sp_str[sel_char+1:]
                     sp_str = newstr
 
-        self.lcd.blink(False)
+        self.screen.blink(False)
             
         
     def do_about(self):
-        self.lcd.clear()
+        self.screen.clear()
         self._message("proto UI v0.1")
         self._get_button(None)
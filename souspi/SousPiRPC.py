@@ -0,0 +1,305 @@
+#
+# Copyright 2014-2015 Joshua Heling <jrh@netfluvia.org>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+""" Local control/status API for the controller, over a Unix domain socket.
+
+    The protocol is one JSON object per line in each direction.  Requests look like
+
+        {"cmd": "setpoint", "value": 56.5}
+        {"cmd": "start"}
+        {"cmd": "stop"}
+        {"cmd": "status"}
+        {"cmd": "history", "start": 1420000000, "end": null, "max_points": 500}
+        {"cmd": "stats"}
+        {"cmd": "subscribe"}
+
+    and each gets exactly one reply, sent once the command has been carried out:
+
+        {"ok": true, "status": {...}}
+        {"ok": false, "error": "Setpoint must be positively signed and non-zero"}
+
+    where status is the same set of values as in the status file.  Replies to "history"
+    also carry a "history" object (see History.History.as_json_dict()), and replies to 
+    "stats" a "stats" object with control loop timings (see SousPi.timing_stats).  After replying to
+    "subscribe", the server keeps the connection open and sends a
+    {"event": "status", "status": {...}} line every time the status changes.
+"""
+
+import os
+import json
+import math
+import errno
+import socket
+import logging
+import threading
+import Queue
+import SocketServer
+
+from souspi import *
+
+def _setpoint_value(value):
+    """ value as a finite float, or None if it isn't one (null, "hot", [56], nan...). """
+    if isinstance(value, bool):
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    if math.isnan(value) or math.isinf(value):
+        return None
+    return value
+
+class _Handler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        server = self.server
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            try:
+                req = json.loads(line)
+                cmd = req["cmd"]
+            except (ValueError, KeyError, TypeError):
+                self._send({"ok": False, "error": "malformed request"})
+                continue
+            if cmd == "subscribe":
+                self._subscribe()
+                return
+            self._send(server.dispatch(cmd, req))
+
+    def _send(self, obj):
+        self.wfile.write(json.dumps(obj, separators=(',', ':')) + "\n")
+        self.wfile.flush()
+
+    def _subscribe(self):
+        q = self.server.add_subscriber()
+        try:
+            self._send({"ok": True, "status": self.server.current_status()})
+            while True:
+                status = q.get()
+                if status is None:     # server shutting down
+                    return
+                self._send({"event": "status", "status": status})
+        except socket.error:
+            pass                       # client went away
+        finally:
+            self.server.remove_subscriber(q)
+
+
+class RPCServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """ Serves the control API for a SousPi controller on a Unix socket at path.
+
+        Commands are carried out with the controller's lock held, exactly as if they'd
+        come in via command files.  The socket is made group read/writable (and chowned,
+        if uid/gid are given) so UIs running as other users can connect.
+    """
+
+    daemon_threads = True
+
+    # status updates queued for a slow subscriber before we start dropping old ones
+    subscriber_queue_size = 16
+
+    def __init__(self, path, controller, uid=None, gid=None):
+        self.path = path
+        self._sp = controller
+        self._subscribers = []
+        self._sub_lock = threading.Lock()
+        self._thread = None
+
+        try:
+            os.unlink(path)        # stale socket from a previous run
+        except OSError, e:
+            if e.errno != errno.ENOENT:
+                raise
+        SocketServer.UnixStreamServer.__init__(self, path, _Handler)
+        os.chmod(path, 0660)
+        if uid is not None or gid is not None:
+            os.chown(path, -1 if uid is None else uid, -1 if gid is None else gid)
+
+        controller.status.listeners.append(self._status_changed)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="RPCServer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        try:
+            self._sp.status.listeners.remove(self._status_changed)
+        except ValueError:
+            pass
+        self.shutdown()
+        self.server_close()
+        with self._sub_lock:
+            for q in self._subscribers:
+                q.put(None)
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def current_status(self):
+        with self._sp._lock:
+            return self._sp.status.as_dict()
+
+    def dispatch(self, cmd, req):
+        """ Carry out one command, returning the reply. """
+        sp = self._sp
+        try:
+            with sp._lock:
+                if cmd == "setpoint":
+                    value = _setpoint_value(req.get("value"))
+                    if value is None:
+                        return {"ok": False, "error": "setpoint needs a number, not %s" %
+                                                     json.dumps(req.get("value"))}
+                    sp.setpoint = value
+                elif cmd == "start":
+                    sp.start()
+                elif cmd == "stop":
+                    sp.stop()
+                elif cmd == "history":
+                    return {"ok": True, "status": sp.status.as_dict(),
+                            "history": sp.history.as_json_dict(req.get("start"), req.get("end"),
+                                                               req.get("max_points"))}
+                elif cmd == "stats":
+                    return {"ok": True, "status": sp.status.as_dict(), "stats": sp.timing_stats}
+                elif cmd != "status":
+                    return {"ok": False, "error": "unknown command %s" % cmd}
+                return {"ok": True, "status": sp.status.as_dict()}
+        except SousPiError, e:
+            return {"ok": False, "error": str(e)}
+        except Exception, e:
+            # a reply, rather than a dropped connection that sends clients to the files
+            logging.exception("RPC %s failed" % cmd)
+            return {"ok": False, "error": "%s failed: %s" % (cmd, e)}
+
+    def add_subscriber(self):
+        q = Queue.Queue(self.subscriber_queue_size)
+        with self._sub_lock:
+            self._subscribers.append(q)
+        return q
+
+    def remove_subscriber(self, q):
+        with self._sub_lock:
+            if q in self._subscribers:
+                self._subscribers.remove(q)
+
+    def _status_changed(self, status):
+        """ Status listener: pass the new status on to subscribers, without blocking. """
+        with self._sub_lock:
+            for q in self._subscribers:
+                while True:
+                    try:
+                        q.put_nowait(status)
+                        break
+                    except Queue.Full:
+                        try:
+                            q.get_nowait()       # drop the oldest update
+                        except Queue.Empty:
+                            pass
+
+
+class RPCClient(object):
+    """ Talks to an RPCServer.
+
+        Raises RPCUnavailableError if the controller can't be reached (so callers can fall
+        back to command files), and RPCError if it refused a command.
+    """
+
+    def __init__(self, path, timeout=5.0):
+        self.path = path
+        self.timeout = timeout
+
+    def _connect(self):
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.settimeout(self.timeout)
+        try:
+            s.connect(self.path)
+        except socket.error, e:
+            s.close()
+            raise RPCUnavailableError("Can't connect to controller at %s: %s" % (self.path, e))
+        return s
+
+    @staticmethod
+    def _read_reply(f):
+        line = f.readline()
+        if not line:
+            raise RPCUnavailableError("Controller closed the connection")
+        return json.loads(line)
+
+    def call(self, cmd, **args):
+        """ Send one command and return the resulting status (a dict). """
+        return self.request(cmd, **args)["status"]
+
+    def request(self, cmd, **args):
+        """ Send one command and return the whole reply. """
+        req = dict(args)
+        req["cmd"] = cmd
+        s = self._connect()
+        try:
+            f = s.makefile("rw")
+            try:
+                f.write(json.dumps(req) + "\n")
+                f.flush()
+                reply = self._read_reply(f)
+            except socket.error, e:
+                raise RPCUnavailableError("Lost connection to controller: %s" % e)
+            finally:
+                f.close()
+        finally:
+            s.close()
+        if not reply.get("ok"):
+            raise RPCError(reply.get("error", "unknown error"))
+        return reply
+
+    def set_setpoint(self, value):
+        return self.call("setpoint", value=value)
+
+    def start(self):
+        return self.call("start")
+
+    def stop(self):
+        return self.call("stop")
+
+    def status(self):
+        return self.call("status")
+
+    def history(self, start=None, end=None, max_points=None):
+        return self.request("history", start=start, end=end, max_points=max_points)["history"]
+
+    def stats(self):
+        return self.request("stats")["stats"]
+
+    def subscribe(self):
+        """ Yields the current status, and then each new status as it's published.
+
+            The connection has no timeout while waiting for updates.
+        """
+        s = self._connect()
+        try:
+            f = s.makefile("rw")
+            f.write(json.dumps({"cmd": "subscribe"}) + "\n")
+            f.flush()
+            reply = self._read_reply(f)
+            if not reply.get("ok"):
+                raise RPCError(reply.get("error", "unknown error"))
+            yield reply["status"]
+            s.settimeout(None)
+            while True:
+                yield self._read_reply(f)["status"]
+        finally:
+            s.close()
@@ -14,7 +14,9 @@
 #    limitations under the License.
 #
 
+import os
 import json
+import time
 import logging
 
 from souspi import *
@@ -27,11 +29,25 @@ class SousPiStatus(object):
         
         From the client/UI side, we use the class to read the file and get a status object.
         In this case, spobj and tofile are meaningless, but fromfile is required.
+
+        On the controller side, the file is only rewritten when the status has actually
+        changed, and changes arriving less than min_interval seconds after the last write
+        are coalesced: they're held back until flush() is called after the interval is up
+        (the controller calls it on every tick).  Each write bumps version, which is
+        included in the file so readers can cheaply tell whether anything is new.  It
+        starts past both the startup time (in ms) and the version in any status file
+        left behind, so it doesn't go backwards when the controller restarts.  Functions
+        in listeners are called with the new status (as a dict) after each write.
+
+        On the reader side, refresh() only re-reads the file if it has been replaced since
+        the last read (judging by its inode, mtime and size - the controller always writes
+        a new file and renames it into place), so polling an idle controller is cheap.
     """
     
-    status_items = ("temp", "setpoint", "running", "in_water", "time_at_setpoint", "PID_p", "PID_i", "PID_d", "error")
+    status_items = ("temp", "setpoint", "running", "in_water", "time_at_setpoint", "PID_p", "PID_i", "PID_d", "error",
+                    "temp_estimate", "temp_rate", "temp_variance")
 
-    def __init__(self, spobj=None, tofile=None, fromfile=None):
+    def __init__(self, spobj=None, tofile=None, fromfile=None, min_interval=0, clock=time.time):
         self._sp = spobj
         self.fromfile = fromfile
         self.tofile = tofile
@@ -40,23 +56,36 @@ class SousPiStatus(object):
         self.file_gid = None
         
         self.error = False
+
+        self.version = None
+        self.min_interval = min_interval
+        self._clock = clock
+        self._last_written = None     # snapshot of status_items values as last written
+        self._last_write_time = None
+        self._pending = False
+        self.listeners = []
+        self._file_key = None         # (inode, mtime, size) of fromfile when last read
         
         if self._sp is not None:
             self._refresh_from_obj()
         elif self.fromfile is not None:
             # might raise StatusFileError - we're letting that propagate on purpose
+            key = self._stat_fromfile()
             self.from_JSON()
+            self._file_key = key
         else:
             # debug mock for dev purposes # FIXME REMOVE
             self.temp = 26.3
             self.setpoint = 32.0
             self.running = False
             self.in_water = False
-            #self.time_at_setpoint = FIXME - IMPLEMENT
-            self.time_at_setpoint = None # FIXME along with above line
+            self.time_at_setpoint = None
             self.PID_p = 174.81
             self.PID_i = 29.80
             self.PID_d = 256.32
+            self.temp_estimate = None
+            self.temp_rate = None
+            self.temp_variance = None
     
     def _refresh_from_obj(self):
         """ Update status attributes based on attached SousPi object. """
@@ -68,11 +97,13 @@ class SousPiStatus(object):
             self.setpoint = self._sp.setpoint
             self.running = self._sp.PID_running
             self.in_water = self._sp.in_water
-            #self.time_at_setpoint = FIXME - IMPLEMENT
-            self.time_at_setpoint = None # FIXME along with above line
+            self.time_at_setpoint = self._sp.time_at_setpoint
             self.PID_p = self._sp.p.Kp
             self.PID_i = self._sp.p.Ki
             self.PID_d = self._sp.p.Kd
+            self.temp_estimate = self._sp.temp_estimate
+            self.temp_rate = self._sp.temp_rate
+            self.temp_variance = self._sp.temp_variance
     
     @staticmethod
     def _as_value_object(obj):
@@ -80,37 +111,116 @@ class SousPiStatus(object):
         dict = {}
         for i in obj.status_items:
             dict[i] = getattr(obj,i)
+        dict["version"] = obj.version
         return dict
     
+    def as_dict(self):
+        """ The current status values (and version) as a dict. """
+        if self._sp is not None:
+            self._refresh_from_obj()
+        return self._as_value_object(self)
+
+    def update_from_dict(self, status_vals):
+        """ Set status values from a dict (e.g. from the controller), missing ones to None. """
+        for i in self.status_items:
+            if status_vals.has_key(i):
+                setattr(self, i, status_vals[i])
+            else:
+                setattr(self, i, None)
+        self.version = status_vals.get("version")
+
     def to_JSON(self):
-        return json.dumps(self, default=self._as_value_object, sort_keys=True, indent=4)
+        return json.dumps(self, default=self._as_value_object, sort_keys=True, separators=(',', ':'))
+
+    def _snapshot(self):
+        return tuple(getattr(self, i) for i in self.status_items)
     
     def write_status_file(self):
+        """ Unconditionally write the current status (as a new version). """
         self._refresh_from_obj()
+        if self.version is None:
+            self.version = self._first_version()
+        self.version += 1
         atomic_file_write(self.tofile, self.to_JSON(), self.file_uid, self.file_gid)
+        self._last_written = self._snapshot()
+        self._last_write_time = self._clock()
+        self._pending = False
+        if self.listeners:
+            vals = self._as_value_object(self)
+            for listener in self.listeners:
+                listener(vals)
+
+    def _first_version(self):
+        """ Where this controller's versions start; see the class docstring. """
+        version = int(self._clock() * 1000)
+        try:
+            with open(self.tofile) as f:
+                version = max(version, int(json.load(f).get("version") or 0))
+        except (IOError, OSError, ValueError, TypeError, AttributeError):
+            pass
+        return version
+
+    def _publish(self):
+        """ Write the status if it has changed, unless we wrote too recently. """
+        if self._snapshot() == self._last_written:
+            self._pending = False
+            return
+        if self._last_write_time is not None and \
+                self._clock() < self._last_write_time + self.min_interval:
+            self._pending = True
+            return
+        self.write_status_file()
+
+    def flush(self, force=False):
+        """ Write any change held back by coalescing, once min_interval has passed.
+        
+            With force, write it now regardless.
+        """
+        if not self._pending:
+            return
+        if force or self._clock() >= self._last_write_time + self.min_interval:
+            self._refresh_from_obj()
+            if self._snapshot() != self._last_written:
+                self.write_status_file()
+            self._pending = False
 
     def refresh(self):
         """ Get the most current data into the status object/file. 
         
             If we're tied to an object (i.e. when SousPiStatus is connected to a controller), update 
-            the fields from correspdonding object properties and write a fresh status file.  If
-            we're getting data from a file (i.e. we're a UI), update the object from the file.
+            the fields from correspdonding object properties and (if anything changed - see 
+            above) write a fresh status file.  If we're getting data from a file (i.e. we're a 
+            UI), update the object from the file.
             
             On error, status values are all set to None and the 'error' member to True.
         """
         if self._sp is not None:
             self._refresh_from_obj()
-            self.write_status_file()
+            self._publish()
         elif self.fromfile is not None:
             try:
+                key = self._stat_fromfile()
+                if key is not None and key == self._file_key and not self.error:
+                    return                    # same file as last time
                 self.from_JSON()
             except StatusFileError, e:
                 for i in self.status_items:   # status read failed, so current status vals are wrong
                     setattr(self, i, None)
+                self.version = None
+                self._file_key = None
                 self.error = True
             else:
+                self._file_key = key
                 if self.error:
                     self.error = False
+
+    def _stat_fromfile(self):
+        """ Returns a key that changes whenever fromfile is replaced, or None if it's missing. """
+        try:
+            st = os.stat(self.fromfile)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime, st.st_size)
         
     def from_JSON(self):
         """ Read status from fromfile, setting missing values to None. """
@@ -130,11 +240,7 @@ class SousPiStatus(object):
                 fromfp.close()
             
         if status_vals is not None:
-            for i in self.status_items:
-                if status_vals.has_key(i):
-                    setattr(self, i, status_vals[i])
-                else:
-                    setattr(self, i, None)
+            self.update_from_dict(status_vals)
         else:
             raise StatusFileError("Didn't find any status in file %s" % self.fromfile)
     
\ No newline at end of file
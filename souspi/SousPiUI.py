@@ -15,18 +15,26 @@
 #
 
 import time
+import logging
+import threading
 
 import ConfigParser
 
 import SousPiStatus
+import SousPiRPC
 from souspi import *
 
 class SousPiUIBase(object):
     
     def __init__(self, cfgfile="/etc/souspi.cfg"):
-        """docstring for __init__"""
+        """ Set up communication with the controller described by cfgfile.
         
-        cp = ConfigParser.ConfigParser()
+            Commands go over the controller's control socket when it's available, and
+            get an immediate, confirmed result.  Otherwise we fall back to dropping 
+            command files and waiting for the controller to notice them.
+        """
+        
+        cp = ConfigParser.ConfigParser({'control_socket_name': 'control.sock'})
         cp.read(cfgfile)  
         self.setpoint_file = cp.get("general", "setpoint_file")
         self.cmd_start_file = cp.get("general", "command_dir") + "/" \
@@ -38,6 +46,11 @@ class SousPiUIBase(object):
                                     + cp.get("internal", "status_file_name")
 
         self._command_check_interval = cp.getfloat("internal", "command_check_interval")
+        if cp.get("internal", "control_socket_name"):
+            self._rpc = SousPiRPC.RPCClient(cp.get("general", "command_dir") + "/" \
+                                            + cp.get("internal", "control_socket_name"))
+        else:
+            self._rpc = None
         self.at_temp_threshold = cp.getfloat("PID", "at_temp_threshold")
         # this could raise an exception if the file is missing / bad
         try:
@@ -49,11 +62,37 @@ class SousPiUIBase(object):
             self.status.fromfile = self.status_file
             self.status.error = True
     
+    def _rpc_call(self, cmd, **args):
+        """ Send a command over the control socket, updating self.status from the reply.
+        
+            Returns False if the socket transport isn't available (so the caller should use
+            command files instead), and True if the command was carried out.  Raises 
+            RPCError if the controller refused it.
+        """
+        if self._rpc is None:
+            return False
+        try:
+            status = self._rpc.call(cmd, **args)
+        except RPCUnavailableError, e:
+            logging.debug("Falling back to command files: %s" % e)
+            return False
+        self.status.update_from_dict(status)
+        self.status.error = False
+        return True
+
     def change_setpoint(self, arg):
         """ Change the setpoint of the connected SousPi controller.
         
-            This is done by updating the control file shared with the controller.
+            This is done over the control socket if possible, or else by updating the 
+            control file shared with the controller.
         """
+        try:
+            if self._rpc_call("setpoint", value=float(arg)):
+                return
+        except ValueError:
+            raise ImpossibleSetpointError("Can't convert %s to a float to use as setpoint." % arg)
+        except RPCError, e:
+            raise ImpossibleSetpointError(str(e))
         try:
             atomic_file_write(self.setpoint_file, arg)
         except OSError, e:
@@ -63,15 +102,46 @@ class SousPiUIBase(object):
             time.sleep(self._command_check_interval)  # same rationale as in start()
             
     def start(self):
+        try:
+            if self._rpc_call("start"):
+                return
+        except RPCError, e:
+            raise SetpointNotSetError(str(e))
         atomic_file_write(self.cmd_start_file, None)
         ## it might take the controller this long to pick up on our change.  Waiting here is better than confusing 
         ##   the user with what would look like a failed change that later worked.
         time.sleep(self._command_check_interval)
     
     def stop(self):
+        if self._rpc_call("stop"):
+            return
         atomic_file_write(self.cmd_stop_file, None)
         time.sleep(self._command_check_interval)  # same rationale as in start()
         
+    def history(self, start=None, end=None, max_points=None):
+        """ Temperature history from the controller (see History), or None if it can't be 
+            reached over the control socket.
+        """
+        if self._rpc is None:
+            return None
+        try:
+            return self._rpc.history(start, end, max_points)
+        except RPCUnavailableError, e:
+            logging.debug("No history available: %s" % e)
+            return None
+
+    def stats(self):
+        """ Control loop timing stats from the controller, or None if it can't be reached
+            over the control socket.
+        """
+        if self._rpc is None:
+            return None
+        try:
+            return self._rpc.stats()
+        except RPCUnavailableError, e:
+            logging.debug("No stats available: %s" % e)
+            return None
+
     # here to remind subclasses that they should implement this
     def runloop(self):
         # runloop should include calls to self.status.refresh() before getting new values
@@ -118,9 +188,69 @@ class SousPiCLI(SousPiUIBase):
                 continue   
 
 class SousPiWebUI(SousPiUIBase):
-    """ Core logic to be wrapped by a simple Flask app. """
+    """ Core logic to be wrapped by a simple Flask app. 
+    
+        The status file is only re-read when the controller has replaced it (see 
+        SousPiStatus.refresh()), however many requests ask for it.  For streaming 
+        clients, a single background thread checks for a new status every poll_interval
+        seconds and wakes everyone waiting in wait_for_change().
+    """
+
+    def __init__(self, cfgfile="/etc/souspi.cfg", poll_interval=0.5):
+        super(SousPiWebUI, self).__init__(cfgfile)
+        self.poll_interval = poll_interval
+        self._changed = threading.Condition()
+        self._watcher = None
+        self._stop_watching = threading.Event()
+
     @property
     def current_status(self):
-        self.status.refresh()
+        with self._changed:
+            self.status.refresh()
         return self.status
+
+    def status_dict(self):
+        """ The current status, as a dict (with version; None while there's an error). """
+        with self._changed:
+            self.status.refresh()
+            return self.status.as_dict()
+
+    def wait_for_change(self, version, timeout=None):
+        """ Return the status (as from status_dict()) once its version differs from version.
+        
+            Returns None if there's no change within timeout seconds.
+        """
+        self._start_watcher()
+        end = None if timeout is None else time.time() + timeout
+        with self._changed:
+            while self.status.version == version:
+                remaining = None if end is None else end - time.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._changed.wait(remaining)
+            return self.status.as_dict()
+
+    def _start_watcher(self):
+        with self._changed:
+            if self._watcher is not None:
+                return
+            self._watcher = threading.Thread(target=self._watch_status, name="StatusWatcher")
+            self._watcher.daemon = True
+            self._watcher.start()
+
+    def _watch_status(self):
+        while not self._stop_watching.is_set():
+            with self._changed:
+                before = self.status.version
+                self.status.refresh()
+                if self.status.version != before:
+                    self._changed.notify_all()
+            self._stop_watching.wait(self.poll_interval)
+
+    def close(self):
+        """ Stop the status watcher thread, if it's running. """
+        self._stop_watching.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
     
@@ -0,0 +1,137 @@
+#
+# Copyright 2014-2015 Joshua Heling <jrh@netfluvia.org>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+""" Durable copies of the few state files that have to survive a reboot.
+
+    The status, command, temperature and setpoint files change all the time.  On an
+    SD card, every one of those rewrites costs flash wear and the odd long stall, so
+    they're best kept in a RAM-backed directory (command_dir on tmpfs, e.g. /run).
+    Only a handful of them matter after a reboot: the setpoint and the time at
+    setpoint.  A StateStore keeps copies of just those in a directory on persistent
+    storage.  It writes a copy out (with fsync) only when the file has changed, and
+    no more often than once per interval - except for "urgent" files, like the
+    setpoint, which go out on the next checkpoint() after whoever rewrote them says so
+    with changed().  (checkpoint() runs every control tick, so it doesn't stat files
+    between intervals to find out for itself.)  When a tracked file is missing
+    (as everything in tmpfs is, after a reboot), track() puts the saved copy back.
+
+    Everything that reads and writes the hot files carries on using them as before.
+"""
+
+import os
+import time
+import logging
+
+from souspi.util import atomic_file_write
+from souspi import *
+
+class StateStore(object):
+    """ Checkpoints tracked files into directory; see the module docstring. """
+
+    def __init__(self, directory, interval=60.0, clock=time.time, uid=None, gid=None):
+        self.directory = directory
+        self.interval = interval
+        self._clock = clock
+        self._uid = uid
+        self._gid = gid
+        self._tracked = {}          # hot path -> [durable path, urgent, key when last saved]
+        self._last_checkpoint = None
+        self._dirty = set()         # urgent files rewritten since the last checkpoint
+        self.writes = 0
+
+    def durable_path(self, path):
+        return os.path.join(self.directory, os.path.basename(path))
+
+    def track(self, path, urgent=False):
+        """ Checkpoint path from now on, first restoring it if it's missing.  Returns
+            True if it was restored.
+        """
+        durable = self.durable_path(path)
+        self._tracked[path] = [durable, urgent, None]
+        if os.path.exists(path) or not os.path.exists(durable):
+            return False
+        try:
+            with open(durable) as f:
+                data = f.read()
+            atomic_file_write(path, data, self._uid, self._gid)
+        except (OSError, IOError), e:
+            logging.error("Couldn't restore %s from %s: %s" % (path, durable, e))
+            return False
+        logging.info("Restored %s from %s" % (path, durable))
+        self._tracked[path][2] = self._key(path)
+        return True
+
+    @staticmethod
+    def _key(path):
+        """ Changes whenever path is rewritten (they're always replaced by a rename). """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime, st.st_size)
+
+    def changed(self, path):
+        """ Note that path has just been rewritten: if it's urgent, the next checkpoint()
+            saves it.
+        """
+        entry = self._tracked.get(path)
+        if entry is not None and entry[1]:
+            self._dirty.add(path)
+
+    def checkpoint(self, now=None, force=False):
+        """ Save tracked files that have changed: urgent ones marked by changed() now, 
+            everything if interval has passed since the last time (or with force).
+            Returns how many were saved.
+        """
+        if now is None:
+            now = self._clock()
+        due = force or self._last_checkpoint is None or \
+                now >= self._last_checkpoint + self.interval
+        if not (due or self._dirty):
+            return 0
+        saved = 0
+        for (path, entry) in self._tracked.items():
+            if (due or path in self._dirty) and self._save(path, entry):
+                saved += 1
+        self._dirty.clear()
+        if due:
+            self._last_checkpoint = now
+        return saved
+
+    def save(self, path):
+        """ Checkpoint just path, now, urgent or not; for the odd change to a busy file
+            that can't wait for the next interval.  Returns True if it was saved.
+        """
+        if path not in self._tracked:
+            return False
+        return self._save(path, self._tracked[path])
+
+    def _save(self, path, entry):
+        """ Write path's durable copy if it has changed since the last one. """
+        (durable, urgent, last) = entry
+        key = self._key(path)
+        if key is None or key == last:
+            return False
+        try:
+            with open(path) as f:
+                data = f.read()
+            atomic_file_write(durable, data, self._uid, self._gid, fsync=True)
+        except (OSError, IOError), e:
+            logging.error("Couldn't checkpoint %s to %s: %s" % (path, durable, e))
+            return False
+        entry[2] = key
+        self.writes += 1
+        return True
@@ -0,0 +1,138 @@
+#
+# Copyright 2014-2015 Joshua Heling <jrh@netfluvia.org>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+""" Shared-memory channel for passing the current temperature between processes.
+
+    The channel is a small file, mapped into memory by both the writer (TempTracker)
+    and the reader (the SousPi controller).  It holds a single fixed-size record:
+
+        magic (4s) | format version (I) | sequence (Q) | value (d) | timestamp (d)
+
+    Updates are guarded by a seqlock: the writer bumps the sequence number to an odd
+    value, writes the value and timestamp, and then bumps it to the next even value.
+    A reader that sees an odd sequence number, or a sequence number that changed while
+    it was reading, just tries again.  Once both sides have the file mapped, neither
+    publishing nor reading a value needs a system call.
+"""
+
+import os
+import mmap
+import struct
+import time
+
+from souspi import *
+
+MAGIC = b"SPTC"
+FORMAT_VERSION = 1
+
+_header = struct.Struct("<4sI")
+_seq = struct.Struct("<Q")
+_payload = struct.Struct("<dd")
+
+_SEQ_OFFSET = _header.size
+_PAYLOAD_OFFSET = _SEQ_OFFSET + _seq.size
+RECORD_SIZE = _PAYLOAD_OFFSET + _payload.size
+
+class TempChannelWriter(object):
+    """ Publishes temperature values into a channel file, creating it if needed. """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0644)
+        except OSError, e:
+            raise TempChannelError("Couldn't open channel %s: %s" % (path, e.strerror))
+        try:
+            if os.fstat(fd).st_size != RECORD_SIZE:
+                os.ftruncate(fd, RECORD_SIZE)
+            self._map = mmap.mmap(fd, RECORD_SIZE, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)
+
+        (magic, version) = _header.unpack_from(self._map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            # new (or foreign) file - start fresh
+            self._map[:] = b"\0" * RECORD_SIZE
+            _header.pack_into(self._map, 0, MAGIC, FORMAT_VERSION)
+            self._seq = 0
+        else:
+            # keep counting from where a previous writer left off, so readers never see
+            #  the sequence go backwards.  Round up in case it died mid-update.
+            self._seq = _seq.unpack_from(self._map, _SEQ_OFFSET)[0]
+            self._seq += self._seq & 1
+            _seq.pack_into(self._map, _SEQ_OFFSET, self._seq)
+
+    def publish(self, value, timestamp=None):
+        """ Make value (a float) the current temperature. """
+        if timestamp is None:
+            timestamp = time.time()
+        _seq.pack_into(self._map, _SEQ_OFFSET, self._seq + 1)
+        _payload.pack_into(self._map, _PAYLOAD_OFFSET, float(value), timestamp)
+        self._seq += 2
+        _seq.pack_into(self._map, _SEQ_OFFSET, self._seq)
+
+    def close(self):
+        self._map.close()
+
+
+class TempChannelReader(object):
+    """ Reads the current temperature from a channel file written by TempChannelWriter. """
+
+    # how many times to retry a read that raced with the writer before giving up
+    max_retries = 100
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError, e:
+            raise TempChannelError("Couldn't open channel %s: %s" % (path, e.strerror))
+        try:
+            if os.fstat(fd).st_size < RECORD_SIZE:
+                raise TempChannelError("Channel %s is too short to be valid" % path)
+            self._map = mmap.mmap(fd, RECORD_SIZE, mmap.MAP_SHARED, mmap.PROT_READ)
+        finally:
+            os.close(fd)
+
+        (magic, version) = _header.unpack_from(self._map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self._map.close()
+            raise TempChannelError("%s is not a temperature channel (or is an unknown version)" % path)
+
+    def read(self):
+        """ Returns a (value, timestamp, sequence) tuple.
+
+            sequence is 0 (and value/timestamp are meaningless) if nothing has been
+            published yet.  Raises TempChannelError if a consistent record couldn't be
+            read in max_retries attempts.
+        """
+        for i in xrange(self.max_retries):
+            s1 = _seq.unpack_from(self._map, _SEQ_OFFSET)[0]
+            if s1 & 1:
+                continue        # writer is mid-update
+            (value, timestamp) = _payload.unpack_from(self._map, _PAYLOAD_OFFSET)
+            s2 = _seq.unpack_from(self._map, _SEQ_OFFSET)[0]
+            if s1 == s2:
+                return (value, timestamp, s1)
+        raise TempChannelError("Couldn't get a consistent read from %s" % self.path)
+
+    @property
+    def sequence(self):
+        """ The current sequence number - cheap way to see if there's anything new. """
+        return _seq.unpack_from(self._map, _SEQ_OFFSET)[0]
+
+    def close(self):
+        self._map.close()
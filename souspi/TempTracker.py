@@ -22,13 +22,20 @@
 
 import os
 import sys
+import time
+import json
+import logging
 import tempfile
+import collections
+import multiprocessing.pool
 from w1thermsensor import W1ThermSensor
 
+from souspi import TempChannel
+
 class TempTrackerError(Exception):
     """ Exception base class. """
-    def __init__(self):
-        self.msg = ''
+    def __init__(self, msg=''):
+        self.msg = msg
     def __str__(self):
         return self.msg
 
@@ -40,16 +47,199 @@ class TempTrackerFileUpdateFailed(TempTrackerError):
     def __init__(self, msg):
         self.msg = msg
 
+class TempTrackerBadResolution(TempTrackerError):
+    def __init__(self, msg):
+        self.msg = msg
+
+# DS18B20 worst-case conversion time (in s) at each resolution (in bits)
+CONVERSION_TIME = {9: 0.09375, 10: 0.1875, 11: 0.375, 12: 0.75}
+# ...and the size of one step (in degrees C)
+RESOLUTION_STEP = {9: 0.5, 10: 0.25, 11: 0.125, 12: 0.0625}
+
+class AdaptiveResolution(object):
+    """ Decides which sensor resolution to use, based on how fast the temperature is moving.
+    
+        While the temperature changes faster than fast_rate (degrees/s), we want quick, 
+        coarse readings (fast_resolution); once it has slowed below slow_rate, slow and 
+        precise ones (slow_resolution).
+
+        The rate is the change over the last <span> seconds, and it's only ever measured
+        at slow_resolution: at 9 bits a steady heat-up reads as a flat line between 0.5
+        degree steps, which says nothing about how fast it's going.  So after <hold>
+        seconds at fast_resolution we go back to slow_resolution for another look, and 
+        drop the resolution again unless the temperature has slowed below slow_rate.
+        Only a change bigger than one step of the resolution counts as movement.
+    """
+
+    def __init__(self, fast_rate=0.05, slow_rate=0.01, fast_resolution=9, slow_resolution=12,
+                 span=10.0, hold=60.0):
+        if slow_rate > fast_rate:
+            raise ValueError("slow_rate must not be more than fast_rate")
+        self.fast_rate = fast_rate
+        self.slow_rate = slow_rate
+        self.fast_resolution = fast_resolution
+        self.slow_resolution = slow_resolution
+        self.span = span
+        self.hold = hold
+        self._samples = collections.deque()
+        self._coarse_until = None
+        self._rechecking = False
+        self.resolution = slow_resolution
+        self.rate = None        # degrees/s, as last measured
+
+    def update(self, t, val):
+        """ Add a sample (taken at the resolution last returned); returns the resolution
+            that should be used from now on.
+        """
+        if self.resolution == self.fast_resolution:
+            if t < self._coarse_until:
+                return self.resolution
+            self.resolution = self.slow_resolution
+            self._rechecking = True
+            return self.resolution
+
+        self._samples.append((t, val))
+        while len(self._samples) > 2 and self._samples[1][0] <= t - self.span:
+            self._samples.popleft()
+        (t0, v0) = self._samples[0]
+        if t - t0 < self.span:
+            return self.resolution
+        self.rate = (val - v0) / (t - t0)
+
+        # still moving faster than we can put down to quantization?
+        moving = (abs(val - v0) - RESOLUTION_STEP[self.resolution]) / (t - t0)
+        if moving > (self.slow_rate if self._rechecking else self.fast_rate):
+            self.resolution = self.fast_resolution
+            self._coarse_until = t + self.hold
+            self._samples.clear()
+        self._rechecking = False
+        return self.resolution
+
+def _check_writable(dir):
+    """ Make sure we can write in directory, raise TempTrackerDirNotWritable if not. """
+    try:
+        (t, tnam) = tempfile.mkstemp(dir=dir)
+        os.close(t)
+        os.unlink(tnam)
+    except OSError:
+        raise TempTrackerDirNotWritable(dir)
+
+def _write_value_file(dir, fname, val):
+    """ Atomically (via a rename) replace dir/fname with str(val). """
+    (tmp_fh, tmp_name) = tempfile.mkstemp(dir=dir)
+    os.write(tmp_fh,bytes(val))
+    os.close(tmp_fh)
+    newname = os.path.normpath(dir + "/" + fname)
+    try:
+        os.rename(tmp_name, newname)
+    except OSError, e:
+        os.unlink(tmp_name)
+        msg = "Failed to update %s: %s" % (newname, e.strerror)
+        raise TempTrackerFileUpdateFailed(msg)
+
 class TempTracker(W1ThermSensor):
     """ Track temperature of a DS18B20 in a file. """
     
-    def __init__(self, dir, unit=W1ThermSensor.DEGREES_C, fname="temptracker.dat"):
-        """docstring for __init__"""
+    def __init__(self, dir, unit=W1ThermSensor.DEGREES_C, fname="temptracker.dat", channel=None, 
+                 write_file=True, resolution=None, interval=None, adaptive=None):
+        """ Track the sensor's temperature in dir/fname.
+        
+            If channel is the path of a shared-memory channel file (see TempChannel), values
+            are also published there.  Set write_file to False to only publish to the channel.
+
+            resolution (9-12 bits) is set on the sensor if given; otherwise the sensor's own
+            setting is left alone.  interval is the target time (in s) between samples - by 
+            default we sample back to back.  adaptive, if given, is an AdaptiveResolution
+            that picks the resolution as we go (overriding resolution).
+        """
         self._unit = unit
         super(TempTracker, self).__init__()
         self._last_val = None
         self.directory = dir
         self.filename = fname
+        self.write_file = write_file
+        self._channel = None
+        if channel is not None:
+            self._channel = TempChannel.TempChannelWriter(channel)
+
+        self.interval = interval
+        self.adaptive = adaptive
+        self._resolution = None
+        if adaptive is not None:
+            resolution = adaptive.resolution
+        if resolution is not None:
+            self.resolution = resolution
+
+        self._started = None
+        self._samples = 0
+        self._last_sample_time = None
+        self._last_conversion_time = None
+        self._sample_rate = None      # smoothed samples/s
+
+    @property
+    def resolution(self):
+        """ Sensor resolution in bits, or None if we've left it at the sensor's setting. """
+        return self._resolution
+
+    @resolution.setter
+    def resolution(self, bits):
+        """ Set the sensor's resolution (9-12 bits).
+        
+            Raises TempTrackerBadResolution if bits is out of range or the sensor 
+            couldn't be configured.
+        """
+        if bits not in CONVERSION_TIME:
+            raise TempTrackerBadResolution("Resolution must be 9-12 bits, not %s" % bits)
+        try:
+            if hasattr(self, "set_precision"):
+                self.set_precision(bits)    # newer w1thermsensor releases
+            else:
+                # the w1_therm driver takes the resolution as a write to w1_slave
+                with open(self.sensorpath, "w") as f:
+                    f.write("%d\n" % bits)
+        except (IOError, OSError) as e:
+            raise TempTrackerBadResolution("Couldn't set resolution to %d bits: %s" % (bits, e))
+        self._resolution = bits
+        logging.info("Sensor resolution set to %d bits" % bits)
+
+    @property
+    def sample_stats(self):
+        """ How sampling is going: a dict with samples taken, achieved rate (samples/s, 
+            smoothed and overall), time taken by the last conversion, and current 
+            resolution and rate of temperature change (if adapting).
+        """
+        overall = None
+        if self._samples > 1 and self._last_sample_time > self._started:
+            overall = (self._samples - 1) / (self._last_sample_time - self._started)
+        return {"samples": self._samples,
+                "sample_rate": self._sample_rate,
+                "overall_sample_rate": overall,
+                "last_conversion_time": self._last_conversion_time,
+                "resolution": self._resolution,
+                "rate_of_change": self.adaptive.rate if self.adaptive is not None else None}
+
+    def _record_sample(self, started, finished, val):
+        """ Update sampling stats, and the resolution if we're adapting it. """
+        if self._started is None:
+            self._started = started
+        elif started > self._last_sample_time:
+            rate = 1.0 / (started - self._last_sample_time)
+            if self._sample_rate is None:
+                self._sample_rate = rate
+            else:
+                self._sample_rate += 0.1 * (rate - self._sample_rate)
+        self._samples += 1
+        self._last_sample_time = started
+        self._last_conversion_time = finished - started
+
+        if self.adaptive is not None:
+            wanted = self.adaptive.update(finished, val)
+            if wanted != self._resolution:
+                try:
+                    self.resolution = wanted
+                except TempTrackerBadResolution, e:
+                    logging.error("%s - no longer adapting resolution" % e)
+                    self.adaptive = None
 
     @property
     def directory(self):
@@ -58,13 +248,8 @@ class TempTracker(W1ThermSensor):
     @directory.setter
     def directory(self, dir):
         """ Make sure we can write in directory, raise TempTrackerDirNotWritable if not. """
-        try:
-            (t, tnam) = tempfile.mkstemp(dir=dir)
-            os.close(t)
-            os.unlink(tnam)
-            self._directory = dir
-        except OSError:
-            raise TempTrackerDirNotWritable(dir)
+        _check_writable(dir)
+        self._directory = dir
     
     @property
     def unit(self):
@@ -86,24 +271,168 @@ class TempTracker(W1ThermSensor):
         
     def _commit_value(self, val):
         """ Atomically commit new temp value. """
-        (tmp_fh, tmp_name) = tempfile.mkstemp(dir=self.directory)
-        os.write(tmp_fh,bytes(val))
-        os.close(tmp_fh)
-        newname = os.path.normpath(self._directory + "/" + self.filename)
-        #print "writing %s to %s" % (val, newname)
-        try:
-            os.rename(tmp_name, newname)
-        except OSError, e:
-            os.unlink(tmp_name)
-            msg = "Failed to update %s: %s" % (newname, e.strerror)
-            raise TempTrackerFileUpdateFailed(msg)
+        if self._channel is not None:
+            self._channel.publish(val)
+        if self.write_file:
+            self._commit_to_file(val)
+
+    def _commit_to_file(self, val):
+        """ Atomically (via a rename) write the new temp value to the tracking file. """
+        _write_value_file(self._directory, self.filename, val)
         
+    def close(self):
+        """ Let go of the channel, if there is one. """
+        if self._channel is not None:
+            self._channel.close()
+            self._channel = None
+
     def runloop(self):
-        """ Loop indefinitely, updating temp value as it changes. """
+        """ Loop indefinitely, publishing every sample to the channel (if any) and
+            updating the file as the value changes.
+        
+            With an interval set, samples are started on a fixed schedule; if a sample
+            runs late, the schedule restarts from then rather than trying to catch up.
+        """
+        next_sample = time.time()
         while True:
+            started = time.time()
             current_val = self.get_temperature(self.unit)
+            finished = time.time()
+            # the channel gets every sample (a store to shared memory), so a reader can tell
+            #  a steady temperature from a dead tracker; the file only changes with the value
+            if self._channel is not None:
+                self._channel.publish(current_val, finished)
             if current_val != self._last_val:
-                self._commit_value(current_val)
+                if self.write_file:
+                    self._commit_to_file(current_val)
                 self._last_val = current_val
+            self._record_sample(started, finished, current_val)
+
+            if self.interval:
+                next_sample += self.interval
+                delay = next_sample - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_sample = time.time()
     
     
+
+
+class MultiTempTracker(object):
+    """ Track the temperature of every DS18B20 on the 1-wire bus.
+
+        Each sweep reads all probes in (roughly) the time it takes to read one, either by
+        reading them in parallel from a pool of threads, or - if bulk is set and the 
+        kernel supports it - by starting one conversion on every probe at once via the 
+        bus master's therm_bulk_read and then collecting the results.
+
+        After each sweep, the {probe id: temperature} map is written as JSON to
+        dir/probes_fname (probes that couldn't be read are null).  The primary probe's 
+        value (by default, the first one found) is also tracked in dir/fname and the 
+        shared-memory channel exactly as TempTracker does, so the controller doesn't 
+        need to know there's more than one.
+    """
+
+    bulk_read_path = "/sys/bus/w1/devices/w1_bus_master1/therm_bulk_read"
+    devices_path = "/sys/bus/w1/devices"
+
+    def __init__(self, dir, unit=W1ThermSensor.DEGREES_C, fname="temptracker.dat", 
+                 probes_fname="probes.json", channel=None, write_file=True, sensor_ids=None,
+                 primary=None, interval=None, bulk=False):
+        _check_writable(dir)
+        self.directory = dir
+        self.filename = fname
+        self.probes_filename = probes_fname
+        self.write_file = write_file
+        self.unit = unit
+        self.interval = interval
+
+        if sensor_ids is None:
+            self.sensors = W1ThermSensor.get_available_sensors()
+        else:
+            self.sensors = [W1ThermSensor(W1ThermSensor.THERM_SENSOR_DS18B20, i) for i in sensor_ids]
+        if not self.sensors:
+            raise TempTrackerError("No DS18B20 probes found on the 1-wire bus")
+        ids = [x.id for x in self.sensors]
+        if primary is None:
+            primary = ids[0]
+        elif primary not in ids:
+            raise TempTrackerError("primary probe %s is not on the bus (found %s)" % (
+                                    primary, ", ".join(ids)))
+        self.primary = primary
+
+        self.bulk = bulk and os.path.exists(self.bulk_read_path)
+        if bulk and not self.bulk:
+            logging.warning("Bulk conversion isn't supported here; reading probes in parallel")
+        self._pool = multiprocessing.pool.ThreadPool(len(self.sensors))
+
+        self._channel = None
+        if channel is not None:
+            self._channel = TempChannel.TempChannelWriter(channel)
+
+        self._last_vals = None
+        self._last_primary = None
+        self.last_sweep_time = None
+
+        logging.info("Tracking %d probe(s): %s (primary: %s)" % (len(ids), ", ".join(ids), primary))
+
+    def _read_one(self, sensor):
+        """ Returns sensor's temperature, or None if it couldn't be read. """
+        try:
+            if self.bulk:
+                # after a bulk conversion, the temperature attribute just reports the result
+                with open(os.path.join(self.devices_path, sensor.slave_prefix + sensor.id, 
+                                       "temperature")) as f:
+                    celsius = int(f.read()) / 1000.0
+                return W1ThermSensor.UNIT_FACTORS[self.unit](celsius)
+            return sensor.get_temperature(self.unit)
+        except Exception, e:
+            logging.warning("Couldn't read probe %s: %s" % (sensor.id, e))
+            return None
+
+    def sweep(self):
+        """ Read every probe; returns {probe id: temperature (or None)}. """
+        started = time.time()
+        if self.bulk:
+            with open(self.bulk_read_path, "w") as f:
+                f.write("trigger\n")
+            # reads of the results block until the conversion is done
+        vals = self._pool.map(self._read_one, self.sensors)
+        self.last_sweep_time = time.time() - started
+        return dict(zip([x.id for x in self.sensors], vals))
+
+    def _commit_values(self, vals):
+        if vals != self._last_vals:
+            _write_value_file(self.directory, self.probes_filename, 
+                              json.dumps(vals, sort_keys=True, separators=(',', ':')))
+            self._last_vals = vals
+        primary = vals[self.primary]
+        if primary is not None and self._channel is not None:
+            # every sweep, as TempTracker does every sample
+            self._channel.publish(primary)
+        if primary is not None and primary != self._last_primary:
+            if self.write_file:
+                _write_value_file(self.directory, self.filename, primary)
+            self._last_primary = primary
+
+    def close(self):
+        """ Stop the reader threads, and let go of the channel. """
+        self._pool.close()
+        self._pool.join()
+        if self._channel is not None:
+            self._channel.close()
+            self._channel = None
+
+    def runloop(self):
+        """ Loop indefinitely, sweeping all probes and publishing what changed. """
+        next_sweep = time.time()
+        while True:
+            self._commit_values(self.sweep())
+            if self.interval:
+                next_sweep += self.interval
+                delay = next_sweep - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_sweep = time.time()
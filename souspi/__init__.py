@@ -15,6 +15,8 @@
 #
 
 from souspi.exceptions import SousPiError, BadTempValueError, SetpointFileError, \
-     StatusFileError, TemperatureFileError, SetpointNotSetError, ImpossibleSetpointError
+     StatusFileError, TemperatureFileError, SetpointNotSetError, ImpossibleSetpointError, \
+     TempChannelError, HardwareError, DataLogError, RPCError, RPCUnavailableError, \
+     TuningError, ConfigError
 
 from souspi.util import atomic_file_write
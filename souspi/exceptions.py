@@ -28,3 +28,31 @@ class SetpointNotSetError(SousPiError):
 class ImpossibleSetpointError(SousPiError):
     def __init__(self, msg):
         self.msg = msg
+
+class TempChannelError(SousPiError):
+    def __init__(self, msg):
+        self.msg = msg
+
+class HardwareError(SousPiError):
+    def __init__(self, msg):
+        self.msg = msg
+
+class DataLogError(SousPiError):
+    def __init__(self, msg):
+        self.msg = msg
+
+class RPCError(SousPiError):
+    def __init__(self, msg):
+        self.msg = msg
+
+class RPCUnavailableError(SousPiError):
+    def __init__(self, msg):
+        self.msg = msg
+
+class TuningError(SousPiError):
+    def __init__(self, msg):
+        self.msg = msg
+
+class ConfigError(SousPiError):
+    def __init__(self, msg):
+        self.msg = msg
@@ -0,0 +1,135 @@
+#!/usr/bin/python
+
+import BathSupervisor
+import SousPiHardware
+import unittest
+import tempfile
+import shutil
+import time
+import os
+import ConfigParser
+
+class BathSupervisor_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.gpio = SousPiHardware.SimulatedGPIO()
+        self.temps = {}
+        self.sup = None
+
+    def tearDown(self):
+        if self.sup is not None:
+            self.sup.cleanup()
+        shutil.rmtree(self.dir)
+
+    def _bath_config(self, name, ports, extra=None):
+        """ Write a config for one bath, with its own directory (and any extra
+            {(section, option): value}), and return its path.
+        """
+        d = os.path.join(self.dir, name)
+        os.mkdir(d)
+        cfg = {
+            ("general", "command_dir"): d,
+            ("general", "temperature_file"): os.path.join(d, "temptracker.dat"),
+            ("general", "setpoint_file"): os.path.join(d, "spsetpoint"),
+            ("general", "log_dir"): d,
+            ("general", "file_uid"): os.getuid(),
+            ("general", "file_gid"): os.getgid(),
+            ("general", "debug_log_enabled"): "false",
+            ("PID", "Kp"): 174.81,
+            ("PID", "Ki"): 29.80,
+            ("PID", "Kd"): 256.32,
+            ("PID", "at_temp_threshold"): 0.5,
+            ("hardware", "output_control_port"): ports[0],
+            ("hardware", "water_sensor_port"): ports[1],
+            ("hardware", "pump_control_port"): ports[2],
+            ("AutoTune", "noise_band"): 1,
+            ("AutoTune", "output_step"): 50,
+            ("AutoTune", "lookback_sec"): 20,
+            ("AutoTune", "stable_time_goal"): 100,
+            ("AutoTune", "stablization_output"): 600,
+            ("PID Internals", "control_window_size"): 0.1,
+            ("PID Internals", "alarm_interval"): 0.02,
+            ("PID Internals", "control_engine"): "thread",
+            ("internal", "start_file_name"): "start",
+            ("internal", "stop_file_name"): "stop",
+            ("internal", "status_file_name"): "status",
+            ("internal", "command_check_interval"): 0.5,
+            ("internal", "command_watch"): "poll",
+            ("internal", "control_socket_name"): "",
+        }
+        cfg.update(extra or {})
+        cp = ConfigParser.RawConfigParser()
+        for ((section, option), value) in sorted(cfg.items()):
+            if not cp.has_section(section):
+                cp.add_section(section)
+            cp.set(section, option, str(value))
+        path = os.path.join(self.dir, name + ".cfg")
+        with open(path, "w") as f:
+            cp.write(f)
+        self.gpio.set_input(ports[1], 1)
+        self.temps[name] = SousPiHardware.SimulatedBath(
+                               lambda: self.gpio.levels.get(ports[0], 0), time.time)
+        return path
+
+    def test_staggered_baths(self):
+        cfgs = [self._bath_config("bath1", (23, 24, 17)), self._bath_config("bath2", (5, 6, 13))]
+        self.sup = BathSupervisor.BathSupervisor(cfgs, gpio=self.gpio, temp_sources=self.temps)
+        self.assertEquals(self.sup.baths.keys(), ["bath1", "bath2"])
+        self.assertEquals([t.offset for t in (self.sup["bath1"]._engine_task,
+                                              self.sup["bath2"]._engine_task)], [0.0, 0.01])
+        self.sup["bath1"].setpoint = 56.5
+        self.sup["bath1"].start()
+        self.sup.start()
+        time.sleep(0.3)
+        stats = self.sup.engine_stats()
+        self.assertTrue(stats["bath1"]["runs"] > 5 and stats["bath2"]["runs"] > 5)
+        # only bath1 was started, so only its heater comes on
+        self.assertTrue(self.gpio.transitions.get(23, 0) > 0)
+        self.assertEquals(self.gpio.transitions.get(5, 0), 0)
+        self.assertEquals(self.sup.status()["bath2"]["running"], False)
+
+    def test_cleanup_releases_own_pins(self):
+        cfgs = [self._bath_config("bath1", (23, 24, 17)), self._bath_config("bath2", (5, 6, 13))]
+        self.sup = BathSupervisor.BathSupervisor(cfgs, gpio=self.gpio, temp_sources=self.temps)
+        self.sup["bath1"].cleanup()
+        self.assertFalse(23 in self.gpio.directions)
+        self.assertTrue(5 in self.gpio.directions)
+
+    def test_port_conflict(self):
+        cfgs = [self._bath_config("bath1", (23, 24, 17)), self._bath_config("bath2", (5, 24, 13))]
+        self.assertRaises(ValueError, BathSupervisor.BathSupervisor, cfgs, gpio=self.gpio,
+                          temp_sources=self.temps)
+
+    def test_shared_log_and_state_dirs(self):
+        # as in the shipped config: one log_dir and one state_dir for everybody
+        shared = {("general", "log_dir"): os.path.join(self.dir, "log"),
+                  ("general", "state_dir"): os.path.join(self.dir, "state"),
+                  ("general", "debug_log_enabled"): "true"}
+        os.mkdir(os.path.join(self.dir, "log"))
+        os.mkdir(os.path.join(self.dir, "state"))
+        cfgs = [self._bath_config("bath1", (23, 24, 17), shared),
+                self._bath_config("bath2", (5, 6, 13), shared)]
+        self.sup = BathSupervisor.BathSupervisor(cfgs, gpio=self.gpio, temp_sources=self.temps)
+        (b1, b2) = (self.sup["bath1"], self.sup["bath2"])
+        self.assertEquals(b1._datalog.path, os.path.join(self.dir, "log", "bath1", "datalog.ring"))
+        self.assertEquals(b2._history_file, os.path.join(self.dir, "log", "bath2", "history.json"))
+        b1.setpoint = 56.5
+        b2.setpoint = 70.0
+        self.sup.cleanup()
+        self.sup = None
+        for (name, sp) in (("bath1", "56.5"), ("bath2", "70.0")):
+            with open(os.path.join(self.dir, "state", name, "spsetpoint")) as f:
+                self.assertEquals(f.read(), sp)
+
+    def test_file_conflict(self):
+        # separate command directories, but one setpoint file
+        sp_file = {("general", "setpoint_file"): os.path.join(self.dir, "spsetpoint")}
+        cfgs = [self._bath_config("bath1", (23, 24, 17), sp_file),
+                self._bath_config("bath2", (5, 6, 13), sp_file)]
+        self.assertRaises(ValueError, BathSupervisor.BathSupervisor, cfgs, gpio=self.gpio,
+                          temp_sources=self.temps)
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(BathSupervisor_Test)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,86 @@
+#!/usr/bin/python
+
+import Benchmark
+import SousPiHardware
+import unittest
+import tempfile
+import shutil
+import os
+
+class Benchmark_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_score(self):
+        # rises to 56.5, overshoots by 1, and is back within 0.5 at t=40
+        temps = [50.0, 54.0, 56.0, 57.5, 57.0, 56.8, 56.6, 56.5]
+        samples = [(i * 10.0, t, i % 2, 56.5) for (i, t) in enumerate(temps)]
+        (overshoot, settle, iae, toggles) = Benchmark.score(samples, 0.0, 0.5)
+        self.assertAlmostEqual(overshoot, 1.0)
+        self.assertEquals(settle, 40.0)
+        self.assertAlmostEqual(iae, 10 * sum(abs(56.5 - t) for t in temps[1:]))
+        self.assertEquals(toggles, 7)
+
+    def test_score_never_settles(self):
+        samples = [(i * 10.0, 50.0 + i, 0, 56.5) for i in range(5)]
+        self.assertEquals(Benchmark.score(samples, 0.0, 0.5)[1], None)
+
+    def test_compare(self):
+        base = Benchmark.BenchmarkResult("s", 1.0, 600.0, 1000.0, 100, 10, 0.001, 0.001, 0.01)
+        same = base._replace(iae=1040.0, cpu_per_tick=0.0012)
+        self.assertEquals(Benchmark.compare([same], [base]), [])
+        worse = base._replace(overshoot=1.5, settling_time=None, cpu_per_tick=0.002)
+        problems = Benchmark.compare([worse], [base])
+        self.assertEquals(len(problems), 3)
+        self.assertTrue(problems[0].startswith("s: overshoot"))
+
+    def test_results_roundtrip(self):
+        path = os.path.join(self.dir, "results.json")
+        r = [Benchmark.BenchmarkResult("s", 1.0, None, 1000.0, 100, 10, 0.001, 0.001, 0.01)]
+        Benchmark.save_results(path, r)
+        self.assertEquals(Benchmark.load_results(path), r)
+
+    def test_trace_replay(self):
+        clock = SousPiHardware.VirtualClock(100.0)
+        tr = Benchmark.TraceReplay([5000, 5010, 5020], [20.0, 21.0, 22.0], lambda: 0, clock)
+        self.assertEquals(tr.get_temperature(), 20.0)
+        clock.advance(15)
+        self.assertEquals(tr.get_temperature(), 21.0)
+        clock.advance(100)
+        self.assertEquals(tr.get_temperature(), 22.0)
+
+    def test_trace_scenario(self):
+        path = os.path.join(self.dir, "trace.csv")
+        with open(path, "w") as f:
+            f.write("time,setpoint,pv\n")
+            for i in range(60):
+                f.write("%d,%s,%f\n" % (1000 + 10 * i, 55.0 if i < 30 else 56.0, 54.0 + i / 30.0))
+        sc = Benchmark.trace_scenario(path)
+        self.assertEquals((sc.setpoint, sc.duration), (55.0, 590))
+        self.assertEquals([t for (t, e) in sc.events], [300])
+        r = Benchmark.run(sc)
+        self.assertEquals(r.ticks, 590)
+        self.assertTrue(r.tick_mean > 0)
+
+    def test_scenario_is_repeatable(self):
+        sc = Benchmark.Scenario("short", 56.5, 1200, initial=50.0)
+        (a, b) = (Benchmark.run(sc), Benchmark.run(sc))
+        self.assertEquals(a[:6], b[:6])
+        self.assertTrue(a.heater_toggles > 0)
+
+    def test_heatup_beats_pid(self):
+        # a quick bath, so this doesn't take long
+        sc = Benchmark.Scenario("quick", 56.5, 3600, initial=20.0, time_constant=600.0,
+                                gain=60.0)
+        pid = Benchmark.run(sc)
+        hu = Benchmark.run(sc, config=lambda s: Benchmark.heatup_config("predictive", s))
+        self.assertTrue(hu.settling_time < pid.settling_time)
+        self.assertTrue(hu.overshoot <= max(pid.overshoot, 1.0))
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(Benchmark_Test)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,56 @@
+#!/usr/bin/python
+
+import CommandWatcher
+import unittest
+import tempfile
+import threading
+import shutil
+import os
+
+from souspi import atomic_file_write
+
+class CommandWatcher_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.start_file = os.path.join(self.dir, "start")
+        self.setpoint_file = os.path.join(self.dir, "spsetpoint")
+        self.seen = set()
+        self.event = threading.Event()
+        self.w = None
+
+    def tearDown(self):
+        if self.w is not None:
+            self.w.stop()
+        shutil.rmtree(self.dir)
+
+    def _callback(self, changed):
+        self.seen.update(changed)
+        self.event.set()
+
+    def test_poll_method(self):
+        self.assertIsNone(CommandWatcher.create_watcher([self.start_file], self._callback, "poll"))
+
+    def test_bad_method(self):
+        with self.assertRaises(ValueError):
+            CommandWatcher.create_watcher([self.start_file], self._callback, "carrier-pigeon")
+
+    @unittest.skipUnless(CommandWatcher.inotify_available(), "no inotify")
+    def test_rename_into_place(self):
+        self.w = CommandWatcher.create_watcher([self.start_file, self.setpoint_file],
+                                               self._callback, "inotify")
+        atomic_file_write(self.setpoint_file, "55.5")
+        self.assertTrue(self.event.wait(2))
+        self.assertEquals(self.seen, set([self.setpoint_file]))
+
+    @unittest.skipUnless(CommandWatcher.inotify_available(), "no inotify")
+    def test_ignores_other_files(self):
+        self.w = CommandWatcher.create_watcher([self.start_file], self._callback, "inotify")
+        atomic_file_write(os.path.join(self.dir, "unrelated"), "x")
+        atomic_file_write(self.start_file, None)
+        self.assertTrue(self.event.wait(2))
+        self.assertEquals(self.seen, set([self.start_file]))
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(CommandWatcher_Test)
+    unittest.TextTestRunner(verbosity=2).run(suite)
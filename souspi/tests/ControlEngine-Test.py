@@ -0,0 +1,60 @@
+#!/usr/bin/python
+
+import ControlEngine
+import unittest
+import threading
+import time
+
+class ControlEngine_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = ControlEngine.ControlEngine()
+
+    def tearDown(self):
+        self.engine.stop()
+
+    def test_bad_interval(self):
+        with self.assertRaises(ValueError):
+            self.engine.add_task("t", lambda: None, 0)
+
+    def test_runs_on_schedule(self):
+        # a period well clear of scheduler noise, so a busy machine doesn't see overruns
+        self.engine.add_task("t", lambda: None, 0.05)
+        self.engine.start()
+        time.sleep(0.5)
+        self.engine.stop()
+        s = self.engine.task_stats("t")
+        self.assertTrue(8 <= s.runs <= 11, s.runs)
+        self.assertEquals(s.overruns, 0)
+        self.assertTrue(s.max_jitter >= 0)
+
+    def test_overrun_skips_missed_deadlines(self):
+        self.engine.add_task("slow", lambda: time.sleep(0.035), 0.01)
+        self.engine.start()
+        time.sleep(0.2)
+        self.engine.stop()
+        s = self.engine.task_stats("slow")
+        self.assertTrue(s.runs > 0)
+        self.assertEquals(s.overruns, s.runs)
+        self.assertTrue(s.missed >= 3 * s.runs)
+
+    def test_exception_does_not_stop_engine(self):
+        def boom():
+            raise RuntimeError("boom")
+        self.engine.add_task("boom", boom, 0.01)
+        self.engine.start()
+        time.sleep(0.05)
+        self.assertTrue(self.engine.task_stats("boom").runs > 1)
+
+    def test_set_interval(self):
+        done = threading.Event()
+        self.engine.add_task("t", done.set, 60)
+        self.engine.start()
+        done.wait(1)
+        done.clear()
+        self.engine.set_interval("t", 0.01)
+        self.assertTrue(done.wait(1))
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(ControlEngine_Test)
+    unittest.TextTestRunner(verbosity=2).run(suite)
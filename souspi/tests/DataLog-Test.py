@@ -0,0 +1,90 @@
+#!/usr/bin/python
+
+import DataLog
+import unittest
+import tempfile
+import shutil
+import math
+import os
+import StringIO
+
+from souspi import DataLogError
+
+class DataLog_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "datalog.ring")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _fill(self, log, n, start=0):
+        for i in range(start, start + n):
+            log.append(1000.0 + i, 56.5, 50.0 + i, 6.5 - i, 5.0, 1.0, 2.0, 3.0, i % 2)
+
+    def test_preallocated(self):
+        log = DataLog.RingDataLog(self.path, 10)
+        self.assertEquals(os.path.getsize(self.path),
+                          DataLog.HEADER_SIZE + 10 * DataLog.RECORD_SIZE)
+        self.assertEquals(len(DataLog.DataLogReader(self.path)), 0)
+
+    def test_roundtrip(self):
+        log = DataLog.RingDataLog(self.path, 10)
+        self._fill(log, 3)
+        recs = list(DataLog.DataLogReader(self.path).records())
+        self.assertEquals(len(recs), 3)
+        self.assertEquals(recs[1][:3], (1001.0, 56.5, 51.0))
+        self.assertEquals(recs[1][8], 1)
+
+    def test_wraps(self):
+        log = DataLog.RingDataLog(self.path, 10)
+        self._fill(log, 25)
+        r = DataLog.DataLogReader(self.path)
+        self.assertEquals(len(r), 10)
+        self.assertEquals([x[0] for x in r.records()], [1015.0 + i for i in range(10)])
+        self.assertEquals(os.path.getsize(self.path),
+                          DataLog.HEADER_SIZE + 10 * DataLog.RECORD_SIZE)
+
+    def test_reopen_appends(self):
+        log = DataLog.RingDataLog(self.path, 10)
+        self._fill(log, 4)
+        log.close()
+        log = DataLog.RingDataLog(self.path, 10)
+        self._fill(log, 2, start=4)
+        self.assertEquals([x[0] for x in DataLog.DataLogReader(self.path).records()],
+                          [1000.0 + i for i in range(6)])
+
+    def test_capacity_change_resets(self):
+        log = DataLog.RingDataLog(self.path, 10)
+        self._fill(log, 4)
+        log.close()
+        DataLog.RingDataLog(self.path, 20)
+        self.assertEquals(len(DataLog.DataLogReader(self.path)), 0)
+
+    def test_nan(self):
+        log = DataLog.RingDataLog(self.path, 10)
+        log.append(1.0, DataLog.NAN, 50.0, DataLog.NAN, 0.6, DataLog.NAN, DataLog.NAN,
+                   DataLog.NAN, False)
+        rec = list(DataLog.DataLogReader(self.path).records())[0]
+        self.assertTrue(math.isnan(rec[1]))
+        self.assertEquals(rec[2], 50.0)
+
+    def test_not_a_datalog(self):
+        with open(self.path, "w") as f:
+            f.write("time, setpoint\n" * 10)
+        with self.assertRaises(DataLogError):
+            DataLog.DataLogReader(self.path)
+
+    def test_csv(self):
+        log = DataLog.RingDataLog(self.path, 10)
+        self._fill(log, 2)
+        out = StringIO.StringIO()
+        DataLog.DataLogReader(self.path).export_csv(out)
+        lines = out.getvalue().splitlines()
+        self.assertEquals(lines[0], ",".join(DataLog.FIELDS))
+        self.assertEquals(lines[2], "1001.000,56.5,51,5.5,5,1,2,3,1")
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(DataLog_Test)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,116 @@
+#!/usr/bin/python
+
+import Estimator
+import HeatUp
+import Simulation
+import unittest
+import random
+
+class Estimator_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.rand = random.Random(1)
+
+    def test_nothing_until_first_reading(self):
+        est = Estimator.TempEstimator()
+        self.assertEquals(est.step(0.0, 0.5), None)
+        self.assertFalse(est.ready)
+        self.assertEquals(est.step(1.0, 0.5, 50.0), 50.0)
+        self.assertTrue(est.ready)
+        self.assertAlmostEqual(est.variance, 0.01)
+
+    def test_filters_noise(self):
+        est = Estimator.TempEstimator(sensor_noise=0.1)
+        for i in range(600):
+            est.step(float(i), 0.0, 50.0 + self.rand.gauss(0, 0.1))
+        self.assertAlmostEqual(est.temperature, 50.0, delta=0.1)
+        self.assertAlmostEqual(est.rate, 0.0, delta=0.002)
+        # much better than any single reading
+        self.assertTrue(est.variance < 0.1 ** 2 / 4)
+
+    def test_tracks_rate(self):
+        est = Estimator.TempEstimator(sensor_noise=0.05)
+        for i in range(600):
+            est.step(float(i), 0.0, 20.0 + 0.01 * i + self.rand.gauss(0, 0.05))
+        self.assertAlmostEqual(est.rate, 0.01, delta=0.001)
+        self.assertAlmostEqual(est.temperature, 20.0 + 0.01 * 599, delta=0.1)
+
+    def test_predicts_between_readings(self):
+        est = Estimator.TempEstimator(sensor_noise=0.05)
+        for i in range(300):
+            est.step(float(i), 0.0, 20.0 + 0.01 * i)
+        before = est.variance
+        # no reading for a minute: the estimate keeps moving, and gets less certain
+        est.step(359.0, 0.0)
+        self.assertAlmostEqual(est.temperature, 20.0 + 0.01 * 359, delta=0.05)
+        self.assertTrue(est.variance > before)
+        gap = est.variance
+        est.step(360.0, 0.0, 23.6)
+        self.assertTrue(est.variance < gap)
+
+    def test_model_uses_heater_duty(self):
+        model = HeatUp.BathModel(80.0 / 2400, 1.0 / 2400, 20.0, 20.0)
+        est = Estimator.TempEstimator(model=model)
+        est.step(0.0, 1.0, 50.0)
+        # with the heater on, only the loss until the dead time is up ...
+        est.step(10.0, 1.0)
+        self.assertTrue(est.rate < 0)
+        # ... then the model's heating
+        est.step(30.0, 1.0)
+        self.assertAlmostEqual(est.rate, model.heat_rate - model.loss * (est.temperature - 20.0))
+        self.assertAlmostEqual(est.temperature, model.step(model.step(50.0, 0.0, 20.0), 1.0, 10.0),
+                               delta=0.001)
+
+    def test_sensor_lag(self):
+        # the probe trails a steadily heating bath by lag * rate
+        (lag, probe) = (20.0, 20.0)
+        est = Estimator.TempEstimator(sensor_lag=lag, sensor_noise=0.03)
+        for i in range(1200):
+            bath = 20.0 + 0.01 * i
+            probe += (bath - probe) / lag
+            est.step(float(i), 0.0, round(probe / 0.0625) * 0.0625)
+        self.assertTrue(bath - probe > 0.15)
+        self.assertAlmostEqual(est.temperature, bath, delta=0.05)
+
+    def test_controller(self):
+        sim = Simulation.Simulation(setpoint=56.5, alarm_interval=1.0, window_size=10, initial=55.0,
+                                    config={("Estimator", "estimator"): "kalman"})
+        try:
+            sim.run(3600)
+            sp = sim.sp
+            self.assertTrue(sp.temp_estimate is not None)
+            self.assertAlmostEqual(sp.temp_estimate, sim.bath.temperature, delta=0.2)
+            status = sp.status.as_dict()
+            self.assertEquals(status["temp_estimate"], sp.temp_estimate)
+            self.assertTrue(status["temp_variance"] > 0)
+            self.assertTrue("estimate" in sp.instruments.stages)
+        finally:
+            sim.cleanup()
+
+    def test_plateau(self):
+        # the temperature file is only rewritten when the reading changes
+        sim = Simulation.Simulation(setpoint=60.0, alarm_interval=1.0, window_size=10,
+                                    config={("Estimator", "estimator"): "kalman"})
+        try:
+            sp = sim.sp
+            start = sim.now
+            def change_only():
+                # 0.05 degC/s up to 56.5, then a plateau
+                val = round(min(50.0 + 0.05 * (sim.now - start), 56.5) / 0.0625) * 0.0625
+                if val != sp._current_temp:
+                    sp._current_temp = val
+                    sp._temp_readings += 1
+                return True
+            sp._temp_source = None
+            sp._get_temp_from_channel = change_only
+            sim.run(130)
+            sim.run(60)
+            for i in range(180):
+                sim.run(1)
+                self.assertAlmostEqual(sp.temp_estimate, 56.5, delta=3 * 0.1)
+        finally:
+            sim.cleanup()
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(Estimator_Test)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,71 @@
+#!/usr/bin/python
+
+import HeatUp
+import unittest
+import collections
+
+class HeatUp_Test(unittest.TestCase):
+
+    def setUp(self):
+        # the SimulatedBath defaults, but with a long dead time
+        self.model = HeatUp.BathModel(80.0 / 2400, 1.0 / 2400, 20.0, 120.0)
+
+    def test_model(self):
+        m = self.model
+        self.assertAlmostEqual(m.max_temp, 100.0)
+        self.assertAlmostEqual(m.step(50.0, 0.0, 1e9), 20.0)
+        self.assertAlmostEqual(m.step(50.0, 1.0, 1e9), 100.0)
+        self.assertAlmostEqual(m.steady_duty(60.0), 0.5)
+        # full power for the dead time from the coast point lands on the target
+        self.assertAlmostEqual(m.step(m.coast_temp(56.5), 1.0, m.dead_time), 56.5)
+
+    def test_from_fopdt(self):
+        fopdt = collections.namedtuple("FOPDTModel", "K tau theta ambient dt rmse")
+        m = HeatUp.BathModel.from_fopdt(fopdt(0.008, 2400.0, 20.0, 21.0, 10.0, 0.1), 10)
+        self.assertAlmostEqual(m.max_temp, 21.0 + 80.0)
+        self.assertEquals((m.ambient, m.dead_time), (21.0, 20.0))
+
+    def test_engage_and_handoff(self):
+        hu = HeatUp.HeatUp(self.model, 10, mode="predictive")
+        self.assertEquals(hu.plan(55.0, 56.5, 0), None)       # close enough for the PID
+        self.assertFalse(hu.active)
+        self.assertEquals(hu.plan(20.0, 56.5, 0), 10)
+        self.assertTrue(hu.active)
+        self.assertEquals(hu.plan(56.2, 56.5, 10), None)
+        self.assertFalse(hu.active)
+        self.assertEquals(hu.plan(30.0, 56.5, 20), 10)
+        self.assertEquals(HeatUp.HeatUp(self.model, 10, mode="off").plan(20.0, 56.5, 0), None)
+
+    def test_predictive_counts_heat_in_flight(self):
+        hu = HeatUp.HeatUp(self.model, 10, mode="predictive")
+        t = 0
+        for i in range(12):
+            hu.record(t, 10)
+            t += 10
+        # with 120s of full power still to arrive, the bath will pass 52.4 by itself
+        self.assertTrue(hu.peak(50.0, t, 0) > 52.4)
+        self.assertEquals(hu.plan(50.0, 52.4, t), 0.0)
+        # but there's room for some more heat on the way to 52.6
+        hu.active = False
+        on = hu.plan(50.0, 52.6, t)
+        self.assertTrue(0 < on < 10)
+        self.assertTrue(hu.peak(50.0, t, on) <= 52.6)
+
+    def test_boost_stops_at_coast_point(self):
+        hu = HeatUp.HeatUp(self.model, 10, mode="boost")
+        coast = self.model.coast_temp(56.5)
+        self.assertEquals(hu.plan(coast - 10, 56.5, 0), 10)
+        on = hu.plan(coast - 0.1, 56.5, 10)
+        self.assertTrue(0 < on < 10)
+        self.assertEquals(hu.plan(coast + 0.01, 56.5, 20), None)
+        self.assertFalse(hu.active)
+
+    def test_record_forgets_old_windows(self):
+        hu = HeatUp.HeatUp(self.model, 10)
+        for t in range(0, 1000, 10):
+            hu.record(t, 5)
+        self.assertTrue(len(hu._outputs) <= 15)
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(HeatUp_Test)
+    unittest.TextTestRunner(verbosity=2).run(suite)
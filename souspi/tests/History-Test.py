@@ -0,0 +1,90 @@
+#!/usr/bin/python
+
+import History
+import unittest
+import tempfile
+import shutil
+import os
+
+class History_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.h = History.History()
+
+    def _fill(self, h, start, seconds, step=10):
+        for t in range(start, start + seconds, step):
+            h.record(t, 50.0 + (t - start) / 100.0, 56.5, 0.5, (t // 10) % 2)
+
+    def test_raw_range(self):
+        self._fill(self.h, 0, 600)
+        pts = self.h.tier("raw").range(100, 200)
+        self.assertEquals([p.time for p in pts], range(100, 200, 10))
+        self.assertEquals(pts[0].mean, (51.0, 56.5, 0.5, 0.0))
+
+    def test_aggregates(self):
+        self._fill(self.h, 0, 600)
+        (first, second) = self.h.tier("1m").range(0, 120)
+        self.assertEquals((first.time, first.count), (0, 6))
+        self.assertEquals(first.min[0], 50.0)
+        self.assertEquals(first.max[0], 50.5)
+        self.assertAlmostEquals(first.mean[0], 50.25)
+        self.assertAlmostEquals(first.mean[3], 0.5)     # heater on half the time
+        self.assertEquals(second.time, 60)
+        # the bucket still being filled is included
+        self.assertEquals(self.h.tier("1h").range()[0].count, 60)
+
+    def test_missing_values(self):
+        self.h.record(0, 20.0, None, 0.0, False)
+        self.h.record(10, 21.0, 56.5, 0.0, False)
+        p = self.h.tier("1m").range()[0]
+        self.assertEquals(p.mean[1], 56.5)
+        self.assertEquals(p.count, 2)
+
+    def test_retention(self):
+        self._fill(self.h, 0, 4 * 3600)
+        raw = self.h.tier("raw")
+        self.assertTrue(raw.oldest >= 4 * 3600 - 3600 - 64 * 10)
+        self.assertEquals(self.h.tier("10s").oldest, 0)
+
+    def test_query_picks_tier(self):
+        self._fill(self.h, 0, 4 * 3600)
+        # recent: raw
+        (tier, pts) = self.h.query(4 * 3600 - 600)
+        self.assertEquals(tier.name, "raw")
+        self.assertEquals(len(pts), 60)
+        # older than raw keeps
+        (tier, pts) = self.h.query(3600)
+        self.assertEquals(tier.name, "10s")
+        # everything, in no more than 300 points
+        (tier, pts) = self.h.query(None, max_points=300)
+        self.assertEquals(tier.name, "1m")
+        self.assertEquals(len(pts), 240)
+
+    def test_query_short_cook(self):
+        # 10 minutes of data: raw covers all of it, however far back we ask
+        self._fill(self.h, 7200, 600)
+        (tier, pts) = self.h.query(0)
+        self.assertEquals(tier.name, "raw")
+        self.assertEquals(len(pts), 60)
+
+    def test_empty(self):
+        (tier, pts) = self.h.query()
+        self.assertEquals(pts, [])
+
+    def test_save_load(self):
+        d = tempfile.mkdtemp()
+        try:
+            path = os.path.join(d, "history.json")
+            self._fill(self.h, 0, 3600)
+            self.h.save(path)
+            h2 = History.History()
+            self.assertTrue(h2.load(path))
+            self.assertEquals(h2.tier("raw").range(), self.h.tier("raw").range())
+            self.assertEquals(h2.tier("1m").range(0, 600), self.h.tier("1m").range(0, 600))
+            self.assertFalse(History.History().load(os.path.join(d, "nothing")))
+        finally:
+            shutil.rmtree(d)
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(History_Test)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,97 @@
+#!/usr/bin/python
+
+import InputWatcher
+import SousPiHardware
+import Simulation
+import unittest
+
+class NoEdgeGPIO(SousPiHardware.SimulatedGPIO):
+    """ As on a kernel without edge detection for the pin. """
+    def add_event_detect(self, port, edge, callback=None, bouncetime=None):
+        raise RuntimeError("Failed to add edge detection")
+
+class InputWatcher_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 100.0
+        self.gpio = SousPiHardware.SimulatedGPIO()
+        self.gpio.setmode(self.gpio.BCM)
+        self.changes = []
+
+    def _watcher(self, debounce=0.0, gpio=None):
+        w = InputWatcher.InputWatcher(gpio or self.gpio, clock=lambda: self.now,
+                                      debounce=debounce, timers=False)
+        self.assertEquals(w.add(24, callback=lambda port, level: self.changes.append((port, level))),
+                          (gpio or self.gpio).input(24))
+        return w
+
+    def test_cached(self):
+        self.gpio.set_input(24, 1)
+        w = self._watcher()
+        self.assertTrue(w.edge_detected(24))
+        self.assertEquals(w.level(24), 1)
+        self.gpio.set_input(24, 0)
+        self.assertEquals(w.level(24), 0)
+        self.assertEquals(self.changes, [(24, 0)])
+        self.gpio.set_input(24, 0)
+        self.assertEquals(self.changes, [(24, 0)])
+
+    def test_debounce(self):
+        w = self._watcher(debounce=0.5)
+        self.gpio.set_input(24, 1)
+        self.assertEquals(w.level(24), 0)
+        # a bounce back doesn't count
+        self.now += 0.1
+        self.gpio.set_input(24, 0)
+        self.now += 1
+        w.poll()
+        self.assertEquals((w.level(24), self.changes), (0, []))
+        # a change that holds does, once the debounce time is up
+        self.gpio.set_input(24, 1)
+        self.now += 0.4
+        w.poll()
+        self.assertEquals(w.level(24), 0)
+        self.now += 0.1
+        w.poll()
+        self.assertEquals((w.level(24), self.changes), (1, [(24, 1)]))
+
+    def test_no_edge_detection(self):
+        gpio = NoEdgeGPIO()
+        gpio.setmode(gpio.BCM)
+        w = self._watcher(gpio=gpio)
+        self.assertFalse(w.edge_detected(24))
+        gpio.set_input(24, 1)
+        self.assertEquals(w.level(24), 0)
+        w.poll()
+        self.assertEquals((w.level(24), self.changes), (1, [(24, 1)]))
+
+    def test_close(self):
+        w = self._watcher()
+        w.close()
+        self.gpio.set_input(24, 1)
+        self.assertEquals(self.changes, [])
+        # the pin can be watched again
+        self._watcher()
+
+    def test_dry_bath_shuts_down_on_edge(self):
+        sim = Simulation.Simulation(setpoint=56.5, alarm_interval=1.0, window_size=10, initial=40.0,
+                                    config={("hardware", "water_sensor_debounce"): 0})
+        try:
+            sim.run(11)
+            sp = sim.sp
+            self.assertTrue(sp.PID_running and sp.heater_is_on)
+            # no tick needed
+            sim.gpio.set_input(sim.water_sensor_port, 0)
+            self.assertFalse(sp.PID_running)
+            self.assertFalse(sp.heater_is_on)
+            self.assertEquals(sp.status.in_water, False)
+            # and it's kept current while idle
+            sim.gpio.set_input(sim.water_sensor_port, 1)
+            self.assertTrue(sp.in_water)
+            self.assertEquals(sp.status.in_water, True)
+        finally:
+            sim.cleanup()
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(InputWatcher_Test)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,66 @@
+#!/usr/bin/python
+
+import Instrumentation
+import unittest
+
+class FakeTimer(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+class Instrumentation_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.timer = FakeTimer()
+        self.inst = Instrumentation.Instruments(timer=self.timer)
+
+    def test_buckets(self):
+        h = Instrumentation.LatencyHistogram((0.001, 0.01, 0.1))
+        for v in (0.0005, 0.001, 0.002, 0.05, 0.5):
+            h.record(v)
+        self.assertEquals(h.buckets, [2, 1, 1, 1])
+        self.assertEquals(h.count, 5)
+        self.assertEquals(h.max, 0.5)
+        self.assertAlmostEqual(h.mean, 0.5535 / 5)
+
+    def test_percentile(self):
+        h = Instrumentation.LatencyHistogram((0.001, 0.01, 0.1))
+        self.assertEquals(h.percentile(99), 0.0)
+        for i in range(99):
+            h.record(0.0005)
+        h.record(0.05)
+        self.assertEquals(h.percentile(50), 0.001)
+        self.assertEquals(h.percentile(99), 0.001)
+        self.assertEquals(h.percentile(100), 0.1)
+        h.record(1.0)
+        self.assertEquals(h.percentile(100), None)
+
+    def test_stage_timing(self):
+        t0 = self.inst.start()
+        self.timer.now += 0.004
+        self.assertAlmostEqual(self.inst.stop("get_temp", t0), 0.004)
+        d = self.inst.as_dict()
+        self.assertEquals(d["stages"]["get_temp"]["count"], 1)
+        self.assertAlmostEqual(d["stages"]["get_temp"]["max"], 0.004)
+        self.assertEquals(d["stages"]["get_temp"]["p99"], 0.005)
+
+    def test_counters(self):
+        self.inst.count("heater_toggles")
+        self.inst.count("heater_toggles")
+        self.inst.count("missed_ticks", 3)
+        self.assertEquals(self.inst.as_dict()["counters"],
+                          {"heater_toggles": 2, "missed_ticks": 3})
+        self.assertTrue("heater_toggles=2 missed_ticks=3" in self.inst.summary())
+
+    def test_reset(self):
+        self.inst.record("tick", 0.1)
+        self.inst.count("ticks")
+        self.timer.now = 200.0
+        self.inst.reset()
+        self.assertEquals(self.inst.as_dict(), {"since": 200.0, "stages": {}, "counters": {}})
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(Instrumentation_Test)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,156 @@
+#!/usr/bin/python
+
+import Journal
+import Simulation
+import unittest
+import tempfile
+import shutil
+import os
+
+class Journal_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "journal")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _lines(self):
+        with open(self.path) as f:
+            return f.readlines()
+
+    def test_replay(self):
+        j = Journal.StateJournal(self.path, fsync=False)
+        self.assertEquals(j.replay(), {})
+        self.assertTrue(j.append(1.0, running=True, setpoint=56.5))
+        self.assertFalse(j.append(2.0, running=True))
+        self.assertTrue(j.append(3.0, running=True, integral=1234.5))
+        j.close()
+        # the (empty) compacted state, and two records
+        self.assertEquals(len(self._lines()), 3)
+        self.assertEquals(Journal.StateJournal(self.path).replay(),
+                          {"running": True, "setpoint": 56.5, "integral": 1234.5, "time": 3.0})
+
+    def test_torn_record(self):
+        j = Journal.StateJournal(self.path, fsync=False)
+        j.replay()
+        j.append(1.0, setpoint=56.5)
+        j.append(2.0, setpoint=60.0)
+        j.close()
+        # a crash in the middle of the last write
+        data = open(self.path).read()
+        with open(self.path, "w") as f:
+            f.write(data[:-5])
+        j = Journal.StateJournal(self.path, fsync=False)
+        self.assertEquals(j.replay()["setpoint"], 56.5)
+        # a damaged record in the middle ends the replay too
+        lines = self._lines()
+        with open(self.path, "w") as f:
+            f.write(lines[0].replace("56.5", "57.5") + lines[0])
+        self.assertEquals(Journal.StateJournal(self.path).replay(), {})
+
+    def test_compaction(self):
+        j = Journal.StateJournal(self.path, compact_every=10, fsync=False)
+        j.replay()
+        for i in range(25):
+            j.append(float(i), on_time=i)
+        j.close()
+        self.assertTrue(len(self._lines()) <= 10)
+        self.assertEquals(Journal.StateJournal(self.path).replay(), {"on_time": 24, "time": 24.0})
+
+    def test_warm_restart(self):
+        sim = Simulation.Simulation(setpoint=56.5, workdir=self.dir, initial=50.0)
+        try:
+            sim.run(95)
+            sp = sim.sp
+            (ci, on_time, window_start) = (sp.p.Ci, sp._on_time, sp._window_start)
+            self.assertTrue(ci > 0 and on_time > 0)
+        finally:
+            # a crash, as far as the journal's concerned: nobody called stop()
+            sim.cleanup()
+        sim = Simulation.Simulation(workdir=self.dir, initial=50.0, start_time=sim.now + 2)
+        try:
+            sp = sim.sp
+            self.assertTrue(sp.PID_running)
+            self.assertEquals(sp.setpoint, 56.5)
+            self.assertEquals(sp.p.Ci, ci)
+            self.assertEquals(sp._on_time, on_time)
+            # same window phase
+            self.assertAlmostEqual((sp._window_start - window_start) % 10, 0.0)
+            sim.run(10)
+            self.assertTrue(sp.PID_running)
+        finally:
+            sim.cleanup()
+
+    def test_stale_journal(self):
+        sim = Simulation.Simulation(setpoint=56.5, workdir=self.dir, initial=50.0)
+        try:
+            sim.run(30)
+        finally:
+            sim.cleanup()
+        sim = Simulation.Simulation(workdir=self.dir, initial=50.0, start_time=sim.now + 3600)
+        try:
+            self.assertFalse(sim.sp.PID_running)
+        finally:
+            sim.cleanup()
+
+    def test_journal_from_the_future(self):
+        sim = Simulation.Simulation(setpoint=56.5, workdir=self.dir, initial=50.0)
+        try:
+            sim.run(30)
+        finally:
+            sim.cleanup()
+        # no RTC: the clock came up an hour behind the last record
+        sim = Simulation.Simulation(workdir=self.dir, initial=50.0, start_time=sim.now - 3600)
+        try:
+            self.assertFalse(sim.sp.PID_running)
+        finally:
+            sim.cleanup()
+        # and it stays idle once the clock has caught up
+        sim = Simulation.Simulation(workdir=self.dir, initial=50.0, start_time=sim.now + 2)
+        try:
+            self.assertFalse(sim.sp.PID_running)
+        finally:
+            sim.cleanup()
+
+    def test_no_setpoint(self):
+        j = Journal.StateJournal(self.path, fsync=False)
+        j.replay()
+        j.append(1000.0, running=True)
+        j.close()
+        sim = Simulation.Simulation(workdir=self.dir, initial=50.0, start_time=1002.0)
+        try:
+            self.assertFalse(sim.sp.PID_running)
+        finally:
+            sim.cleanup()
+        self.assertFalse(Journal.StateJournal(self.path).replay()["running"])
+
+    def test_bad_setpoint(self):
+        j = Journal.StateJournal(self.path, fsync=False)
+        j.replay()
+        j.append(1000.0, running=True, setpoint=-1.0)
+        j.close()
+        sim = Simulation.Simulation(workdir=self.dir, initial=50.0, start_time=1002.0)
+        try:
+            self.assertFalse(sim.sp.PID_running)
+            self.assertEquals(sim.sp.setpoint, None)
+        finally:
+            sim.cleanup()
+
+    def test_stopped(self):
+        sim = Simulation.Simulation(setpoint=56.5, workdir=self.dir, initial=50.0)
+        try:
+            sim.run(30)
+            sim.sp.stop()
+        finally:
+            sim.cleanup()
+        sim = Simulation.Simulation(workdir=self.dir, initial=50.0, start_time=sim.now + 2)
+        try:
+            self.assertFalse(sim.sp.PID_running)
+        finally:
+            sim.cleanup()
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(Journal_Test)
+    unittest.TextTestRunner(verbosity=2).run(suite)
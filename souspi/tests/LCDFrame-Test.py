@@ -0,0 +1,110 @@
+#!/usr/bin/python
+
+import LCDFrame
+import unittest
+
+class RecordingLCD(object):
+    """ Records the calls made to it, and keeps track of what's displayed. """
+
+    def __init__(self):
+        self.calls = []
+        self.rows = [[" "] * 16 for r in range(2)]
+        self.cursor = (0, 0)
+
+    def set_cursor(self, col, row):
+        self.calls.append(("set_cursor", col, row))
+        self.cursor = (col, row)
+
+    def message(self, text):
+        self.calls.append(("message", text))
+        (col, row) = self.cursor
+        for c in text:
+            if col < 16:
+                self.rows[row][col] = c
+            col += 1
+        self.cursor = (col, row)
+
+    def set_color(self, r, g, b):
+        self.calls.append(("set_color", r, g, b))
+
+    def blink(self, on):
+        self.calls.append(("blink", on))
+
+    def text(self):
+        return ["".join(r) for r in self.rows]
+
+
+class LCDFrame_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.lcd = RecordingLCD()
+        self.f = LCDFrame.LCDFrame(self.lcd)
+
+    def _draw(self, line1, line2, color=(0, 1.0, 0)):
+        self.f.clear()
+        self.f.set_color(*color)
+        self.f.message("%s\n%s" % (line1, line2))
+        self.f.flush()
+
+    def test_first_flush_draws_everything(self):
+        self._draw("At temp.", "56.50/56.50")
+        self.assertEquals(self.lcd.text(), ["At temp.        ", "56.50/56.50     "])
+        self.assertEquals(self.f.text(), self.lcd.text())
+
+    def test_unchanged_frame_sends_nothing(self):
+        self._draw("At temp.", "56.50/56.50")
+        self.lcd.calls = []
+        self._draw("At temp.", "56.50/56.50")
+        self.assertEquals(self.lcd.calls, [])
+
+    def test_only_changed_cells_sent(self):
+        self._draw("At temp.", "56.50/56.50")
+        self.lcd.calls = []
+        self._draw("At temp.", "56.56/56.50")
+        self.assertEquals(self.lcd.calls, [("set_cursor", 4, 1), ("message", "6")])
+        self.assertEquals(self.lcd.text()[1], "56.56/56.50     ")
+
+    def test_close_changes_merged(self):
+        self._draw("Heating up.", "41.25/56.50", color=(1.0, 1.0, 0))
+        self.lcd.calls = []
+        self._draw("Heating up.", "41.75/56.50", color=(1.0, 1.0, 0))
+        self._draw("Heating up.", "42.00/56.50", color=(1.0, 1.0, 0))
+        self.assertEquals(self.lcd.calls, [("set_cursor", 3, 1), ("message", "7"),
+                                           ("set_cursor", 1, 1), ("message", "2.00")])
+
+    def test_color_only_on_change(self):
+        self._draw("a", "b")
+        self._draw("a", "b")
+        self._draw("a", "b", color=(1.0, 0, 0))
+        colors = [c for c in self.lcd.calls if c[0] == "set_color"]
+        self.assertEquals(colors, [("set_color", 0, 1.0, 0), ("set_color", 1.0, 0, 0)])
+
+    def test_blinking_cursor_restored(self):
+        self.f.clear()
+        self.f.message("New setpoint:\n056.50")
+        self.f.blink(True)
+        self.f.set_cursor(2, 1)
+        self.f.flush()
+        self.assertEquals(self.lcd.cursor, (2, 1))
+        self.assertEquals(self.lcd.calls[-1], ("blink", True))
+        self.lcd.calls = []
+        self.f.set_cursor(0, 1)
+        self.f.message("057.50")
+        self.f.set_cursor(2, 1)
+        self.f.flush()
+        self.assertEquals(self.lcd.calls, [("message", "7"), ("set_cursor", 2, 1)])
+
+    def test_invalidate(self):
+        self._draw("a", "b")
+        self.f.invalidate()
+        self.lcd.calls = []
+        self._draw("a", "b")
+        self.assertEquals(len([c for c in self.lcd.calls if c[0] == "message"]), 2)
+
+    def test_clipped(self):
+        self._draw("x" * 20, "")
+        self.assertEquals(self.lcd.text()[0], "x" * 16)
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(LCDFrame_Test)
+    unittest.TextTestRunner(verbosity=2).run(suite)
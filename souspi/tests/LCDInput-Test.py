@@ -0,0 +1,116 @@
+#!/usr/bin/python
+
+import LCDInput
+import unittest
+import threading
+import time
+
+(SELECT, RIGHT, DOWN, UP, LEFT) = (0, 1, 2, 3, 4)
+
+class FakeMCP(object):
+    """ Just enough of Adafruit_GPIO.MCP230xx for plate_reader(). """
+
+    def __init__(self):
+        self.down = set()
+        self.reads = 0
+
+    def input_pins(self, pins):
+        self.reads += 1
+        return [p not in self.down for p in pins]     # pulled up; pressed reads low
+
+
+class FakePlate(object):
+    def __init__(self):
+        self._mcp = FakeMCP()
+
+
+class LCDInput_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.down = set()
+        self.bi = LCDInput.ButtonInput(lambda: self.down, repeat_buttons=(UP, DOWN),
+                                       debounce=0.02, repeat_delay=0.5, repeat_interval=0.1)
+
+    def _events(self):
+        ev = []
+        while True:
+            b = self.bi.get(0)
+            if b is None:
+                return ev
+            ev.append(b)
+
+    def test_press_queued_once(self):
+        self.down.add(SELECT)
+        self.bi.poll(0.0)
+        self.assertEquals(self._events(), [])       # not debounced yet
+        self.bi.poll(0.03)
+        self.bi.poll(0.06)
+        self.bi.poll(1.0)
+        self.assertEquals(self._events(), [SELECT])  # SELECT doesn't repeat
+        self.assertEquals(self.bi.pressed, frozenset([SELECT]))
+
+    def test_bounce_ignored(self):
+        t = 0.0
+        for i in range(10):
+            if i % 2:
+                self.down.add(LEFT)
+            else:
+                self.down.discard(LEFT)
+            self.bi.poll(t)
+            t += 0.005
+        self.assertEquals(self._events(), [])
+        self.down.add(LEFT)
+        self.bi.poll(t + 0.05)
+        self.assertEquals(self._events(), [LEFT])
+
+    def test_repeat(self):
+        self.down.add(UP)
+        self.bi.poll(0.0)
+        self.bi.poll(0.02)
+        self.bi.poll(0.4)
+        self.assertEquals(self._events(), [UP])
+        for t in (0.52, 0.6, 0.62, 0.72):
+            self.bi.poll(t)
+        self.assertEquals(self._events(), [UP, UP, UP])
+        # released: no more repeats, and a fresh press counts again
+        self.down.clear()
+        self.bi.poll(0.8)
+        self.bi.poll(0.9)
+        self.assertEquals(self.bi.pressed, frozenset())
+        self.assertFalse(self.bi.busy)
+        self.down.add(UP)
+        self.bi.poll(1.0)
+        self.bi.poll(1.1)
+        self.assertEquals(self._events(), [UP])
+
+    def test_clear(self):
+        self.down.add(RIGHT)
+        self.bi.poll(0.0)
+        self.bi.poll(0.1)
+        self.bi.clear()
+        self.assertEquals(self.bi.get(0.01), None)
+
+    def test_plate_reader_single_read(self):
+        plate = FakePlate()
+        read = LCDInput.plate_reader(plate, (SELECT, RIGHT, DOWN, UP, LEFT))
+        plate._mcp.down.update([UP, SELECT])
+        self.assertEquals(read(), frozenset([UP, SELECT]))
+        self.assertEquals(plate._mcp.reads, 1)
+
+    def test_thread_sleeps_until_woken(self):
+        wakeup = threading.Event()
+        bi = LCDInput.ButtonInput(lambda: self.down, debounce=0, poll_interval=0.005,
+                                  wakeup=wakeup, idle_interval=10)
+        bi.start()
+        try:
+            time.sleep(0.1)
+            self.assertEquals(bi.reads, 1)             # idle: just the initial read
+            self.down.add(SELECT)
+            wakeup.set()
+            self.assertEquals(bi.get(1), SELECT)
+        finally:
+            bi.stop()
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(LCDInput_Test)
+    unittest.TextTestRunner(verbosity=2).run(suite)
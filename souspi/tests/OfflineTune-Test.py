@@ -0,0 +1,130 @@
+#!/usr/bin/python
+
+import OfflineTune
+import HeatUp
+import DataLog
+import unittest
+import tempfile
+import shutil
+import math
+import os
+
+import numpy
+
+from souspi import TuningError
+
+class OfflineTune_Test(unittest.TestCase):
+
+    K = 0.004         # degC per ms of on-time per window
+    tau = 600.0
+    delay_steps = 3
+    dt = 10.0
+    ambient = 20.0
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _trace(self, n=600, noise=0.0):
+        """ An exact FOPDT response to a series of output steps. """
+        rng = numpy.random.RandomState(42)
+        u = numpy.repeat(rng.uniform(0, 10000, n // 20 + 1), 20)[:n]
+        a = math.exp(-self.dt / self.tau)
+        y = numpy.empty(n)
+        y[0] = self.ambient
+        for k in range(n - 1):
+            uk = u[k - self.delay_steps] if k >= self.delay_steps else 0.0
+            y[k + 1] = a * y[k] + (1 - a) * (self.K * uk + self.ambient)
+        t = 1000.0 + self.dt * numpy.arange(n)
+        return (t, y + rng.normal(0, noise, n) if noise else y, u)
+
+    def test_fit_recovers_model(self):
+        (t, y, u) = self._trace()
+        m = OfflineTune.fit_fopdt(t, y, u)
+        self.assertAlmostEquals(m.K, self.K, places=6)
+        self.assertAlmostEquals(m.tau, self.tau, places=2)
+        self.assertAlmostEquals(m.theta, self.delay_steps * self.dt)
+        self.assertAlmostEquals(m.ambient, self.ambient, places=3)
+
+    def test_fit_with_noise(self):
+        (t, y, u) = self._trace(noise=0.0625)
+        m = OfflineTune.fit_fopdt(t, y, u)
+        self.assertTrue(abs(m.K - self.K) / self.K < 0.1)
+        self.assertTrue(abs(m.tau - self.tau) / self.tau < 0.1)
+        self.assertEquals(m.theta, self.delay_steps * self.dt)
+
+    def test_fit_rejects_bad_traces(self):
+        (t, y, u) = self._trace()
+        self.assertRaises(TuningError, OfflineTune.fit_fopdt, t[:5], y[:5], u[:5])
+        self.assertRaises(TuningError, OfflineTune.fit_fopdt, t, y, numpy.ones(len(t)))
+
+    def test_rules(self):
+        m = OfflineTune.FOPDTModel(self.K, self.tau, 30.0, self.ambient, self.dt, 0.0)
+        zn = OfflineTune.pid_gains(m, "zn")
+        self.assertAlmostEquals(zn.Kp, 1.2 * self.tau / (self.K * 30.0))
+        self.assertAlmostEquals(zn.Ki, zn.Kp / 60.0)
+        self.assertAlmostEquals(zn.Kd, zn.Kp * 15.0)
+        for rule in OfflineTune.RULES:
+            g = OfflineTune.pid_gains(m, rule)
+            self.assertTrue(g.Kp > 0 and g.Ki > 0 and g.Kd > 0)
+        # a slower closed loop means gentler gains
+        self.assertTrue(OfflineTune.pid_gains(m, "imc", lam=300).Kp <
+                        OfflineTune.pid_gains(m, "imc", lam=60).Kp)
+        self.assertRaises(ValueError, OfflineTune.pid_gains, m, "magic")
+
+    def test_load_datalog(self):
+        (t, y, u) = self._trace(n=50)
+        path = os.path.join(self.dir, "datalog.ring")
+        log = DataLog.RingDataLog(path, 100)
+        for i in range(len(t)):
+            log.append(t[i], DataLog.NAN, y[i], DataLog.NAN, u[i] / 1000.0,
+                       DataLog.NAN, DataLog.NAN, DataLog.NAN, 1)
+        log.close()
+        (lt, ly, lu) = OfflineTune.load_trace(path)
+        self.assertEquals(len(lt), 50)
+        self.assertTrue(numpy.allclose(ly, y, atol=1e-4))
+        self.assertTrue(numpy.allclose(lu, u, rtol=1e-5))
+
+    def test_load_csv(self):
+        path = os.path.join(self.dir, "trace.csv")
+        with open(path, "w") as f:
+            f.write("time,pv,on_time\n2,21.0,5\n1,20.0,10\n3,bad,5\n")
+        (t, pv, u) = OfflineTune.load_trace(path)
+        self.assertEquals(list(t), [1.0, 2.0])
+        self.assertEquals(list(u), [10000.0, 5000.0])
+
+    def test_write_gains(self):
+        path = os.path.join(self.dir, "souspi.cfg")
+        with open(path, "w") as f:
+            f.write("[general]\nKp: 1\n\n[PID]\n## proportional\nKp: 174.81\nKi = 29.80\n"
+                    "at_temp_threshold: 0.5\n")
+        OfflineTune.write_gains(path, OfflineTune.PIDGains(1.5, 0.25, 3.0))
+        with open(path) as f:
+            self.assertEquals(f.read(), "[general]\nKp: 1\n\n[PID]\nKd: 3.0000\n## proportional\n"
+                              "Kp: 1.5000\nKi: 0.2500\nat_temp_threshold: 0.5\n")
+
+    def test_write_keeps_mode(self):
+        path = os.path.join(self.dir, "souspi.cfg")
+        with open(path, "w") as f:
+            f.write("[PID]\nKp: 174.81\n")
+        os.chmod(path, 0644)
+        OfflineTune.write_gains(path, OfflineTune.PIDGains(1.5, 0.25, 3.0))
+        self.assertEquals(os.stat(path).st_mode & 0777, 0644)
+        os.chmod(path, 0640)
+        OfflineTune.write_heatup_model(path, HeatUp.BathModel(80.0 / 2400, 1.0 / 2400, 20.0, 25.0))
+        self.assertEquals(os.stat(path).st_mode & 0777, 0640)
+
+    def test_write_heatup_model(self):
+        path = os.path.join(self.dir, "souspi.cfg")
+        with open(path, "w") as f:
+            f.write("[HeatUp]\nheatup_mode: boost\nheat_rate: 0\n")
+        OfflineTune.write_heatup_model(path, HeatUp.BathModel(80.0 / 2400, 1.0 / 2400, 20.0, 25.0))
+        with open(path) as f:
+            self.assertEquals(f.read(), "[HeatUp]\nheat_loss: 0.000416667\nambient_temp: 20\n"
+                              "dead_time: 25\nheatup_mode: boost\nheat_rate: 0.0333333\n")
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(OfflineTune_Test)
+    unittest.TextTestRunner(verbosity=2).run(suite)
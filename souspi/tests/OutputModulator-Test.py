@@ -0,0 +1,127 @@
+#!/usr/bin/python
+
+import OutputModulator
+import SousPiHardware
+import Simulation
+import unittest
+import threading
+import time
+
+class OutputModulator_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = SousPiHardware.VirtualClock(1000.0)
+        self.switched = []
+        self.m = OutputModulator.OutputModulator(self._switch, self.clock)
+
+    def _switch(self, on):
+        self.switched.append((self.clock(), on))
+
+    def test_pulses(self):
+        self.assertEquals(self.m.pulses(10.0, 2.5), [(0.0, 2.5)])
+        self.assertEquals(self.m.pulses(10.0, 0.0), [])
+        self.assertEquals(self.m.pulses(10.0, 12.0), [(0.0, 10.0)])
+        self.assertEquals(self.m._carry, 0.0)       # saturation isn't owed later
+
+    def test_burst(self):
+        self.m.burst_cycles = 4
+        self.assertEquals(self.m.pulses(10.0, 2.0), [(0.0, 0.5), (2.5, 0.5), (5.0, 0.5), (7.5, 0.5)])
+        # bursts are merged to respect the minimum pulse length
+        self.m.min_on = 0.9
+        self.assertEquals(self.m.pulses(10.0, 2.0), [(0.0, 1.0), (5.0, 1.0)])
+
+    def test_min_on_carries_over(self):
+        self.m.min_on = 1.0
+        self.assertEquals(self.m.pulses(10.0, 0.4), [])
+        self.assertEquals(self.m.pulses(10.0, 0.4), [])
+        self.assertAlmostEqual(self.m.pulses(10.0, 0.4)[0][1], 1.2)
+        self.assertAlmostEqual(self.m._carry, 0.0)
+
+    def test_min_off(self):
+        self.m.min_off = 1.0
+        self.assertEquals(self.m.pulses(10.0, 9.5), [(0.0, 10.0)])
+        self.assertAlmostEqual(self.m._carry, -0.5)
+        self.assertEquals(self.m.pulses(10.0, 9.5), [(0.0, 9.0)])
+
+    def test_poll(self):
+        self.m.set_window(1000.0, 10.0, 2.25)
+        self.assertEquals(self.m.next_switch, 1000.0)
+        self.assertEquals(self.m.poll(), True)
+        self.assertEquals(self.m.poll(), None)
+        self.clock.advance(2.0)
+        self.assertEquals(self.m.poll(), None)
+        self.clock.advance(0.5)
+        self.assertEquals(self.m.poll(), False)
+        self.assertEquals(self.switched, [(1000.0, True), (1002.5, False)])
+        self.assertEquals(self.m.next_switch, None)
+
+    def test_clear(self):
+        self.m.set_window(1000.0, 10.0, 5.0)
+        self.m.clear()
+        self.clock.advance(1)
+        self.assertEquals(self.m.poll(), None)
+
+    def test_thread_switches_on_time(self):
+        switched = []
+        m = OutputModulator.OutputModulator(lambda on: switched.append((time.time(), on)))
+        m.start()
+        try:
+            start = time.time() + 0.05
+            m.set_window(start, 0.4, 0.15)
+            time.sleep(0.3)
+        finally:
+            m.stop()
+        self.assertEquals([on for (t, on) in switched], [True, False])
+        self.assertTrue(abs(switched[0][0] - start) < 0.02, switched[0][0] - start)
+        self.assertTrue(abs(switched[1][0] - (start + 0.15)) < 0.02, switched[1][0] - start)
+
+    def test_stale_switch_is_dropped(self):
+        lock = threading.RLock()
+        switched = []
+        def switch(on):
+            with lock:
+                switched.append(on)
+        class Racy(OutputModulator.OutputModulator):
+            def _apply_current(self, event, now, generation):
+                # a tick installs the next window (and switches on for it) in between the
+                #  thread taking this window's OFF and carrying it out
+                def tick():
+                    with lock:
+                        m.set_window(time.time(), 10.0, 5.0)
+                        m.poll()
+                t = threading.Thread(target=tick)
+                t.start()
+                t.join()
+                OutputModulator.OutputModulator._apply_current(self, event, now, generation)
+        m = Racy(switch, lock=lock)
+        with lock:
+            m.set_window(time.time(), 10.0, 0.05)
+            m.poll()
+        self.assertEquals(switched, [True])
+        m.start()
+        try:
+            time.sleep(0.2)
+        finally:
+            m.stop()
+        self.assertEquals(switched, [True, True])
+
+    def test_simulated_switching_between_ticks(self):
+        # one tick per window, so switching on ticks would be all or nothing
+        sim = Simulation.Simulation(setpoint=56.5, alarm_interval=10.0, window_size=10,
+                                    initial=56.0)
+        offs = []
+        output = sim.gpio.output
+        def logged_output(port, value):
+            if port == sim.output_control_port and not value and sim.heater_on:
+                offs.append(sim.now)
+            output(port, value)
+        sim.gpio.output = logged_output
+        try:
+            sim.run(300)
+        finally:
+            sim.cleanup()
+        self.assertTrue([t for t in offs if (t - sim.samples[0][0]) % 10 != 0], offs)
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(OutputModulator_Test)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,92 @@
+#!/usr/bin/python
+
+import SetpointTimer
+import unittest
+import tempfile
+import shutil
+import os
+
+class SetpointTimer_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.state = os.path.join(self.dir, "at_setpoint")
+        self.t = self._timer()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _timer(self):
+        return SetpointTimer.SetpointTimer(0.5, hysteresis=0.25, tolerance=120,
+                                           state_file=self.state, checkpoint_interval=60)
+
+    def _feed(self, timer, temps, start=0, step=10, setpoint=56.5):
+        now = start
+        for temp in temps:
+            timer.update(temp, setpoint, now)
+            now += step
+        return now - step
+
+    def test_not_at_temp(self):
+        now = self._feed(self.t, [20, 30, 40, 50, 55])
+        self.assertIsNone(self.t.elapsed(now))
+
+    def test_counts_from_arrival(self):
+        now = self._feed(self.t, [50, 56.1, 56.5, 56.9, 56.4])
+        self.assertEquals(self.t.elapsed(now), 30)
+
+    def test_hysteresis(self):
+        # wandering just outside the threshold, but inside the hysteresis band, doesn't count
+        # as leaving - not even after the tolerance has run out
+        now = self._feed(self.t, [56.5] + [57.2] * 20)
+        self.assertEquals(self.t.elapsed(now), 200)
+        # ... but it doesn't count as arriving, either
+        os.unlink(self.state)
+        t = self._timer()
+        self.assertIsNone(t.elapsed(self._feed(t, [57.2] * 5)))
+
+    def test_brief_excursion_tolerated(self):
+        now = self._feed(self.t, [56.5] * 10 + [52.0] * 10 + [56.5] * 3)
+        self.assertEquals(self.t.elapsed(now), 220)
+
+    def test_long_excursion_resets(self):
+        now = self._feed(self.t, [56.5] * 10 + [52.0] * 14 + [56.5] * 3)
+        self.assertEquals(self.t.elapsed(now), 20)
+
+    def test_setpoint_change_resets(self):
+        now = self._feed(self.t, [56.5] * 10)
+        self.t.update(56.5, 60.0, now + 10)
+        self.assertIsNone(self.t.elapsed(now + 10))
+
+    def test_survives_restart(self):
+        now = self._feed(self.t, [56.5] * 10)
+        self.t.save(now)
+        t = self._timer()
+        t.update(56.5, 56.5, now + 60)
+        self.assertEquals(t.elapsed(now + 60), 150)
+
+    def test_restart_after_long_gap(self):
+        now = self._feed(self.t, [56.5] * 10)
+        self.t.save(now)
+        t = self._timer()
+        t.update(56.5, 56.5, now + 600)
+        self.assertEquals(t.elapsed(now + 600), 0)
+
+    def test_checkpoints(self):
+        self._feed(self.t, [56.5] * 20)
+        with open(self.state) as f:
+            saved = f.read()
+        # last checkpoint was at 180s, so a restart by 300s carries on...
+        t = self._timer()
+        t.update(56.5, 56.5, 290)
+        self.assertEquals(t.elapsed(290), 290)
+        # ... and one after that starts over
+        with open(self.state, "w") as f:
+            f.write(saved)
+        t = self._timer()
+        t.update(56.5, 56.5, 310)
+        self.assertEquals(t.elapsed(310), 0)
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(SetpointTimer_Test)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,123 @@
+#!/usr/bin/python
+
+import SousPiConfig
+import Simulation
+import SousPi
+import unittest
+import tempfile
+import shutil
+import os
+
+from souspi import ConfigError
+
+class SousPiConfig_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.sim = Simulation.Simulation(setpoint=56.5, alarm_interval=1.0, window_size=10)
+        self.cfgfile = self.sim.cfgfile
+        with open(self.cfgfile) as f:
+            self.original = f.read()
+
+    def tearDown(self):
+        self.sim.cleanup()
+
+    def _rewrite(self, **changes):
+        """ Rewrite the simulation's config with options (as 'option': value) replaced. """
+        lines = []
+        for line in self.original.splitlines():
+            opt = line.split("=")[0].strip().lower()
+            if opt in changes:
+                line = "%s = %s" % (opt, changes[opt])
+            lines.append(line)
+        with open(self.cfgfile, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        # make sure the mtime moves, however coarse the filesystem's clock
+        st = os.stat(self.cfgfile)
+        os.utime(self.cfgfile, (st.st_atime, st.st_mtime + 10))
+
+    def _load(self):
+        return SousPiConfig.SousPiConfig.load(self.cfgfile, SousPi.SousPi.config_defaults)
+
+    def test_load(self):
+        c = self._load()
+        self.assertEquals(c.window_size, 10.0)
+        self.assertEquals(c.alarm_interval, 1.0)
+        self.assertEquals(c.output_control_port, 23)
+        self.assertEquals(c.config_watch, True)
+        with self.assertRaises(AttributeError):
+            c.kp = 1.0
+
+    def test_validation(self):
+        for bad in ({"alarm_interval": 20}, {"control_window_size": 0}, {"kp": -1},
+                    {"kd": "lots"}, {"water_sensor_port": 23}, {"command_watch": "psychic"}):
+            self._rewrite(**bad)
+            with self.assertRaises(ConfigError):
+                self._load()
+
+    def test_heatup_needs_model(self):
+        with open(self.cfgfile, "a") as f:
+            f.write("[HeatUp]\nheatup_mode = predictive\n")
+        with self.assertRaises(ConfigError):
+            self._load()
+        with open(self.cfgfile, "a") as f:
+            f.write("heat_rate = 0.03\nheat_loss = 0.0004\n")
+        self.assertEquals(self._load().heatup_mode, "predictive")
+
+    def test_estimator(self):
+        self.assertEquals(self._load().estimator, "off")
+        with open(self.cfgfile, "a") as f:
+            f.write("[Estimator]\nestimator = kalman\nsensor_noise = 0\n")
+        with self.assertRaises(ConfigError):
+            self._load()
+        with open(self.cfgfile, "a") as f:
+            f.write("sensor_noise = 0.05\n")
+        self.assertEquals(self._load().estimator, "kalman")
+
+    def test_changes(self):
+        c = self._load()
+        self.assertEquals(c.changes(c._replace(kp=1.0, alarm_interval=2.0)),
+                          ["alarm_interval", "kp"])
+
+    def test_reload_at_window_boundary(self):
+        sp = self.sim.sp
+        self.sim.run(35)
+        window_start = sp._window_start
+        self._rewrite(kp=50.0, control_window_size=5)
+        self.assertTrue(sp.reload_config())
+        self.assertNotEqual(sp.p.Kp, 50.0)
+        # nothing changes until the current window is over
+        self.sim.run(window_start + 10 - self.sim.now - 2)
+        self.assertNotEqual(sp.p.Kp, 50.0)
+        self.sim.run(3)
+        self.assertEquals(sp.p.Kp, 50.0)
+        self.assertEquals(sp._window_size, 5.0)
+        self.assertEquals(sp.p.out_max, 5000)
+        self.sim.run(30)
+        self.assertTrue(sp._on_time <= 5.0)
+
+    def test_bad_reload_keeps_config(self):
+        sp = self.sim.sp
+        self._rewrite(kp=50.0, alarm_interval=60)
+        self.assertFalse(sp.reload_config())
+        self.sim.run(30)
+        self.assertNotEqual(sp.p.Kp, 50.0)
+        self.assertEquals(sp.config.alarm_interval, 1.0)
+
+    def test_restart_only_options_ignored(self):
+        sp = self.sim.sp
+        self._rewrite(kp=50.0, output_control_port=4)
+        self.assertTrue(sp.reload_config())
+        self.sim.run(20)
+        self.assertEquals(sp.p.Kp, 50.0)
+        self.assertEquals(sp.config.output_control_port, 23)
+
+    def test_file_watch(self):
+        sp = self.sim.sp
+        sp.stop()
+        self._rewrite(ki=1.5)
+        self.sim.run(2)
+        self.assertEquals(sp.p.Ki, 1.5)
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(SousPiConfig_Test)
+    unittest.TextTestRunner(verbosity=2).run(suite)
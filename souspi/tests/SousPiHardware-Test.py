@@ -0,0 +1,124 @@
+#!/usr/bin/python
+
+import SousPiHardware
+import unittest
+import math
+
+class VirtualClock_Test(unittest.TestCase):
+
+    def test_advance(self):
+        c = SousPiHardware.VirtualClock(100)
+        self.assertEquals(c(), 100)
+        c.advance(5)
+        c.sleep(2.5)
+        self.assertEquals(c.time(), 107.5)
+        with self.assertRaises(ValueError):
+            c.advance(-1)
+
+class SimulatedGPIO_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.gpio = SousPiHardware.SimulatedGPIO()
+
+    def test_needs_mode(self):
+        with self.assertRaises(RuntimeError):
+            self.gpio.setup(23, self.gpio.OUT)
+
+    def test_output(self):
+        self.gpio.setmode(self.gpio.BCM)
+        self.gpio.setup(23, self.gpio.OUT)
+        self.gpio.output(23, 1)
+        self.gpio.output(23, 1)
+        self.gpio.output(23, 0)
+        self.assertEquals(self.gpio.input(23), 0)
+        self.assertEquals(self.gpio.transitions[23], 2)
+        with self.assertRaises(RuntimeError):
+            self.gpio.output(24, 1)
+
+    def test_input(self):
+        self.gpio.set_input(24, 1)
+        self.gpio.setmode(self.gpio.BCM)
+        self.gpio.setup(24, self.gpio.IN, pull_up_down=self.gpio.PUD_DOWN)
+        self.assertEquals(self.gpio.input(24), 1)
+
+    def test_cleanup_channels(self):
+        self.gpio.setmode(self.gpio.BCM)
+        for port in (5, 23, 24):
+            self.gpio.setup(port, self.gpio.OUT)
+        self.gpio.cleanup([23, 24])
+        self.assertEquals(self.gpio.directions.keys(), [5])
+        self.gpio.cleanup()
+        self.assertEquals(self.gpio.directions, {})
+
+    def test_event_detect(self):
+        seen = []
+        self.gpio.setmode(self.gpio.BCM)
+        self.gpio.setup(24, self.gpio.IN)
+        self.gpio.add_event_detect(24, self.gpio.FALLING, callback=seen.append)
+        with self.assertRaises(RuntimeError):
+            self.gpio.add_event_detect(24, self.gpio.BOTH)
+        self.gpio.set_input(24, 1)
+        self.gpio.set_input(24, 1)
+        self.assertEquals(seen, [])
+        self.assertFalse(self.gpio.event_detected(24))
+        self.gpio.set_input(24, 0)
+        self.assertEquals(seen, [24])
+        self.assertTrue(self.gpio.event_detected(24))
+        self.assertFalse(self.gpio.event_detected(24))
+        self.gpio.cleanup([24])
+        self.gpio.set_input(24, 1)
+        self.gpio.set_input(24, 0)
+        self.assertEquals(seen, [24])
+
+class SimulatedBath_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = SousPiHardware.VirtualClock()
+        self.heater = False
+        self.bath = SousPiHardware.SimulatedBath(lambda: self.heater, self.clock,
+                                                 initial=20.0, ambient=20.0, gain=80.0,
+                                                 time_constant=1000.0, dead_time=10.0,
+                                                 resolution=None)
+
+    def test_idle(self):
+        self.clock.advance(5000)
+        self.assertAlmostEquals(self.bath.get_temperature(), 20.0)
+
+    def test_dead_time(self):
+        self.heater = True
+        self.bath.advance()
+        self.clock.advance(9)
+        self.assertAlmostEquals(self.bath.get_temperature(), 20.0)
+        self.clock.advance(1001)
+        self.assertAlmostEquals(self.bath.get_temperature(), 20.0 + 80.0 * (1 - math.exp(-1.0)))
+
+    def test_step_size_independent(self):
+        other = SousPiHardware.SimulatedBath(lambda: self.heater, self.clock, resolution=None,
+                                             time_constant=1000.0, dead_time=10.0)
+        self.heater = True
+        self.bath.advance()
+        other.advance()
+        for i in range(300):
+            self.clock.advance(1)
+            self.bath.advance()
+        self.heater = False
+        self.bath.advance()
+        other.advance()
+        for i in range(300):
+            self.clock.advance(1)
+            self.bath.advance()
+        self.assertTrue(self.bath.temperature > 30)
+        self.assertAlmostEquals(other.get_temperature(), self.bath.get_temperature())
+
+    def test_cools_toward_ambient(self):
+        self.bath.add_heat(40)
+        self.clock.advance(1000)
+        self.assertAlmostEquals(self.bath.get_temperature(), 20.0 + 40.0 * math.exp(-1.0))
+
+    def test_resolution(self):
+        self.bath.resolution = 0.0625
+        self.bath.add_heat(0.1)
+        self.assertEquals(self.bath.get_temperature(), 20.125)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+#!/usr/bin/python
+
+import SousPiRPC
+import SousPiStatus
+import History
+import Instrumentation
+import unittest
+import threading
+import tempfile
+import shutil
+import os
+
+from souspi import RPCError, RPCUnavailableError, ImpossibleSetpointError
+
+class FakePID(object):
+    Kp = 1.0
+    Ki = 2.0
+    Kd = 3.0
+
+class FakeSousPi(object):
+    """ Just enough of a controller for RPCServer: a lock, a status, and the commands. """
+    def __init__(self, status_file):
+        self._lock = threading.RLock()
+        self.last_temp = 20.0
+        self.setpoint = None
+        self.PID_running = False
+        self.in_water = True
+        self.time_at_setpoint = None
+        self.temp_estimate = None
+        self.temp_rate = None
+        self.temp_variance = None
+        self.p = FakePID()
+        self.history = History.History()
+        self.instruments = Instrumentation.Instruments()
+        self.status = SousPiStatus.SousPiStatus(spobj=self, tofile=status_file)
+
+    def __setattr__(self, name, value):
+        if name == "setpoint" and value is not None and float(value) <= 0:
+            raise ImpossibleSetpointError("Setpoint must be positively signed and non-zero")
+        object.__setattr__(self, name, value)
+        if name in ("setpoint", "PID_running") and "status" in self.__dict__:
+            self.status.refresh()
+
+    @property
+    def timing_stats(self):
+        return {"name": "control", "engine": None, "loop": self.instruments.as_dict()}
+
+    def start(self):
+        self.PID_running = True
+
+    def stop(self):
+        self.PID_running = False
+
+class SousPiRPC_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "control.sock")
+        self.sp = FakeSousPi(os.path.join(self.dir, "status"))
+        self.server = SousPiRPC.RPCServer(self.path, self.sp)
+        self.server.start()
+        self.client = SousPiRPC.RPCClient(self.path, timeout=2)
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.dir)
+
+    def test_status(self):
+        self.assertEquals(self.client.status()["temp"], 20.0)
+
+    def test_commands_are_acknowledged(self):
+        self.assertEquals(self.client.set_setpoint(56.5)["setpoint"], 56.5)
+        self.assertEquals(self.client.start()["running"], True)
+        self.assertEquals(self.sp.PID_running, True)
+        self.assertEquals(self.client.stop()["running"], False)
+
+    def test_refused(self):
+        with self.assertRaises(RPCError):
+            self.client.set_setpoint(-4)
+        with self.assertRaises(RPCError):
+            self.client.call("selfdestruct")
+
+    def test_bad_setpoints(self):
+        self.client.set_setpoint(56.5)
+        for value in (None, "hot", [56.5], {"value": 56.5}, float("nan"), True):
+            with self.assertRaises(RPCError):
+                self.client.set_setpoint(value)
+        with self.assertRaises(RPCError):
+            self.client.call("setpoint")
+        self.assertEquals(self.sp.setpoint, 56.5)
+        # a number in a string is fine
+        self.assertEquals(self.client.set_setpoint("60")["setpoint"], 60.0)
+
+    def test_unexpected_error(self):
+        def broken():
+            raise RuntimeError("relay on fire")
+        self.sp.stop = broken
+        with self.assertRaises(RPCError):
+            self.client.stop()
+        # and the connection's still good
+        self.assertEquals(self.client.status()["temp"], 20.0)
+
+    def test_unavailable(self):
+        c = SousPiRPC.RPCClient(os.path.join(self.dir, "nosuch.sock"))
+        with self.assertRaises(RPCUnavailableError):
+            c.status()
+
+    def test_history(self):
+        for i in range(30):
+            self.sp.history.record(1000 + 10 * i, 20.0 + i, 56.5, 1.0, True)
+        h = self.client.history(start=1100, max_points=100)
+        self.assertEquals(h["tier"], "raw")
+        self.assertEquals(h["fields"], ["temp", "setpoint", "duty", "heater"])
+        self.assertEquals([p[0] for p in h["points"]], range(1100, 1300, 10))
+
+    def test_stats(self):
+        self.sp.instruments.record("get_temp", 0.003)
+        self.sp.instruments.count("heater_toggles", 2)
+        st = self.client.stats()
+        self.assertEquals(st["loop"]["stages"]["get_temp"]["count"], 1)
+        self.assertEquals(st["loop"]["counters"], {"heater_toggles": 2})
+
+    def test_subscribe(self):
+        sub = self.client.subscribe()
+        self.assertEquals(sub.next()["setpoint"], None)
+        self.sp.setpoint = 60.0
+        self.assertEquals(sub.next()["setpoint"], 60.0)
+        sub.close()
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(SousPiRPC_Test)
+    unittest.TextTestRunner(verbosity=2).run(suite)
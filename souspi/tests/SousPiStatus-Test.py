@@ -0,0 +1,127 @@
+#!/usr/bin/python
+
+import SousPiStatus
+import unittest
+import tempfile
+import shutil
+import json
+import os
+
+class FakePID(object):
+    Kp = 1.0
+    Ki = 2.0
+    Kd = 3.0
+
+class FakeSousPi(object):
+    """ Just the attributes SousPiStatus reads from a controller. """
+    def __init__(self):
+        self.last_temp = 20.0
+        self.setpoint = 56.5
+        self.PID_running = False
+        self.in_water = True
+        self.time_at_setpoint = None
+        self.temp_estimate = None
+        self.temp_rate = None
+        self.temp_variance = None
+        self.p = FakePID()
+
+class SousPiStatus_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "status")
+        self.now = 1000.0
+        self.sp = FakeSousPi()
+        self.status = SousPiStatus.SousPiStatus(spobj=self.sp, tofile=self.path,
+                                                min_interval=1.0, clock=lambda: self.now)
+        self.status.refresh()
+        self.v0 = self.status.version
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _written(self):
+        with open(self.path) as f:
+            return json.load(f)
+
+    def test_roundtrip(self):
+        reader = SousPiStatus.SousPiStatus(fromfile=self.path)
+        self.assertEquals(reader.setpoint, 56.5)
+        self.assertEquals(reader.version, self.v0)
+
+    def test_unchanged_is_not_written(self):
+        os.unlink(self.path)
+        self.now += 5
+        self.status.refresh()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEquals(self.status.version, self.v0)
+
+    def test_coalescing(self):
+        self.now += 0.1
+        self.sp.last_temp = 20.5
+        self.status.refresh()
+        self.sp.last_temp = 21.0
+        self.status.refresh()
+        self.assertEquals(self._written()["temp"], 20.0)
+        self.status.flush()
+        self.assertEquals(self._written()["version"], self.v0)
+        self.now += 1.0
+        self.status.flush()
+        self.assertEquals(self._written()["temp"], 21.0)
+        self.assertEquals(self._written()["version"], self.v0 + 1)
+
+    def test_forced_flush(self):
+        self.sp.PID_running = True
+        self.status.refresh()
+        self.status.flush(force=True)
+        self.assertEquals(self._written()["running"], True)
+
+    def test_reader_error(self):
+        reader = SousPiStatus.SousPiStatus(fromfile=self.path)
+        os.unlink(self.path)
+        reader.refresh()
+        self.assertTrue(reader.error)
+        self.assertIsNone(reader.temp)
+
+    def test_reader_only_parses_new_files(self):
+        reader = SousPiStatus.SousPiStatus(fromfile=self.path)
+        parses = []
+        real_from_JSON = reader.from_JSON
+        def counting_from_JSON():
+            parses.append(1)
+            real_from_JSON()
+        reader.from_JSON = counting_from_JSON
+        reader.refresh()
+        reader.refresh()
+        self.assertEquals(parses, [])
+        self.now += 5
+        self.sp.last_temp = 30.0
+        self.status.refresh()
+        reader.refresh()
+        reader.refresh()
+        self.assertEquals(parses, [1])
+        self.assertEquals(reader.temp, 30.0)
+        self.assertEquals(reader.version, self.v0 + 1)
+
+    def test_version_survives_restart(self):
+        for i in range(5):
+            self.now += 5
+            self.sp.last_temp += 1
+            self.status.refresh()
+        last = self._written()["version"]
+        # a restarted controller, even with the clock set back
+        self.now -= 600
+        status = SousPiStatus.SousPiStatus(spobj=self.sp, tofile=self.path, clock=lambda: self.now)
+        status.write_status_file()
+        self.assertTrue(self._written()["version"] > last)
+        # after a reboot, with the status file gone
+        last = self._written()["version"]
+        os.unlink(self.path)
+        self.now += 1200
+        status = SousPiStatus.SousPiStatus(spobj=self.sp, tofile=self.path, clock=lambda: self.now)
+        status.write_status_file()
+        self.assertTrue(self._written()["version"] > last)
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(SousPiStatus_Test)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,58 @@
+#!/usr/bin/python
+
+import SousPiUI
+import unittest
+import tempfile
+import shutil
+import threading
+import json
+import time
+import os
+
+from souspi import atomic_file_write
+
+class SousPiWebUI_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cfg = os.path.join(self.dir, "souspi.cfg")
+        with open(self.cfg, "w") as f:
+            f.write("[general]\ncommand_dir: %s\nsetpoint_file: %s/spsetpoint\n"
+                    "[PID]\nat_temp_threshold: 0.5\n"
+                    "[internal]\nstart_file_name: start\nstop_file_name: stop\n"
+                    "status_file_name: status\ncommand_check_interval: 0.1\n"
+                    "control_socket_name:\n" % (self.dir, self.dir))
+        self._write_status(1, 50.0)
+        self.ui = SousPiUI.SousPiWebUI(self.cfg, poll_interval=0.01)
+
+    def tearDown(self):
+        self.ui.close()
+        shutil.rmtree(self.dir)
+
+    def _write_status(self, version, temp):
+        atomic_file_write(os.path.join(self.dir, "status"),
+                          json.dumps({"version": version, "temp": temp, "setpoint": 56.5,
+                                      "running": True, "in_water": True}))
+
+    def test_status_dict(self):
+        s = self.ui.status_dict()
+        self.assertEquals((s["version"], s["temp"]), (1, 50.0))
+
+    def test_wait_times_out_without_change(self):
+        self.assertIsNone(self.ui.wait_for_change(1, timeout=0.05))
+
+    def test_wait_wakes_on_change(self):
+        results = []
+        waiters = [threading.Thread(target=lambda: results.append(self.ui.wait_for_change(1, 5)))
+                   for i in range(3)]
+        for w in waiters:
+            w.start()
+        time.sleep(0.05)
+        self._write_status(2, 51.0)
+        for w in waiters:
+            w.join(5)
+        self.assertEquals([(r["version"], r["temp"]) for r in results], [(2, 51.0)] * 3)
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(SousPiWebUI_Test)
+    unittest.TextTestRunner(verbosity=2).run(suite)
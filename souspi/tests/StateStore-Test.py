@@ -0,0 +1,162 @@
+#!/usr/bin/python
+
+import StateStore
+import Simulation
+import unittest
+import tempfile
+import shutil
+import os
+
+from souspi import atomic_file_write
+
+class StateStore_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.hot = os.path.join(self.dir, "run")
+        self.durable = os.path.join(self.dir, "lib")
+        os.mkdir(self.hot)
+        os.mkdir(self.durable)
+        self.now = 1000.0
+        self.store = StateStore.StateStore(self.durable, interval=60, clock=lambda: self.now)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _hot(self, name, data=None):
+        path = os.path.join(self.hot, name)
+        if data is not None:
+            atomic_file_write(path, data)
+        return path
+
+    def _saved(self, name):
+        path = os.path.join(self.durable, name)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return f.read()
+
+    def test_checkpoint_cadence(self):
+        self.store.track(self._hot("at_setpoint", "1"))
+        self.assertEquals(self.store.checkpoint(), 1)
+        self.assertEquals(self._saved("at_setpoint"), "1")
+        # unchanged: nothing to write
+        self.now += 60
+        self.assertEquals(self.store.checkpoint(), 0)
+        # changed, but not due yet
+        self._hot("at_setpoint", "2")
+        self.now += 30
+        self.assertEquals(self.store.checkpoint(), 0)
+        self.assertEquals(self._saved("at_setpoint"), "1")
+        self.now += 30
+        self.assertEquals(self.store.checkpoint(), 1)
+        self.assertEquals(self._saved("at_setpoint"), "2")
+        self._hot("at_setpoint", "3")
+        self.assertEquals(self.store.checkpoint(force=True), 1)
+        self.assertEquals(self.store.writes, 3)
+
+    def test_urgent(self):
+        self.store.track(self._hot("at_setpoint", "1"))
+        self.store.track(self._hot("spsetpoint", "56.5"), urgent=True)
+        self.store.checkpoint()
+        self._hot("at_setpoint", "2")
+        self._hot("spsetpoint", "60")
+        self.now += 1
+        # nobody said so: it waits for the interval, like the rest
+        self.assertEquals(self.store.checkpoint(), 0)
+        self.store.changed(self._hot("spsetpoint"))
+        self.store.changed(self._hot("at_setpoint"))    # not urgent: no difference
+        self.assertEquals(self.store.checkpoint(), 1)
+        self.assertEquals((self._saved("spsetpoint"), self._saved("at_setpoint")), ("60", "1"))
+        self.assertEquals(self.store.checkpoint(), 0)
+
+    def test_no_polling(self):
+        self.store.track(self._hot("spsetpoint", "56.5"), urgent=True)
+        self.store.checkpoint()
+        looked = []
+        key = self.store._key
+        self.store._key = lambda path: looked.append(path) or key(path)
+        # between intervals, a checkpoint (every control tick) costs no syscalls
+        for i in range(10):
+            self.now += 1
+            self.assertEquals(self.store.checkpoint(), 0)
+        self.assertEquals(looked, [])
+
+    def test_save(self):
+        self.store.track(self._hot("journal", "a"))
+        self.store.checkpoint()
+        self._hot("journal", "ab")
+        self.now += 1
+        self.assertEquals(self.store.checkpoint(), 0)
+        self.assertTrue(self.store.save(self._hot("journal")))
+        self.assertEquals(self._saved("journal"), "ab")
+        # unchanged, or not tracked
+        self.assertFalse(self.store.save(self._hot("journal")))
+        self.assertFalse(self.store.save(self._hot("spsetpoint", "56.5")))
+
+    def test_missing_file(self):
+        self.store.track(self._hot("spsetpoint"), urgent=True)
+        self.assertEquals(self.store.checkpoint(), 0)
+        self.assertEquals(self._saved("spsetpoint"), None)
+
+    def test_restore(self):
+        self.store.track(self._hot("spsetpoint", "56.5"), urgent=True)
+        self.store.checkpoint()
+        os.unlink(self._hot("spsetpoint"))
+        store = StateStore.StateStore(self.durable, interval=60, clock=lambda: self.now)
+        self.assertTrue(store.track(self._hot("spsetpoint"), urgent=True))
+        with open(self._hot("spsetpoint")) as f:
+            self.assertEquals(f.read(), "56.5")
+        # it doesn't need saving again
+        self.assertEquals(store.checkpoint(), 0)
+        # an existing file is left alone
+        self._hot("spsetpoint", "60")
+        self.assertFalse(StateStore.StateStore(self.durable).track(self._hot("spsetpoint")))
+
+    def test_controller_restart(self):
+        config = {("general", "state_dir"): self.durable}
+        sim = Simulation.Simulation(setpoint=56.5, workdir=self.hot, config=config, initial=56.5)
+        try:
+            sim.run(120)
+            self.assertEquals(sim.sp.time_at_setpoint, 1)
+        finally:
+            sim.cleanup()
+        self.assertEquals(self._saved("spsetpoint"), "56.5")
+        # a reboot empties the RAM-backed command_dir
+        for name in ("spsetpoint", "at_setpoint"):
+            os.unlink(self._hot(name))
+        sim = Simulation.Simulation(workdir=self.hot, config=config, initial=56.5,
+                                    start_time=sim.now + 10)
+        try:
+            self.assertEquals(sim.sp.setpoint, 56.5)
+            sim.sp.start()
+            # still counting from before the reboot (120s, down for 10s, 1s more)
+            sim.run(1)
+            self.assertEquals(sim.sp.time_at_setpoint, 2)
+        finally:
+            sim.cleanup()
+
+    def test_stop_before_power_cut(self):
+        config = {("general", "state_dir"): self.durable}
+        sim = Simulation.Simulation(setpoint=56.5, workdir=self.hot, config=config, initial=50.0)
+        try:
+            sim.run(20)
+            sim.sp.stop()
+            # the power goes before the next checkpoint
+            saved = self._saved("journal")
+        finally:
+            sim.cleanup()
+        for name in os.listdir(self.hot):
+            os.unlink(self._hot(name))
+        with open(os.path.join(self.durable, "journal"), "w") as f:
+            f.write(saved)
+        sim = Simulation.Simulation(workdir=self.hot, config=config, initial=50.0,
+                                    start_time=sim.now + 30)
+        try:
+            self.assertFalse(sim.sp.PID_running)
+        finally:
+            sim.cleanup()
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(StateStore_Test)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,103 @@
+#!/usr/bin/python
+
+import TempChannel
+import Simulation
+import unittest
+import tempfile
+import shutil
+import os
+
+from souspi import TempChannelError, atomic_file_write
+
+class TempChannel_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "temptracker.chan")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_missing_channel(self):
+        with self.assertRaises(TempChannelError):
+            TempChannel.TempChannelReader(self.path)
+
+    def test_not_a_channel(self):
+        with open(self.path, "w") as f:
+            f.write("x" * TempChannel.RECORD_SIZE)
+        with self.assertRaises(TempChannelError):
+            TempChannel.TempChannelReader(self.path)
+
+    def test_unpublished(self):
+        w = TempChannel.TempChannelWriter(self.path)
+        r = TempChannel.TempChannelReader(self.path)
+        self.assertEquals(r.read()[2], 0)
+
+    def test_publish(self):
+        w = TempChannel.TempChannelWriter(self.path)
+        r = TempChannel.TempChannelReader(self.path)
+        w.publish(55.125, 1000.0)
+        (val, ts, seq) = r.read()
+        self.assertEquals(val, 55.125)
+        self.assertEquals(ts, 1000.0)
+        w.publish(55.25, 1001.0)
+        (val, ts, seq2) = r.read()
+        self.assertEquals(val, 55.25)
+        self.assertTrue(seq2 > seq)
+        self.assertEquals(seq2 % 2, 0)
+
+    def test_sequence_survives_writer_restart(self):
+        w = TempChannel.TempChannelWriter(self.path)
+        w.publish(20.0)
+        w.publish(21.0)
+        w.close()
+        r = TempChannel.TempChannelReader(self.path)
+        before = r.sequence
+        w = TempChannel.TempChannelWriter(self.path)
+        w.publish(22.0)
+        self.assertTrue(r.sequence > before)
+        self.assertEquals(r.read()[0], 22.0)
+
+    def _controller(self):
+        """ A simulated controller reading the channel, with 40.0 in its temperature file. """
+        sim = Simulation.Simulation(workdir=self.dir,
+                                    config={("general", "temperature_channel"): self.path})
+        sim.sp._temp_source = None
+        atomic_file_write(sim.sp.temperature_file, "40.0")
+        return sim
+
+    def test_controller_falls_back_on_bad_channel(self):
+        w = TempChannel.TempChannelWriter(self.path)
+        sim = self._controller()
+        try:
+            w.publish(50.0, sim.now)
+            self.assertEquals(sim.sp._get_temp(), 50.0)
+            # the writer died mid-update
+            TempChannel._seq.pack_into(w._map, TempChannel._SEQ_OFFSET, w._seq + 1)
+            self.assertEquals(sim.sp._get_temp(), 40.0)
+            # ...and came back
+            w = TempChannel.TempChannelWriter(self.path)
+            w.publish(51.0, sim.now)
+            self.assertEquals(sim.sp._get_temp(), 51.0)
+        finally:
+            sim.cleanup()
+
+    def test_controller_ignores_stale_channel(self):
+        w = TempChannel.TempChannelWriter(self.path)
+        sim = self._controller()
+        try:
+            w.publish(50.0, sim.now)
+            self.assertEquals(sim.sp._get_temp(), 50.0)
+            sim.clock.advance(4)
+            self.assertEquals(sim.sp._get_temp(), 50.0)
+            # temptrackd has stopped publishing
+            sim.clock.advance(2)
+            self.assertEquals(sim.sp._get_temp(), 40.0)
+            w.publish(52.0, sim.now)
+            self.assertEquals(sim.sp._get_temp(), 52.0)
+        finally:
+            sim.cleanup()
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TempChannel_Test)
+    unittest.TextTestRunner(verbosity=2).run(suite)
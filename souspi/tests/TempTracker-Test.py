@@ -3,6 +3,12 @@
 import TempTracker
 import unittest
 import random
+import math
+import time
+import json
+import os
+import shutil
+import tempfile
 from w1thermsensor import W1ThermSensor
 
 
@@ -33,7 +39,196 @@ class TempTracker_Test(unittest.TestCase):
     def test_commit(self):
         self.tt.directory = "/tmp"
         self.tt._commit_value(30)
+
+    def test_bad_resolution(self):
+        with self.assertRaises(TempTracker.TempTrackerBadResolution):
+            self.tt.resolution = 14
+
+    def test_sample_stats(self):
+        self.tt._record_sample(100.0, 100.75, 20.0)
+        self.tt._record_sample(101.0, 101.75, 20.0)
+        self.tt._record_sample(102.0, 102.75, 20.0)
+        stats = self.tt.sample_stats
+        self.assertEquals(stats["samples"], 3)
+        self.assertAlmostEquals(stats["sample_rate"], 1.0)
+        self.assertAlmostEquals(stats["last_conversion_time"], 0.75)
+
+class AdaptiveResolution_Test(unittest.TestCase):
+
+    def _feed(self, a, samples):
+        return [a.update(t, v) for (t, v) in samples]
+
+    def test_adapts_with_hysteresis(self):
+        a = TempTracker.AdaptiveResolution(fast_rate=0.05, slow_rate=0.01, span=2, hold=10)
+        self.assertEquals(self._feed(a, [(0, 20.0), (1, 20.0625)]), [12, 12])
+        self.assertEquals(a.update(2, 20.25), 9)      # heating fast
+        self.assertEquals(a.update(5, 20.5), 9)       # coarse readings don't count
+        self.assertEquals(a.update(12, 21.0), 12)     # time for another look
+        # slower, but not slow enough
+        self.assertEquals(self._feed(a, [(13, 21.0), (14, 21.0625), (15, 21.125)]), [12, 12, 9])
+        self.assertEquals(a.update(25, 21.5), 12)
+        # settled (within a step)
+        self.assertEquals(self._feed(a, [(26, 21.5), (27, 21.5), (28, 21.5625)]), [12, 12, 12])
+        self.assertEquals(a.update(30, 21.625), 12)   # 0.03/s is too slow to drop again
+
+    def test_ramp(self):
+        # a steady heat-up then a settled bath, read at each resolution's own speed
+        a = TempTracker.AdaptiveResolution()
+        (t, res, switches, coarse, samples) = (0.0, a.resolution, 0, 0, 0)
+        while t < 900:
+            t += TempTracker.CONVERSION_TIME[res]
+            temp = 20.0 + 0.08 * min(t, 600)
+            step = TempTracker.RESOLUTION_STEP[res]
+            new = a.update(t, math.floor(temp / step) * step)
+            samples += 1
+            if t < 600 and res == a.fast_resolution:
+                coarse += 1
+            if new != res:
+                switches += 1
+                if t > 680:
+                    self.fail("switched to %d bits at %ds, after the bath settled" % (new, t))
+            res = new
+        self.assertTrue(switches <= 2 * 600 / (a.hold + a.span) + 2)
+        self.assertTrue(coarse > 0.8 * samples)
+        self.assertEquals(res, a.slow_resolution)
+
+    def test_bad_rates(self):
+        with self.assertRaises(ValueError):
+            TempTracker.AdaptiveResolution(fast_rate=0.01, slow_rate=0.05)
         
+class FakeProbe(W1ThermSensor):
+    """ Stands in for a DS18B20: probes maps id -> temperature (or the exception to raise). """
+
+    probes = {}
+    delay = 0.2
+    slave_prefix = "28-"
+
+    def __init__(self, sensor_type=None, sensor_id=None):
+        self.type = sensor_type
+        self.id = sensor_id
+        self.reads = 0
+
+    @classmethod
+    def get_available_sensors(cls, types=None):
+        return [cls(cls.THERM_SENSOR_DS18B20, i) for i in sorted(cls.probes)]
+
+    def get_temperature(self, unit=W1ThermSensor.DEGREES_C):
+        time.sleep(self.delay)
+        self.reads += 1
+        val = self.probes[self.id]
+        if isinstance(val, Exception):
+            raise val
+        return self.UNIT_FACTORS[unit](val)
+
+class MultiTempTracker_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.real_sensor = TempTracker.W1ThermSensor
+        TempTracker.W1ThermSensor = FakeProbe
+        FakeProbe.probes = {"0000aaaa": 56.5, "0000bbbb": 56.25, "0000cccc": 55.0,
+                            "0000dddd": 57.0}
+        self.trackers = []
+
+    def tearDown(self):
+        for t in self.trackers:
+            t.close()
+        TempTracker.W1ThermSensor = self.real_sensor
+        shutil.rmtree(self.dir)
+
+    def _tracker(self, cls=TempTracker.MultiTempTracker, **kwargs):
+        t = cls(self.dir, **kwargs)
+        self.trackers.append(t)
+        return t
+
+    def _read(self, name):
+        with open(os.path.join(self.dir, name)) as f:
+            return f.read()
+
+    def test_parallel_sweep(self):
+        t = self._tracker()
+        started = time.time()
+        self.assertEquals(t.sweep(), FakeProbe.probes)
+        # all four at once, not one after the other
+        self.assertTrue(time.time() - started < 2 * FakeProbe.delay)
+        self.assertTrue(t.last_sweep_time < 2 * FakeProbe.delay)
+        self.assertEquals([x.reads for x in t.sensors], [1, 1, 1, 1])
+
+    def test_commit(self):
+        t = self._tracker()
+        FakeProbe.probes["0000cccc"] = IOError("CRC check failed")
+        t._commit_values(t.sweep())
+        self.assertEquals(json.loads(self._read("probes.json")),
+                          {"0000aaaa": 56.5, "0000bbbb": 56.25, "0000cccc": None,
+                           "0000dddd": 57.0})
+        self.assertEquals(self._read("temptracker.dat"), "56.5")
+        # unchanged values aren't rewritten
+        os.unlink(os.path.join(self.dir, "probes.json"))
+        os.unlink(os.path.join(self.dir, "temptracker.dat"))
+        t._commit_values(t.sweep())
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "probes.json")))
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "temptracker.dat")))
+        FakeProbe.probes["0000dddd"] = 57.25
+        t._commit_values(t.sweep())
+        self.assertEquals(json.loads(self._read("probes.json"))["0000dddd"], 57.25)
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "temptracker.dat")))
+
+    def test_primary(self):
+        # the first probe found, unless we say otherwise
+        self.assertEquals(self._tracker().primary, "0000aaaa")
+        t = self._tracker(primary="0000bbbb", fname="bath.dat")
+        t._commit_values(t.sweep())
+        self.assertEquals(self._read("bath.dat"), "56.25")
+        with self.assertRaises(TempTracker.TempTrackerError):
+            self._tracker(primary="0000eeee")
+        # an unreadable primary leaves the last good value in place
+        FakeProbe.probes["0000bbbb"] = IOError("no such device")
+        t._commit_values(t.sweep())
+        self.assertEquals(self._read("bath.dat"), "56.25")
+        self.assertEquals(json.loads(self._read("probes.json"))["0000bbbb"], None)
+
+    def test_sensor_ids(self):
+        t = self._tracker(sensor_ids=["0000dddd", "0000aaaa"])
+        self.assertEquals(t.primary, "0000dddd")
+        self.assertEquals(t.sweep(), {"0000dddd": 57.0, "0000aaaa": 56.5})
+
+    def test_no_probes(self):
+        FakeProbe.probes = {}
+        with self.assertRaises(TempTracker.TempTrackerError):
+            self._tracker()
+
+    def test_bulk(self):
+        bulk_read = os.path.join(self.dir, "therm_bulk_read")
+        open(bulk_read, "w").close()
+        for (i, millidegrees) in (("0000aaaa", "56500"), ("0000bbbb", "56250"),
+                                  ("0000cccc", "garbage"), ("0000dddd", "57000")):
+            os.mkdir(os.path.join(self.dir, "28-" + i))
+            with open(os.path.join(self.dir, "28-" + i, "temperature"), "w") as f:
+                f.write(millidegrees + "\n")
+        cls = type("BulkTracker", (TempTracker.MultiTempTracker,),
+                   {"bulk_read_path": bulk_read, "devices_path": self.dir})
+        t = self._tracker(cls, bulk=True)
+        self.assertTrue(t.bulk)
+        self.assertEquals(t.sweep(), {"0000aaaa": 56.5, "0000bbbb": 56.25, "0000cccc": None,
+                                      "0000dddd": 57.0})
+        with open(bulk_read) as f:
+            self.assertEquals(f.read(), "trigger\n")
+        # the probes themselves weren't asked for a conversion each
+        self.assertEquals([x.reads for x in t.sensors], [0, 0, 0, 0])
+
+    def test_no_bulk_support(self):
+        cls = type("BulkTracker", (TempTracker.MultiTempTracker,),
+                   {"bulk_read_path": os.path.join(self.dir, "nonexistent")})
+        t = self._tracker(cls, bulk=True)
+        self.assertFalse(t.bulk)
+        self.assertEquals(t.sweep()["0000aaaa"], 56.5)
+
+    def test_close(self):
+        t = self._tracker()
+        t.sweep()
+        t.close()
+        self.trackers.remove(t)
+        self.assertFalse([w for w in t._pool._pool if w.is_alive()])
+
 if __name__ == '__main__':
-    suite = unittest.TestLoader().loadTestsFromTestCase(TempTracker_Test)
-    unittest.TextTestRunner(verbosity=2).run(suite)
+    unittest.main()
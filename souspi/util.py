@@ -1,17 +1,22 @@
 import os
 import tempfile
 
-def atomic_file_write(file_to_write, data, uid=None, gid=None):
+def atomic_file_write(file_to_write, data, uid=None, gid=None, fsync=False, mode=None):
     """ Atomically (via a tempfile) write data to file at specified path.
     
         If data is None, this creates an empty file.
         If uid/gid are specified, chown accordingly. 
+        The file ends up mode 0600 (as mkstemp makes it) unless mode is specified.
+        With fsync, the data and the rename are on disk before we return (otherwise a
+        crash soon after can leave the old contents, or an empty file).
         Raises OSError if file rename fails.
     """
     (tmp_fh, tmp_name) = tempfile.mkstemp(dir=os.path.dirname(os.path.realpath(file_to_write)),
                                           prefix=os.path.basename(os.path.realpath(file_to_write)))
     if data is not None:
         os.write(tmp_fh,bytes(data))
+    if fsync:
+        os.fsync(tmp_fh)
     os.close(tmp_fh)
     
     if (uid is not None) or (gid is not None):
@@ -24,6 +29,8 @@ def atomic_file_write(file_to_write, data, uid=None, gid=None):
         else:
             new_gid = gid
         os.chown(tmp_name, new_uid, new_gid)
+    if mode is not None:
+        os.chmod(tmp_name, mode)
     
     try:
         os.rename(tmp_name, os.path.realpath(file_to_write))
@@ -31,3 +38,13 @@ def atomic_file_write(file_to_write, data, uid=None, gid=None):
         os.unlink(tmp_name)
         msg = "Failed to update %s: %s" % (os.path.realpath(file_to_write), e.strerror)
         raise OSError(e)
+    if fsync:
+        fsync_dir(os.path.dirname(os.path.realpath(file_to_write)))
+
+def fsync_dir(path):
+    """ Make renames into (and out of) directory path durable. """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)